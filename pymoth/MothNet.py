@@ -93,6 +93,26 @@ class MothNet:
 				RESULTS_FILENAME (str): will get the run number appended to it.
 				DATA_FOLDER (str): relative path, starting from user's home directory.
 				DATA_FILENAME (str): filename for MNIST data.
+				DTYPE (str): floating point precision of the simulation, 'float64' \
+				(default) or 'float32' (about half the memory traffic).
+				SEED (int): seed of the moth's random number generator (digit \
+				draws, connection matrices and neural noise). None (default) draws \
+				fresh entropy.
+				TIME_STEP (float): simulation time step in seconds (default 0.02).
+				INTEGRATOR (str): 'euler' (default), 'heun' or 'exponential'. \
+				The latter two stay accurate at larger time steps.
+				COARSE_STEP (float): time step in seconds away from stimuli, \
+				octopamine and learning. None (default) uses TIME_STEP throughout.
+				ADAPTIVE_CALIBRATION (bool): end each stage of the noise \
+				calibration once the spontaneous FRs have converged, and start \
+				the experiment earlier (see :class:`Calibration`). False \
+				(default) uses the fixed calibration windows. Not with COARSE_STEP.
+				PROTOCOL (class): timeline of the experiment (see :class:`Protocol`), \
+				eg Protocol.compact(). None (default) uses the original timing.
+				PROGRESS (function): progress reports of the simulation (see \
+				:func:`make_progress`): None (default) for a progress line on \
+				the terminal, False for none, or a function that is sent the \
+				updates (eg by a job runner).
 
 		>>> mothra = pymoth.MothNet()
 
@@ -114,6 +134,18 @@ class MothNet:
 		self.RESULTS_FILENAME = settings.get('results_filename', 'results') # string
 		self.DATA_FOLDER = settings.get('data_folder', '/tmp') # string
 		self.DATA_FILENAME = settings.get('data_filename', 'MNIST_all') # string
+		self.DTYPE = _np.dtype(settings.get('dtype', 'float64')).type # simulation precision
+		self.SEED = settings.get('seed', None) # int, or None for fresh entropy
+		self.TIME_STEP = settings.get('time_step', 2*0.01) # seconds
+		self.INTEGRATOR = settings.get('integrator', 'euler') # SDE integration scheme
+		self.COARSE_STEP = settings.get('coarse_step', None) # seconds, in quiescent periods
+		self.ADAPTIVE_CALIBRATION = settings.get('adaptive_calibration', False) # bool
+		self.PROTOCOL = settings.get('protocol', None) # experiment timeline
+		self.PROGRESS = settings.get('progress', None) # progress reports
+
+		# explicit random number generator (no global numpy random state)
+		from .modules.rng import make_rng
+		self._rng = make_rng(self.SEED)
 
 		# Test parameters for compatibility
 		if self.SHOW_ACC_PLOTS or self.SHOW_TIME_PLOTS:
@@ -164,7 +196,7 @@ class MothNet:
 
 		# make a vector of the classes of the training samples, randomly mixed:
 		self._tr_classes = _np.repeat( self._class_labels, self.TR_PER_CLASS )
-		self._tr_classes = _np.random.permutation( self._tr_classes )
+		self._tr_classes = self._rng.permutation( self._tr_classes )
 		# repeat these inputs if taking multiple sniffs of each training sample:
 		self._tr_classes = _np.tile( self._tr_classes, [1, self.NUM_SNIFFS] )[0]
 
@@ -196,7 +228,8 @@ class MothNet:
 			self._downsample_method, self._inds_to_ave, self._pixel_sum,
 			self._inds_to_calc_RF, self._num_features, self.SCREEN_SIZE,
 			self.RESULTS_FOLDER, self._show_thumbnails,
-			data_dir = self.DATA_FOLDER, data_fname = self.DATA_FILENAME
+			data_dir = self.DATA_FOLDER, data_fname = self.DATA_FILENAME,
+			dtype = self.DTYPE
 			)
 
 		_, self._num_per_class, self._class_num = self._feat_array.shape
@@ -211,14 +244,14 @@ class MothNet:
 			## 1. Baseline (pre-train) images
 			# choose some images from the baselineIndPool
 			_range_top_end = max(self._ind_pool_baseline) - min(self._ind_pool_baseline) + 1
-			_r_sample = _np.random.choice(_range_top_end, self._val_per_class) # select random digits
+			_r_sample = self._rng.choice(_range_top_end, self._val_per_class) # select random digits
 			_these_inds = min(self._ind_pool_baseline) + _r_sample
 			digit_queues[:,:self._val_per_class,i] = self._feat_array[:,_these_inds,i]
 
 			## 2. Training images
 			# choose some images from the trainingIndPool
 			_range_top_end = max(self._ind_pool_train) - min(self._ind_pool_train) + 1
-			_r_sample = _np.random.choice(_range_top_end, self.TR_PER_CLASS) # select random digits
+			_r_sample = self._rng.choice(_range_top_end, self.TR_PER_CLASS) # select random digits
 			_these_inds = min(self._ind_pool_train) + _r_sample
 			# repeat these inputs if taking multiple sniffs of each training sample
 			_these_inds = _np.tile(_these_inds, self.NUM_SNIFFS)
@@ -228,7 +261,7 @@ class MothNet:
 			## 3. Post-training (val) images
 			# choose some images from the postTrainIndPool
 			_range_top_end = max(self._ind_pool_post) - min(self._ind_pool_post) + 1
-			_r_sample = _np.random.choice(_range_top_end, self._val_per_class) # select random digits
+			_r_sample = self._rng.choice(_range_top_end, self._val_per_class) # select random digits
 			_these_inds = min(self._ind_pool_post) + _r_sample
 			digit_queues[:,(self._val_per_class+self.TR_PER_CLASS*self.NUM_SNIFFS): \
 				(self._val_per_class+self.TR_PER_CLASS*self.NUM_SNIFFS+self._val_per_class),
@@ -311,7 +344,8 @@ class MothNet:
 		from .modules.params import ModelParams
 
 		# instantiate template params
-		self.model_params = ModelParams( len(self._active_pixel_inds), self.GOAL )
+		self.model_params = ModelParams( len(self._active_pixel_inds), self.GOAL, rng=self._rng )
+		self.model_params.dtype = self.DTYPE
 
 		# populate the moth's connection matrices using the model_params
 		self.model_params.create_connection_matrix()
@@ -337,9 +371,10 @@ class MothNet:
 		"""
 
 		from .modules.params import ExpParams
-		self.experiment_params =  ExpParams( self._tr_classes, self._class_labels, self._val_per_class )
+		self.experiment_params =  ExpParams( self._tr_classes, self._class_labels, self._val_per_class,
+			rng=self._rng, protocol=self.PROTOCOL )
 
-	def simulate(self, feature_array):
+	def simulate(self, feature_array, backend='numpy', on_window=None):
 		"""
 
 		Run the SDE time-stepped evolution of neural firing rates.
@@ -353,6 +388,11 @@ class MothNet:
 		Args:
 			feature_array (numpy array): array of stimuli [num_features X \
 			num_stims_per_class X num_classes]
+			backend (str): [optional] 'numpy' (reference) or 'numba' (compiled). \
+			Falls back to 'numpy' if numba is not installed.
+			on_window (function): [optional] called with the EN response \
+			window of each stimulus (class, phase, EN trace) as soon as it has \
+			been simulated, see :func:`sde_stream`.
 
 		Returns
 		-------
@@ -366,9 +406,58 @@ class MothNet:
 
 		print('\nStarting sim for goal = {}, tr_per_class = {}, numSniffsPerSample = {}'.format(
 			self.GOAL, self.TR_PER_CLASS, self.NUM_SNIFFS))
+		self.experiment_params.report(self.TIME_STEP)
+
+		calibration = None
+		if self.ADAPTIVE_CALIBRATION:
+			from .modules.calibrate import Calibration
+			calibration = Calibration()
 
 		# run this experiment as sde time-step evolution:
-		return sde_wrap(self.model_params, self.experiment_params, feature_array )
+		sim_results = sde_wrap(self.model_params, self.experiment_params, feature_array, backend,
+			time_step=self.TIME_STEP, integrator=self.INTEGRATOR, coarse_step=self.COARSE_STEP,
+			on_window=on_window, calibration=calibration, progress=self.PROGRESS )
+		if calibration is not None:
+			# the experiment was shortened to match the calibration
+			self.experiment_params = sim_results['exp_params']
+		return sim_results
+
+	def simulate_ensemble(self, feature_array, model_params_list):
+		"""
+
+		Run the SDE time-stepped evolution for several moths at once, eg for \
+		robustness sweeps over seeds or GOAL values. All moths share the current \
+		experiment parameters and stimuli. The ensemble is integrated with fixed \
+		Euler steps of TIME_STEP: a ValueError is raised for any other \
+		INTEGRATOR, a COARSE_STEP or ADAPTIVE_CALIBRATION.
+
+		Args:
+			feature_array (numpy array): array of stimuli [num_features X \
+			num_stims_per_class X num_classes]
+			model_params_list (list): :class:`ModelParams` objects (with connection \
+			matrices), one per moth.
+
+		Returns
+		-------
+			sim_results (list)
+				one dict of EN timecourses and final P2K and K2E connection matrices \
+				per moth, each in the format expected by :func:`collect_stats`.
+
+		>>> sim_results = mothra.simulate_ensemble(feature_array, model_params_list)
+
+		"""
+		from .modules.ensemble import sde_wrap_ensemble
+
+		if self.INTEGRATOR != 'euler' or self.COARSE_STEP or self.ADAPTIVE_CALIBRATION:
+			raise ValueError('simulate_ensemble only supports fixed step euler integration, ' +
+				'got integrator = {}, coarse_step = {}, adaptive_calibration = {}'.format(
+				self.INTEGRATOR, self.COARSE_STEP, self.ADAPTIVE_CALIBRATION))
+
+		print('\nStarting ensemble sim for {} moths, tr_per_class = {}, numSniffsPerSample = {}'.format(
+			len(model_params_list), self.TR_PER_CLASS, self.NUM_SNIFFS))
+
+		return sde_wrap_ensemble(model_params_list, self.experiment_params, feature_array,
+			time_step=self.TIME_STEP, progress=self.PROGRESS)
 
 	def score_moth_on_MNIST(self, EN_resp_trained):
 		"""
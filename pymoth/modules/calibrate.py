@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: calibrate
+   :platform: Unix
+   :synopsis: Adaptive noise calibration, ending each stage once it has converged.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import copy as _copy
+import numpy as _np
+from ..modules.kernel import StepKernel
+from ..modules.rng import NoiseBlock
+from ..modules.compiler import compile_model
+from ..modules.timeline import time_vector
+from ..modules.checkpoint import rng_state_to_array
+from ..modules.sde import initial_conditions
+
+class RunningStats:
+    """
+
+    Running (Welford) mean and variance of a vector of FRs, one sample per \
+    time step, and their lag-1 autocorrelation (FRs are correlated over \
+    about 1/tau sec, ie many time steps).
+
+    """
+    def __init__(self, n):
+        self.count = 0
+        self.mean = _np.zeros(n)
+        self.m2 = _np.zeros(n) # sum of squared deviations from the mean
+        self.lag = _np.zeros(n) # sum of x[t]*x[t-1]
+        self.first = None # first and last samples, to merge consecutive blocks
+        self.prev = None
+
+    def add(self, x):
+        """
+        Add a sample x.
+        """
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(x - self.mean)
+        if self.prev is not None:
+            self.lag += x*self.prev
+        self.prev = _np.array(x, dtype=float)
+        if self.first is None:
+            self.first = self.prev
+
+    def merge(self, other):
+        """
+        Add all samples of other (Chan et al's parallel update), which come \
+        right after those of self, so that the lag-1 products carry over.
+        """
+        count = self.count + other.count
+        if other.count:
+            delta = other.mean - self.mean
+            self.mean += delta*other.count/count
+            self.m2 += other.m2 + delta**2*self.count*other.count/count
+            self.lag += other.lag
+            if self.prev is not None:
+                self.lag += self.prev*other.first
+            if self.first is None:
+                self.first = other.first
+            self.prev = other.prev
+        self.count = count
+
+    def var(self):
+        """
+        Population variance (as numpy's std, ddof=0).
+        """
+        return self.m2/max(self.count, 1)
+
+    def sem(self):
+        """
+        Standard error of the mean, from the effective number of independent \
+        samples n*(1-r)/(1+r), with r the lag-1 autocorrelation.
+        """
+        var = self.var()
+        cov = self.lag/max(self.count-1, 1) - self.mean**2
+        r = _np.clip(_np.divide(cov, var, out=_np.zeros_like(var), where=var > 0), 0, 0.99)
+        return _np.sqrt(var/(self.count*(1-r)/(1+r)))
+
+class Calibration:
+    """
+
+    Adaptive version of the three-stage noise calibration of \
+    :func:`sde_evo_mnist`: instead of the fixed ExpParams windows (-25 to -15, \
+    -10 to -5 and 0 to 28 sec), each stage ends as soon as the spontaneous FRs \
+    have converged, and the rest of the experiment is moved earlier to match.
+
+    Each stage first lets the FRs settle for 'settle' seconds (eg after the \
+    initial conditions, or after the noise changes), as the gaps between the \
+    fixed windows do. The FRs are then averaged over blocks of 'block' seconds. A stage has \
+    converged when the means of its last two blocks agree for every neuron, \
+    up to rtol (relative) plus z standard errors (from the variances and \
+    autocorrelations within the blocks). From there on, the FRs are averaged \
+    for at least stats_time seconds, and the stage ends. As with the fixed \
+    windows, the means set the noise of the next stage, and the last stage \
+    gives ssMeanSpontP and ssStdSpontP. No stage ends later than in the \
+    fixed schedule.
+
+    >>> sim_results = sde_wrap(model_params, exp_params, feature_array, calibration=Calibration())
+    >>> sim_results['calibration']['settle_times']
+
+    """
+    def __init__(self, settle=1.0, block=1.0, rtol=0.02, z=3.0, stats_time=5.0):
+        """
+
+        Args:
+            settle (float): [optional] seconds at the start of each stage that \
+            are not averaged.
+            block (float): [optional] seconds per block of FRs.
+            rtol (float): [optional] relative tolerance between block means.
+            z (float): [optional] standard errors allowed between block means.
+            stats_time (float): [optional] minimum seconds over which the \
+            spontaneous FRs are averaged in each stage.
+
+        """
+        self.settle = settle
+        self.block = block
+        self.rtol = rtol
+        self.z = z
+        self.stats_time = stats_time
+
+    def converged(self, a, b):
+        """
+        Whether the means of two consecutive blocks (:class:`RunningStats`) agree.
+        """
+        se = _np.sqrt(a.sem()**2 + b.sem()**2)
+        return bool(_np.all( _np.abs(b.mean - a.mean) <= self.rtol*_np.abs(a.mean) + self.z*se ))
+
+    def run(self, model_params, exp_params, rng, time_step=2*0.01, integrator='euler',
+        prune=False):
+        """
+
+        Runs the spontaneous start of the experiment (time stepped as \
+        :func:`sde_evo_mnist`) until the calibration has converged.
+
+        Args:
+            model_params (class): object with connection matrices, etc.
+            exp_params (class): object with timing info about experiment.
+            rng (Generator): generator of the neural noise.
+            time_step (float): [optional] simulation time step (seconds).
+            integrator (str): [optional] as in :func:`sde_evo_mnist`.
+            prune (bool): [optional] as in :func:`sde_evo_mnist`.
+
+        Returns
+        -------
+            exp_params (class)
+                copy of the experiment with the calibration windows found, and \
+                all events moved earlier (see :func:`shift_schedule`)
+            state (dict)
+                the state at the end of the calibration, to resume the \
+                simulation of that experiment from (see :func:`sde_wrap`)
+            report (dict)
+                stage_ends (the time each stage ended), settle_times (the \
+                duration of each stage), windows (the (start, stop) the FRs \
+                were averaged over in each stage) and shift (seconds saved)
+
+        """
+        mP, exP = model_params, exp_params
+        time = time_vector(exP, time_step)
+        dt = round(time[1] - time[0], 10)
+        block_steps = max(int(round(self.block/dt)), 2)
+        # the fixed schedule ends the stages at these times
+        stops = (exP.stopPreNoiseSpontMean1, exP.stopSpontMean2, exP.stopSpontMean3)
+
+        plan = compile_model(mP) if prune else None
+        kernel = StepKernel(mP, dt, initial_conditions(mP), integrator, plan)
+        pop_sizes = kernel.sizes[:5]
+        noisy = plan.noisy if plan is not None else (True,)*5
+        noise = NoiseBlock(rng, [ n for n, z in zip(pop_sizes, noisy) if z ], dtype=mP.dtype)
+        def next_noise():
+            draws = iter(noise.next())
+            return [ next(draws) if z else None for z in noisy ]
+
+        n_al_mb = kernel.n_al_mb
+        E = _np.zeros((mP.nE, len(time)), dtype=mP.dtype)
+        maxSpontP2KtimesPval = 10 # placeholder until stage 3
+        stage, ends, windows = 0, [], []
+        blocks = [ RunningStats(n_al_mb) ]
+        window = None # the stats window, once the stage has converged
+        window_start = None
+        stage_start = time[0]
+        for n, t in enumerate(time):
+            old = kernel.old
+            E[:, n] = old.E
+            y = old.y[:n_al_mb]
+            if window is not None:
+                window.add(y)
+            elif t >= stage_start + self.settle:
+                blocks[-1].add(y)
+            if window is None and blocks[-1].count == block_steps:
+                if len(blocks) == 2 and self.converged(*blocks):
+                    window = RunningStats(n_al_mb)
+                    window.merge(blocks[0])
+                    window.merge(blocks[1])
+                    window_start = t - (2*block_steps - 1)*dt
+                blocks = blocks[-1:] + [ RunningStats(n_al_mb) ]
+
+            done = window is not None and window.count*dt >= self.stats_time
+            if done or t > stops[stage]:
+                if window is None:
+                    # not converged by the end of the fixed window: use the
+                    # last blocks
+                    window = RunningStats(n_al_mb)
+                    for b in blocks:
+                        window.merge(b)
+                    window_start = t - (max(window.count, 1) - 1)*dt
+                means = _np.split(window.mean, _np.cumsum(pop_sizes)[:-1])
+                ends.append(t)
+                windows.append((window_start - dt/2, t + dt/2))
+                if stage < 2:
+                    kernel.set_noise([ m.astype(mP.dtype) for m in means ])
+                else:
+                    ssMeanSpontP = means[0].astype(mP.dtype) # 'ss' means steady state
+                    ssStdSpontP = _np.sqrt(window.var()[:pop_sizes[0]]).astype(mP.dtype)
+                    temp = _np.sort(mP.P2K.dot(ssMeanSpontP))
+                    maxSpontP2KtimesPval = temp[:-1].max() # ignore the top outlier K input
+                    break
+                stage += 1
+                stage_start = t
+                blocks = [ RunningStats(n_al_mb) ]
+                window = None
+
+            kernel.step(next_noise(), False, maxSpontP2KtimesPval)
+            kernel.swap()
+        else:
+            raise ValueError('the simulation ends before the noise calibration')
+
+        # resume there, in the shortened experiment
+        shift = max(_np.floor(exP.stopSpontMean3 - t), 0)
+        shifted = shift_schedule(exP, shift, windows)
+        state = { 'n' : n, 'dt' : dt, 'sim_start' : exP.sim_start,
+            'steps' : _np.arange(n+1), 'y_old' : kernel.old.y.copy(),
+            'y_new' : kernel.new.y.copy(), 'meanCalcDone' : [True]*3,
+            'ssMeanSpontP' : ssMeanSpontP, 'ssStdSpontP' : ssStdSpontP,
+            'maxSpontP2KtimesPval' : maxSpontP2KtimesPval,
+            'E' : E[:, :n+1], 'E_first' : 0 }
+        for name, mean in zip(('P', 'PI', 'L', 'R', 'K'), kernel.mean_spont):
+            state['mean_spont_' + name] = mean.copy()
+        draws = noise.state()
+        state['noise_rng'] = rng_state_to_array(draws['rng'])
+        state['noise_pos'] = draws['pos']
+
+        report = { 'stage_ends' : ends, 'windows' : windows,
+            'settle_times' : list(_np.diff([exP.sim_start] + ends)), 'shift' : shift }
+        print('noise calibration converged at {} sec (stages end at {}): {} sec saved'.format(
+            round(t, 2), ', '.join(str(round(e, 2)) for e in ends), shift))
+        return shifted, state, report
+
+def shift_schedule( exp_params, shift, windows=None ):
+    """
+
+    Copy of an experiment with all stimulus, octopamine and Hebbian events \
+    (and the time points derived from them) 'shift' seconds earlier, eg \
+    after a shorter noise calibration.
+
+    Args:
+        exp_params (class): object with timing info about experiment.
+        shift (float): seconds.
+        windows (list): [optional] new (start, stop) of the three \
+        calibration windows. The pre-training spontaneous window is the last one.
+
+    Returns
+    -------
+        exp_params (class)
+            shifted copy (sharing the rng)
+
+    >>> shifted = shift_schedule( exp_params, 20 )
+
+    """
+    shifted = _copy.copy(exp_params)
+    for name in ('baselineTimes', 'trainTimes', 'valTimes', 'stimStarts', 'octoStart',
+        'endOfBaseline', 'endOfTrain', 'endOfVal', 'startTrain', 'endTrain',
+        'preHebPollTime', 'postHebPollTime', 'postHebSpontStart', 'postHebSpontStop',
+        'sim_stop'):
+        setattr(shifted, name, getattr(exp_params, name) - shift)
+    shifted.hebStarts = [ t - shift for t in exp_params.hebStarts ]
+    if windows is not None:
+        (shifted.startPreNoiseSpontMean1, shifted.stopPreNoiseSpontMean1), \
+            (shifted.startSpontMean2, shifted.stopSpontMean2), \
+            (shifted.startSpontMean3, shifted.stopSpontMean3) = windows
+        shifted.preHebSpontStart = shifted.startSpontMean3
+        shifted.preHebSpontStop = shifted.stopSpontMean3
+    return shifted
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
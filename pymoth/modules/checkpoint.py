@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: checkpoint
+   :platform: Unix
+   :synopsis: Checkpoint and resume long simulations, and cache calibrated moths.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import os as _os
+import json as _json
+import hashlib as _hashlib
+import numpy as _np
+
+def _encode( obj ):
+    """
+    JSON encoder for bit generator states (which may hold numpy arrays).
+    """
+    if isinstance(obj, _np.ndarray):
+        return {'__ndarray__' : obj.tolist(), 'dtype' : str(obj.dtype)}
+    if isinstance(obj, _np.integer):
+        return int(obj)
+    raise TypeError('cannot checkpoint {!r}'.format(obj))
+
+def _decode( obj ):
+    if '__ndarray__' in obj:
+        return _np.array(obj['__ndarray__'], dtype=obj['dtype'])
+    return obj
+
+def rng_state_to_array( state ):
+    """
+    A bit generator state (dict) as a 0-d string array, to store in a .npz.
+    """
+    return _np.array(_json.dumps(state, default=_encode))
+
+def rng_state_from_array( array ):
+    """
+    Inverse of :func:`rng_state_to_array`.
+    """
+    return _json.loads(str(array), object_hook=_decode)
+
+def save_checkpoint( path, state ):
+    """
+    Write a checkpoint as a compressed .npz. The file is written next to path \
+    and then renamed, so an interrupted write never leaves a truncated \
+    checkpoint behind.
+
+    Args:
+        path (str): checkpoint file name.
+        state (dict): arrays (or scalars) to save.
+
+    >>> save_checkpoint( 'run.npz', {'n' : 1000, 'y' : kernel.old.y} )
+
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        _np.savez_compressed(f, **state)
+    _os.replace(tmp, path)
+
+def load_checkpoint( path ):
+    """
+    Read a checkpoint written by :func:`save_checkpoint`.
+
+    Args:
+        path (str): checkpoint file name.
+
+    Returns
+    -------
+        state (dict)
+            the saved arrays (0-d arrays for scalars)
+
+    """
+    with _np.load(path, allow_pickle=False) as data:
+        return { key : data[key] for key in data.files }
+
+def fingerprint( *items ):
+    """
+    Hash of arrays, scalars, strings and (nested) lists, tuples and dicts.
+
+    Returns
+    -------
+        digest (str)
+            hex SHA-1 digest
+
+    >>> fingerprint( model_params.P2K, 0.02, 'euler' )
+
+    """
+    h = _hashlib.sha1()
+    def feed(item):
+        if isinstance(item, dict):
+            h.update(b'{')
+            for key in sorted(item):
+                feed(key)
+                feed(item[key])
+        elif isinstance(item, (list, tuple)):
+            h.update(b'[')
+            for x in item:
+                feed(x)
+        elif item is None or isinstance(item, str):
+            h.update(repr(item).encode())
+        else:
+            a = _np.ascontiguousarray(item)
+            h.update('{}{}'.format(a.dtype.str, a.shape).encode())
+            h.update(a.tobytes())
+    for item in items:
+        feed(item)
+    return h.hexdigest()
+
+# attributes of ModelParams that do not affect the neural dynamics
+_UNUSED_ATTRS = ('rng', 'timecourse_dir', 'saveAllNeuralTimecourses')
+
+def spont_key( model_params, exp_params, rng, time_step, steps, integrator='euler',
+    prune=False ):
+    """
+    Cache key of the calibrated spontaneous steady state of a moth: a hash \
+    of everything the simulation depends on until the end of the noise \
+    calibration, ie the connection matrices, noise vectors and other model \
+    parameters, the calibration windows, the time steps and the state of the \
+    generator of the Wiener noise.
+
+    Args:
+        model_params (class): object with connection matrices, etc.
+        exp_params (class): object with timing info about experiment.
+        rng (Generator): generator of the neural noise, before the run.
+        time_step (float): simulation time step (seconds).
+        steps (numpy array): indices (on the fine time grid) of the timepoints \
+        stepped through until the end of the calibration.
+        integrator (str): [optional] name of the integrator.
+        prune (bool): [optional] whether the moth is compiled.
+
+    Returns
+    -------
+        key (str)
+
+    """
+    params = { name : value for name, value in vars(model_params).items()
+        if name not in _UNUSED_ATTRS and (isinstance(value, (_np.ndarray, str))
+        or _np.isscalar(value)) }
+    params['dtype'] = str(_np.dtype(model_params.dtype))
+    windows = [ getattr(exp_params, name) for name in ('sim_start',
+        'startPreNoiseSpontMean1', 'stopPreNoiseSpontMean1', 'startSpontMean2',
+        'stopSpontMean2', 'startSpontMean3', 'stopSpontMean3') ]
+    return fingerprint(params, windows, float(time_step), _np.asarray(steps), integrator,
+        bool(prune), _json.dumps(rng.bit_generator.state, default=_encode, sort_keys=True))
+
+def check_checkpoint( state, **expected ):
+    """
+    Check that a checkpoint belongs to the run being resumed.
+
+    Args:
+        state (dict): as returned by :func:`load_checkpoint`.
+        expected: values the checkpoint must hold, eg N=len(T), dt=dt.
+
+    Raises:
+        ValueError: if a value is missing or differs.
+
+    """
+    for key, value in expected.items():
+        if key not in state:
+            raise ValueError('checkpoint has no {!r}'.format(key))
+        if _np.shape(state[key]) != _np.shape(value) or not _np.allclose(state[key], value):
+            raise ValueError('checkpoint {} = {} does not match this run ({})'.format(
+                key, state[key], value))
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
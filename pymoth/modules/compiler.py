@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: compiler
+   :platform: Unix
+   :synopsis: Prune inactive populations, pathways and noise draws before simulation.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+
+POPULATIONS = ('P', 'PI', 'L', 'R', 'K')
+
+class ModelPlan:
+    """
+
+    What a :class:`StepKernel` has to compute for a given moth: the live \
+    populations, the nonzero pathways and the populations with Wiener noise. \
+    Built by :func:`compile_model`; everything it prunes is exactly zero (or \
+    has no effect on the other populations), so the pruned kernel computes \
+    the same FRs. The only differences are that a dead population is held at \
+    its initial FRs, and that no standard normal draws are made for \
+    noise-free populations, so a noisy run sees a different noise realization.
+
+    """
+    def __init__(self, live, paths, noisy, pruned, flops, heb_flops, draws):
+        """
+
+        Args:
+            live (dict): whether each of [ P, PI, L, R, K ] is computed.
+            paths (dict): whether each pruneable pathway is computed.
+            noisy (tuple): whether each of [ P, PI, L, R, K ] gets noise draws.
+            pruned (list): description of each pruned item.
+            flops (tuple): (full, pruned) estimated FLOPs per Euler step.
+            heb_flops (tuple): (full, pruned) estimated FLOPs per Hebbian update.
+            draws (tuple): (full, pruned) standard normal draws per step.
+
+        """
+        self.live = live
+        self.paths = paths
+        self.noisy = noisy
+        self.pruned = pruned
+        self.flops = flops
+        self.heb_flops = heb_flops
+        self.draws = draws
+
+    def report(self):
+        """
+        Print what was pruned, and the expected savings.
+        """
+        print('Model compiler:')
+        for item in self.pruned or ['nothing']:
+            print(' pruned {}'.format(item))
+        for name, (full, pruned) in (('FLOPs per step', self.flops),
+            ('FLOPs per Hebbian update', self.heb_flops),
+            ('noise draws per step', self.draws)):
+            print(' {}: {:,} -> {:,} ({:.0%} saved)'.format(name, full, pruned,
+                1 - pruned/full if full else 0))
+
+def compile_model( model_params, keep=() ):
+    """
+
+    Inspect a moth (with its connection matrices) for dead populations, \
+    zero-weight pathways and zero noise, and plan a time step without them. \
+    The PIs only project to the KCs, so they are dead when PI2K is zero (it \
+    can never grow, since Hebbian growth is restricted to existing synapses). \
+    Octopamine has no effect on a population whose octo2 vector is zero.
+
+    Args:
+        model_params (class): object with connection matrices, etc.
+        keep (tuple): [optional] populations whose FRs are needed even if dead, \
+        eg because they are recorded.
+
+    Returns
+    -------
+        plan (class)
+            :class:`ModelPlan`, to pass to :class:`StepKernel`
+
+    >>> plan = compile_model(model_params)
+    >>> plan.report()
+
+    """
+    mP = model_params
+    nP, nPI, nL, nR, nK, nE = mP.nG, mP.nPI, mP.nG, mP.nG, mP.nK, mP.nE
+    sizes = dict(zip(POPULATIONS, (nP, nPI, nL, nR, nK)))
+    nnz = lambda W: int(_np.count_nonzero(W)) if mP.sparse_synapses else W.size
+
+    pruned = []
+    live = { pop : True for pop in POPULATIONS }
+    if not _np.any(mP.PI2K) and 'PI' not in keep:
+        live['PI'] = False
+        pruned.append('population PI ({} neurons): PI2K is zero, so PIs have no '
+            'effect on the KCs'.format(nPI))
+
+    paths = {}
+    for name, W in (('L2PI', mP.L2PI), ('R2PI', mP.R2PI), ('PI2K', mP.PI2K)):
+        paths[name] = live['PI'] and bool(_np.any(W))
+        if live['PI'] and not paths[name]:
+            pruned.append('pathway {}: all weights are zero'.format(name))
+    for pop in ('P', 'K'):
+        paths['octo2'+pop] = bool(_np.any(getattr(mP, 'octo2'+pop)))
+        if not paths['octo2'+pop]:
+            pruned.append('pathway octo2{}: octopamine has no effect on {}'.format(pop, pop))
+
+    noisy = []
+    for pop in POPULATIONS:
+        noisy.append( live[pop] and bool(_np.any(getattr(mP, 'noise{}vec'.format(pop)))) )
+        if live[pop] and not noisy[-1]:
+            pruned.append('noise draws for {} ({} per step): zero noise'.format(pop, sizes[pop]))
+
+    # rough FLOP counts of StepKernel.drift and .euler, without and with pruning
+    def step_flops(live, paths, noisy):
+        flops = 2*nL*(nP + nL + nR) + 2*nnz(mP.P2K) + 2*nnz(mP.K2E) + 12*nK + 5*nE
+        flops += 8*(nP + nL + nR) + 2*(paths['octo2P']*nP + paths['octo2K']*nK)
+        if live['PI']:
+            flops += 8*nPI + 2*nPI*(paths['L2PI']*nL + paths['R2PI']*nR)
+            flops += 2*paths['PI2K']*(nnz(mP.PI2K) + nK)
+        flops += 2*sum( n for n, z in zip(sizes.values(), noisy) if z )
+        return int(flops)
+
+    def heb_flops(paths):
+        return int(3*nnz(mP.P2K) + 3*nK + 8*paths['PI2K']*nnz(mP.PI2K))
+
+    full_live = { pop : True for pop in POPULATIONS }
+    full_paths = { name : True for name in paths }
+    full_noisy = [True]*len(POPULATIONS)
+    draws = ( sum(sizes.values()), sum( n for n, z in zip(sizes.values(), noisy) if z ) )
+
+    return ModelPlan(live, paths, tuple(noisy), pruned,
+        (step_flops(full_live, full_paths, full_noisy), step_flops(live, paths, noisy)),
+        (heb_flops(full_paths), heb_flops(paths)), draws)
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
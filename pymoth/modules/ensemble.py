@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: ensemble
+   :platform: Unix
+   :synopsis: Run the SDE simulation for an ensemble of moths in one vectorized pass.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+from scipy.special import erfinv
+from ..modules.sde import initial_conditions
+from ..modules.timeline import StimTimeline, time_vector
+from ..modules.rng import make_rng, NoiseBlock
+from ..modules.progress import make_progress
+
+def sde_wrap_ensemble( model_params_list, exp_params, feature_array, rng=None,
+    time_step=2*0.01, progress=None ):
+    """
+    Runs the SDE time-stepped evolution of neural firing rates for several moths \
+    at once.
+
+    Each moth keeps its own connection matrices, noise vectors and learning \
+    rates (eg different seeds or different GOAL values), but all moths share the \
+    experiment schedule and the stimuli, so they can be stepped forward together. \
+    State vectors and plastic weights carry a leading 'moth' axis.
+
+    Args:
+        model_params_list (list): :class:`ModelParams` objects (with connection \
+        matrices) of identical size and dtype, one per moth. The moths are \
+        simulated in their dtype (eg float32, see :meth:`ModelParams.set_dtype`).
+        exp_params (class): object with timing info about experiment, eg when stimuli are given.
+        feature_array (numpy array): stimuli (numFeatures x numStimsPerClass x numClasses).
+        rng (Generator or int): [optional] random number generator (or seed) for \
+        the neural noise. Defaults to exp_params.rng.
+        time_step (float): [optional] simulation time step (seconds). The \
+        ensemble is integrated with fixed Euler-Maruyama steps, and the \
+        hebbian increments are scaled as in :class:`StepKernel`.
+        progress (function): [optional] progress reports, see :func:`make_progress`.
+
+    Returns
+    -------
+        sim_results (list)
+            one dict per moth, in the same format as the output of :func:`sde_wrap`
+
+    >>> sim_results = sde_wrap_ensemble([model_params_1, model_params_2], exp_params, feature_array)
+
+    """
+
+    ##TEST that all moths have the same architecture
+    sizes = [(mP.nF, mP.nG, mP.nPI, mP.nK, mP.nE) for mP in model_params_list]
+    if len(set(sizes)) != 1:
+        raise ValueError('All moths in an ensemble must have the same numbers of neurons, ' + \
+            'got (nF, nG, nPI, nK, nE) = {}'.format(sizes))
+    dtypes = set(_np.dtype(mP.dtype) for mP in model_params_list)
+    if len(dtypes) != 1:
+        raise ValueError('All moths in an ensemble must have the same dtype ' + \
+            '(see ModelParams.set_dtype), got {}'.format(sorted(str(d) for d in dtypes)))
+
+    time = time_vector(exp_params, time_step)
+    timeline = StimTimeline(exp_params, time)
+    tspan = ( exp_params.sim_start, exp_params.sim_stop )
+    rng = exp_params.rng if rng is None else make_rng(rng)
+
+    # run the SDE evolution:
+    this_run = sde_evo_ensemble(tspan, time, timeline, feature_array,
+        model_params_list, exp_params, rng, progress )
+    octo_hits = timeline.octo_course(_np.arange(len(time)))
+
+    # unpack into one sim_results dict per moth (compatible with collect_stats):
+    sim_results = []
+    for m, mP in enumerate(model_params_list):
+        sim_results.append({
+                    'T' : this_run['T'], # timing information
+                    'E' : this_run['E'][m], # length(T) x mP.nE matrix
+                    'octo_hits' : octo_hits,
+                    'K2Efinal' : this_run['K2Efinal'][m],
+                    'P2Kfinal' : this_run['P2Kfinal'][m],
+                    'nE' : mP.nE
+                    })
+
+    return sim_results
+
+def sde_evo_ensemble(tspan, time, timeline, feature_array,
+    model_params_list, exP, rng, progress=None):
+    """
+
+    Evolve the differential equations of M moths together, using the same \
+    Euler-Maruyama scheme (and the same staged noise calibration) as \
+    :func:`sde_evo_mnist`.
+
+    Called by :func:`sde_wrap_ensemble`. Per-moth vectors are stacked into \
+    [M x n] arrays and connection matrices into [M x n x m] arrays, so each step \
+    costs one batched matrix product per pathway instead of M Python-level steps.
+
+    Only EN timecourses are kept in full. The spontaneous FR means used for the \
+    noise calibration are accumulated as running sums, so AL and MB timecourses \
+    are never stored.
+
+    Args:
+        tspan (tuple): start and stop timepoints (seconds)
+        time (numpy array): [start:step:stop] vector of timepoints
+        timeline (class): :class:`StimTimeline` of the digit presentations, \
+        octopamine and hebbian learning.
+        feature_array (numpy array): [numFeatures x numStimsPerClass x numClasses]
+        model_params_list (list): model_params objects, one per moth.
+        exP (class): experiment parameters with some timing info.
+        rng (Generator): random number generator for the Wiener noise.
+        progress (function): [optional] progress reports, see :func:`make_progress`.
+
+    Returns:
+        this_run (dict):
+            - T: [m x 1] timepoints used in evolution
+            - E: [M x m x nE] EN timecourses of each moth
+            - P2Kfinal: [M x nK x nP] final P2K connection matrices
+            - K2Efinal: [M x nE x nK] final K2E connection matrices
+
+    """
+
+    def stack(name):
+        """
+        Stack a vector or matrix attribute of every moth along a leading moth axis.
+        """
+        return _np.stack([_np.asarray(getattr(mP, name), dtype=dtype) for mP in mPs])
+
+    def col(name, ndim=2):
+        """
+        Stack a scalar attribute of every moth into a broadcastable column.
+        """
+        return _np.array([getattr(mP, name) for mP in mPs], dtype=dtype).reshape((-1,) + (1,)*(ndim-1))
+
+    def bdot(A, x, out):
+        """
+        Batched matrix-vector product: [M x n x m] times [M x m] -> [M x n], into out.
+        """
+        _np.matmul(A, x[..., None], out=out[..., None])
+        return out
+
+    def piecewise_lin_pseudo_sig(x, half_span, slope):
+        """
+        Piecewise linear 'sigmoid' used for speed when squashing neural inputs \
+        in difference eqns, in place. half_span is (-span/2, span/2).
+        """
+        x *= slope
+        _np.maximum(x, half_span[0], out=x) # replace values below -span/2
+        _np.minimum(x, half_span[1], out=x) # replace values above span/2
+
+    def wiener(new_, old_, tau_, inputs_, scale_, z_):
+        """
+        Euler step with wiener noise into new_, given the standard normal draws \
+        z_ (overwritten) and the noise amplitudes scale_ = sqrt(dt)*w_sig*mean_spont.
+        """
+        _np.multiply(old_, tau_, out=new_)
+        _np.subtract(inputs_, new_, out=new_)
+        new_ *= dt
+        new_ += old_
+        # Wiener noise:
+        z_ *= scale_
+        new_ += z_
+
+    def safe_inv(x):
+        """
+        1/x, with 0 where x == 0 (ie the corresponding process is switched off).
+        """
+        return _np.divide(1, x, out=_np.zeros_like(x), where=x>0)
+
+    mPs = model_params_list
+    M = len(mPs)
+    mP = mPs[0] # sizes and dtype are shared by all moths
+    dtype = _np.dtype(mP.dtype).type # simulation precision (eg float32)
+
+    # numbers of objects
+    nC = timeline.nC
+    nP, nPI, nL, nR, nK, nE = mP.nG, mP.nPI, mP.nG, mP.nG, mP.nK, mP.nE
+
+    ## noise in individual neuron FRs, [M x n]:
+    wPsig = stack('noisePvec').reshape(M, -1)
+    wPIsig = stack('noisePIvec').reshape(M, -1) # no PIs for mnist
+    wLsig = stack('noiseLvec').reshape(M, -1)
+    wRsig = stack('noiseRvec').reshape(M, -1)
+    wKsig = stack('noiseKvec').reshape(M, -1)
+
+    # steady-state RN FR, base + noise:
+    Rspont = stack('Rspont').reshape(M, -1)
+    RspontRatios = Rspont/Rspont.mean(axis=1, keepdims=True) # used to scale stim inputs
+
+    # per-moth vectors [M x n]
+    R2P = stack('R2P').reshape(M, -1)
+    R2L = stack('R2L').reshape(M, -1)
+    octo2P = stack('octo2P').reshape(M, -1)
+    octo2PI = stack('octo2PI').reshape(M, -1) # no PIs for mnist
+    octo2L = stack('octo2L').reshape(M, -1)
+    octo2R = stack('octo2R').reshape(M, -1)
+    octo2K = stack('octo2K').reshape(M, -1)
+    kGlobalDampVec = stack('kGlobalDampVec').reshape(M, -1)
+
+    # per-moth matrices [M x n x m]
+    F2R, R2PI = stack('F2R'), stack('R2PI')
+    # lateral inhibition onto P, PI, L and R, stacked into one operator per moth
+    # so that each step needs a single batched product (see StepKernel)
+    L2 = _np.concatenate((stack('L2P'), stack('L2PI').reshape(M, nPI, -1), stack('L2L'),
+        stack('L2R')), axis=1)
+    L2bounds = _np.cumsum((nP, nPI, nL))
+    P2K0, PI2K0, K2E0 = stack('P2K'), stack('PI2K'), stack('K2E')
+
+    # per-moth scalars, as [M x 1] (vectors) or [M x 1 x 1] (matrices) columns
+    tau_P, tau_PI, tau_L, tau_R = col('tau_P'), col('tau_PI'), col('tau_L'), col('tau_R')
+    tau_K, tau_E = col('tau_K'), col('tau_E')
+    cP, cPI, cL, cR, cK = col('cP'), col('cPI'), col('cL'), col('cR'), col('cK')
+    octoNegDiscount = col('octoNegDiscount')
+
+    ## param for sigmoid that squashes inputs to neurons:
+    # the slope at x = 0 = mP.slope_param*span/4
+    pSpan, piSpan, lSpan, rSpan, kSpan = [ (-c/2, c/2) for c in (cP, cPI, cL, cR, cK) ]
+    slope_param = col('slope_param')
+    pSlope = slope_param*cP/4
+    piSlope = slope_param*cPI/4 # no PIs for mnist
+    lSlope = slope_param*cL/4
+    rSlope = slope_param*cR/4
+    kSlope = slope_param*cK/4
+
+    # the # st devs to give the correct sparsity
+    numNoOctoStds = (_np.sqrt(2)*erfinv(1 - 2*col('sparsityTarget'))).astype(dtype)
+    numOctoStds = (_np.sqrt(2)*erfinv(1 - 2*col('octoSparsityTarget'))).astype(dtype)
+
+    # hebbian rates and ceilings
+    # (the increments are per step, tuned for mP.heb_time_step, see StepKernel)
+    dt = round(time[1] - time[0], 10) # this is determined by start, stop and step in calling function
+    heb_scale = (dt/col('heb_time_step', 3)).astype(dtype)
+    inv_heb_tau_PK = safe_inv(col('heb_tau_PK', 3))*heb_scale
+    inv_heb_tau_PIK = safe_inv(col('heb_tau_PIK', 3))*heb_scale
+    inv_heb_tau_KE = safe_inv(col('heb_tau_KE', 3))*heb_scale
+    inv_die_back_tau_PK = safe_inv(col('die_back_tau_PK', 3))
+    inv_die_back_tau_PIK = safe_inv(col('die_back_tau_PIK', 3))
+    inv_die_back_tau_KE = safe_inv(col('die_back_tau_KE', 3))
+    hebMaxPK, hebMaxPIK, hebMaxKE = col('hebMaxPK', 3), col('hebMaxPIK', 3), col('hebMaxKE', 3)
+
+#-------------------------------------------------------------------------------
+
+    N = int(round( (tspan[1] - tspan[0]) / dt )) # number of steps in noise evolution
+    T = _np.linspace(tspan[0], tspan[1]-dt, N) # the time vector
+    # scalars in the simulation dtype (float64 scalars would promote float32 states)
+    dt, sqrt_dt = dtype(dt), dtype(_np.sqrt(dt))
+
+    # standard normal draws for the Wiener noise, drawn in blocks of steps
+    noise = NoiseBlock(rng, [ (M, n) for n in (nP, nPI, nL, nR, nK) ], dtype=dtype)
+
+#-------------------------------------------------------------------------------
+
+    # initialize the FRs with initial conditions, one row per moth; the states
+    # are double buffered (old and new), and swapped after each step
+    init_cond = _np.stack([initial_conditions(m) for m in mPs]).astype(dtype)
+    bounds = _np.cumsum((nP, nPI, nL, nR, nK))
+    old = [ x.copy() for x in _np.split(init_cond[:, :bounds[-1]], bounds[:-1], axis=1) ]
+    new = [ _np.empty_like(x) for x in old ]
+
+    # only the EN timecourses are saved in full
+    E = _np.zeros((M, N, nE), dtype=dtype)
+    E[:, 0, :] = init_cond[:, -nE : ]
+
+    P2Kmask = P2K0 > 0
+    PI2Kmask = PI2K0 > 0 # no PIs for mnist
+    K2Emask = K2E0 > 0
+    # plastic weights, updated in place
+    P2K = P2K0.copy() # initialize
+    PI2K = PI2K0.copy() # no PIs for mnist
+    K2E = K2E0.copy()
+
+    # stimulus magnitude and number of presentations so far of each class
+    class_mag = _np.zeros(nC)
+    class_counter = _np.zeros(nC)
+    # RN drive of the stimulus currently presented by each class, as
+    # { class : (image index, [M x nR] drive) }
+    stim_drives = {}
+
+    # workspaces, so that the loop does not allocate (see StepKernel)
+    stimDrive = _np.zeros((M, nR), dtype=dtype)
+    L2dot = _np.empty((M, L2.shape[1]), dtype=dtype)
+    L2P_L, L2PI_L, L2L_L, L2R_L = _np.split(L2dot, L2bounds, axis=1) # views
+    Pinputs, PIinputs, Linputs, Rinputs, Kinputs = [ _np.empty_like(x) for x in old ]
+    tmpP, tmpPI, tmpL, tmpR, tmpK = [ _np.empty_like(x) for x in old ]
+    P2KtimesP, PI2KtimesPI = _np.empty((M, nK), dtype=dtype), _np.empty((M, nK), dtype=dtype)
+    thisKinput = _np.empty((M, nK), dtype=dtype)
+    kMean, kStd, damper = [ _np.empty((M, 1), dtype=dtype) for _ in range(3) ]
+    Einputs = _np.empty((M, nE), dtype=dtype)
+    dp2k = _np.empty_like(P2K)
+    dpi2k, dpi2kTmp = _np.empty_like(PI2K), _np.empty_like(PI2K)
+    dpi2kZero = _np.empty(PI2K.shape, dtype=bool)
+    dk2e, dk2eTmp = _np.empty((M, nK), dtype=dtype), _np.empty((M, nK), dtype=dtype)
+    dk2eZero = _np.empty((M, nK), dtype=bool)
+    eCol = _np.empty((M, 1), dtype=dtype)
+    win_sq_P = _np.empty_like(old[0])
+
+    # hebbian die back factors, per step
+    dieBackPK = inv_die_back_tau_PK > 0
+    dieBackPKfactor = _np.where(dieBackPK, -inv_die_back_tau_PK*dt, 1).astype(dtype)
+    dieBackPIK = inv_die_back_tau_PIK*dt
+    dieBackKE = (inv_die_back_tau_KE*dt)[:, 0] # per EN row, [M x 1]
+    inv_heb_tau_KE_row = inv_heb_tau_KE[:, 0]
+    hebMaxKE_row = hebMaxKE[:, 0]
+
+#-------------------------------------------------------------------------------
+
+    meanCalc1Done = False # flag to prevent redundant calcs of mean spont FRs
+    meanCalc2Done = False
+    meanCalc3Done = False
+
+    mean_spont = [ _np.zeros_like(x) for x in old ] # of P, PI, L, R, K
+    w_sigs = (wPsig, wPIsig, wLsig, wRsig, wKsig)
+    # noise amplitudes sqrt(dt)*w_sig*mean_spont_FR, updated with mean_spont
+    noise_scale = [ sqrt_dt*w*m for w, m in zip(w_sigs, mean_spont) ]
+
+    # running sums over the three spontaneous windows (in place of stored timecourses)
+    windows = [ (exP.startPreNoiseSpontMean1, exP.stopPreNoiseSpontMean1),
+                (exP.startSpontMean2, exP.stopSpontMean2),
+                (exP.startSpontMean3, exP.stopSpontMean3) ]
+    win_sums = [ [_np.zeros_like(x) for x in old] for _ in windows ]
+    win_counts = [0]*len(windows)
+    win_sum_sq_P = _np.zeros_like(old[0]) # for ssStdSpontP
+
+    # placeholder until we have an estimate based on spontaneous PN firing rates
+    maxSpontP2KtimesPval = 10*_np.ones((M, 1), dtype=dtype)
+    minDamperVal = 1.2*maxSpontP2KtimesPval
+
+    # octopamine scaling of the inputs, recomputed only when octo changes:
+    # responsivity to negative (neg) and positive (pos) inputs of P, PI, L, R
+    # and K, and the # st devs to give the correct sparsity
+    octo2 = (octo2P, octo2PI, octo2L, octo2R, octo2K)
+    neg_octo = [ _np.empty_like(o) for o in octo2 ]
+    pos_octo = [ _np.empty_like(o) for o in octo2 ]
+    numStds = _np.empty_like(numNoOctoStds)
+    lastOctoHit = None
+
+    # progress reports, at most every progress.interval seconds
+    progress = make_progress(progress)
+    progress.start(N-1, 'SDE ensemble evolution', exP)
+
+    ## Main evolution loop:
+    # iterate through time steps to get the full evolution:
+    for i in range(N-1): # i = index of the time point
+        progress.update(i, T[i])
+
+        oldP, oldPI, oldL, oldR, oldK = old
+        newP, newPI, newL, newR, newK = new
+        oldE = E[:, i, :]
+        newE = E[:, i+1, :] # always save full EN timecourses
+        oldT = T[i]
+
+#-------------------------------------------------------------------------------
+
+        # accumulate spontaneous FRs in the calibration windows
+        for w, (start, stop) in enumerate(windows):
+            if start < oldT < stop:
+                for acc, x in zip(win_sums[w], old):
+                    acc += x
+                win_counts[w] += 1
+                if w == 2:
+                    _np.multiply(oldP, oldP, out=win_sq_P)
+                    win_sum_sq_P += win_sq_P
+
+        # the same three-stage calibration as sde_evo_mnist
+        if oldT > exP.stopPreNoiseSpontMean1 and not(meanCalc1Done):
+            mean_spont = [acc/win_counts[0] for acc in win_sums[0]]
+            noise_scale = [ sqrt_dt*w*m for w, m in zip(w_sigs, mean_spont) ]
+            meanCalc1Done = 1 # so we don't calc this again
+
+        if oldT > exP.stopSpontMean2 and not(meanCalc2Done):
+            # ie we want to calc new noise weight vectors. This stage is surplus
+            mean_spont = [acc/win_counts[1] for acc in win_sums[1]]
+            noise_scale = [ sqrt_dt*w*m for w, m in zip(w_sigs, mean_spont) ]
+            meanCalc2Done = 1 # so we don't calc this again
+
+        if oldT > exP.stopSpontMean3 and not(meanCalc3Done):
+            ssMeanSpontP = win_sums[2][0]/win_counts[2] # 'ss' means steady state
+            ssStdSpontP = _np.sqrt(_np.maximum(win_sum_sq_P/win_counts[2] - ssMeanSpontP**2, 0))
+            meanCalc3Done = 1 # so we don't calc this again
+
+            # set a minimum damping on KCs based on spontaneous PN activity,
+            # sufficient to silence the MB silent absent odor:
+            temp = _np.sort(bdot(P2K0, ssMeanSpontP, _np.empty((M, nK), dtype=dtype)),
+                axis=1) # 'ascending' by default
+            ignoreTopN = 1 # ie ignore this many of the highest vals
+            temp = temp[:, :-ignoreTopN] # ignore the top few outlier K inputs
+            maxSpontP2KtimesPval = temp.max(axis=1, keepdims=True) # The minimum global damping on the MB
+            minDamperVal = 1.2*maxSpontP2KtimesPval
+
+        # stimulus magnitudes and presentation counters of each class
+        timeline.stim(i, class_mag, class_counter)
+
+        # RN drive at time index i: the drive of each stimulus (per moth) is
+        # computed once, then scaled by its magnitude (see StepKernel.set_input)
+        stimDrive.fill(0)
+        thisStimClassInd = []
+        for j in _np.flatnonzero(class_mag):
+            imNum = int(class_counter[j] - 1) # indexing: need the '-1' so we don't run out of images
+            if stim_drives.get(j, (None,))[0] != imNum:
+                stim_drives[j] = (imNum, F2R.dot(feature_array[:,imNum,j].astype(dtype))*RspontRatios)
+            _np.multiply(stim_drives[j][1], class_mag[j], out=tmpR)
+            stimDrive += tmpR
+            thisStimClassInd.append(j)
+
+        # get value at t for octopamine:
+        thisOctoHit = dtype(timeline.octo(i))
+        if thisOctoHit != lastOctoHit:
+            lastOctoHit = thisOctoHit
+            for k, (o2, neg, pos) in enumerate(zip(octo2, neg_octo, pos_octo)):
+                _np.multiply(o2, thisOctoHit, out=pos)
+                if k < 4:
+                    # AL neurons: negative inputs are discounted
+                    _np.multiply(pos, octoNegDiscount, out=neg)
+                else:
+                    _np.copyto(neg, pos)
+                _np.subtract(1, neg, out=neg)
+                _np.maximum(neg, 0, out=neg) # pos. rectify
+                pos += 1
+            _np.multiply(numNoOctoStds, 1-thisOctoHit, out=numStds)
+            numStds += thisOctoHit*numOctoStds
+        negP, negPI, negL, negR, negK = neg_octo
+        posP, posPI, posL, posR, posK = pos_octo
+
+#-------------------------------------------------------------------------------
+
+        # standard normal draws for the Wiener noise of each population:
+        zP, zPI, zL, zR, zK = noise.next()
+        scaleP, scalePI, scaleL, scaleR, scaleK = noise_scale
+
+        # lateral inhibition, [M x (nP + nPI + nL + nR)]:
+        bdot(L2, oldL, L2dot)
+
+        # dP:
+        _np.multiply(negP, L2P_L, out=Pinputs)
+        _np.negative(Pinputs, out=Pinputs)
+        _np.multiply(R2P, oldR, out=tmpP)
+        tmpP *= posP
+        Pinputs += tmpP
+        piecewise_lin_pseudo_sig(Pinputs, pSpan, pSlope)
+        wiener(newP, oldP, tau_P, Pinputs, scaleP, zP)
+
+        # dPI: # no PIs for mnist
+        _np.multiply(negPI, L2PI_L, out=PIinputs)
+        _np.negative(PIinputs, out=PIinputs)
+        bdot(R2PI, oldR, tmpPI)
+        tmpPI *= posPI
+        PIinputs += tmpPI
+        piecewise_lin_pseudo_sig(PIinputs, piSpan, piSlope)
+        wiener(newPI, oldPI, tau_PI, PIinputs, scalePI, zPI)
+
+        # dL:
+        _np.multiply(negL, L2L_L, out=Linputs)
+        _np.negative(Linputs, out=Linputs)
+        _np.multiply(R2L, oldR, out=tmpL)
+        tmpL *= posL
+        Linputs += tmpL
+        piecewise_lin_pseudo_sig(Linputs, lSpan, lSlope)
+        wiener(newL, oldL, tau_L, Linputs, scaleL, zL)
+
+        # dR:
+        _np.multiply(negR, L2R_L, out=Rinputs)
+        _np.negative(Rinputs, out=Rinputs)
+        _np.multiply(stimDrive, posR, out=tmpR) # neural activity
+        tmpR += Rspont
+        Rinputs += tmpR
+        piecewise_lin_pseudo_sig(Rinputs, rSpan, rSlope)
+        wiener(newR, oldR, tau_R, Rinputs, scaleR, zR)
+
+#-------------------------------------------------------------------------------
+
+        # Enforce sparsity on the KCs (see sde_evo_mnist):
+        bdot(P2K, oldP, P2KtimesP)
+        bdot(PI2K, oldPI, PI2KtimesPI)
+        _np.subtract(P2KtimesP, PI2KtimesPI, out=thisKinput) # (no PIs for mnist, only Ps)
+
+        _np.mean(thisKinput, axis=1, keepdims=True, out=kMean)
+        _np.subtract(thisKinput, kMean, out=tmpK)
+        tmpK *= tmpK
+        _np.mean(tmpK, axis=1, keepdims=True, out=kStd)
+        _np.sqrt(kStd, out=kStd)
+        _np.multiply(numStds, kStd, out=damper)
+        damper += kMean
+        _np.maximum(damper, minDamperVal, out=damper)
+
+        _np.multiply(damper, kGlobalDampVec, out=tmpK) # dampening
+        tmpK += PI2KtimesPI
+
+        _np.multiply(P2KtimesP, posK, out=Kinputs) # but note that mP.octo2K == 0
+        tmpK *= negK
+        Kinputs -= tmpK # but no PIs for mnist
+        piecewise_lin_pseudo_sig(Kinputs, kSpan, kSlope)
+        wiener(newK, oldK, tau_K, Kinputs, scaleK, zK)
+
+#-------------------------------------------------------------------------------
+
+        # Readout neurons E (no sigmoid, no noise):
+        bdot(K2E, oldK, Einputs)
+        _np.multiply(oldE, tau_E, out=newE)
+        _np.subtract(Einputs, newE, out=newE)
+        newE *= dt
+        newE += oldE
+
+#-------------------------------------------------------------------------------
+
+        # disallow negative FRs (the hebbian updates use the non-neg newK)
+        for x in new:
+            _np.maximum(x, 0, out=x)
+
+    ## HEBBIAN UPDATES (see sde_evo_mnist), in place: the inputs of this
+    ## step have already been computed with the old weights
+
+        if timeline.heb(i):
+            ## dP2K:
+            _np.multiply(newK[:, :, None], oldP[:, None, :], out=dp2k)
+            dp2k *= inv_heb_tau_PK
+            dp2k *= P2Kmask #  if original synapse does not exist, it will never grow
+
+            # decay some P2K connections if wished: (not used for mnist experiments)
+            if dieBackPK.any():
+                P2K *= dieBackPKfactor
+
+            P2K += dp2k
+            _np.maximum(P2K, 0, out=P2K)
+            _np.minimum(P2K, hebMaxPK, out=P2K)
+
+            ## dPI2K: # no PIs for mnist
+            _np.multiply(newK[:, :, None], oldPI[:, None, :], out=dpi2k)
+            dpi2k *= inv_heb_tau_PIK
+            dpi2k *= PI2Kmask # if original synapse does not exist, it will never grow
+
+            # kill small increases:
+            # (this detour prevents dividing by zero)
+            _np.equal(PI2K, 0, out=dpi2kZero)
+            _np.copyto(dpi2kTmp, PI2K)
+            _np.copyto(dpi2kTmp, 1, where=dpi2kZero)
+            _np.divide(dpi2k, dpi2kTmp, out=dpi2kTmp)
+            dpi2k *= dpi2kTmp
+            _np.multiply(PI2K, dieBackPIK, out=dpi2kTmp)
+            PI2K -= dpi2kTmp
+            PI2K += dpi2k
+            _np.maximum(PI2K, 0, out=PI2K)
+            _np.minimum(PI2K, hebMaxPIK, out=PI2K)
+
+            ## dK2E:
+            # restrict changes to just the rows of the training stims, one
+            # [M x nK] row view at a time
+            for row in thisStimClassInd:
+                w = K2E[:, row]
+                _np.multiply(inv_heb_tau_KE_row, newE[:, row, None], out=eCol)
+                _np.multiply(eCol, oldK, out=dk2e)
+                dk2e *= K2Emask[:, row]
+
+                # inactive connections for the trained EN die back:
+                _np.add(w, 2, out=dk2eTmp)
+                dk2eTmp *= dieBackKE
+                _np.equal(dk2e, 0, out=dk2eZero)
+                dk2eTmp *= dk2eZero
+                w -= dk2eTmp
+
+                w += dk2e
+                _np.maximum(w, 0, out=w)
+                _np.minimum(w, hebMaxKE_row, out=w)
+
+#-------------------------------------------------------------------------------
+
+        # make the new states the current ones (by reference)
+        old, new = new, old
+
+    progress.finish()
+    # Time-step simulation is now over.
+
+    this_run = dict()
+    this_run['T'] = T.T # store T as a col
+    this_run['E'] = E
+    this_run['P2Kfinal'] = P2K
+    this_run['K2Efinal'] = K2E
+
+    return this_run
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: enstats
+   :platform: Unix
+   :synopsis: EN response statistics, accumulated while the simulation runs.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+
+def class_stats( resp, which_class, class_labels ):
+    """
+    Mean, median and std of the (no-octo) responses to each class, as in \
+    :func:`collect_stats`: responses flagged -1 are left out, and classes \
+    without any responses get -1 stats.
+
+    Args:
+        resp (numpy array): [numStims] response to each stimulus (or -1).
+        which_class (numpy array): [numStims] class of each stimulus.
+        class_labels (numpy array): classes to compute stats for.
+
+    Returns
+    -------
+        mean_resp, median_resp, std_resp, num_puffs (numpy arrays)
+            [numOdors] stats of each class
+
+    >>> pre_mean_resp, pre_median_resp, pre_std_resp, pre_num_puffs = \\
+    ...     class_stats(pre_train_resp, which_class, class_labels)
+
+    """
+    mean_resp, median_resp, std_resp, num_puffs = \
+        [_np.full(len(class_labels), _np.nan) for _ in range(4)]
+    for k, cl in enumerate(class_labels):
+        SA = resp[_np.logical_and(resp >= 0, which_class == cl)]
+        if len(SA) == 0:
+            mean_resp[k] = median_resp[k] = std_resp[k] = -1
+            num_puffs[k] = 0
+        else:
+            mean_resp[k] = SA.mean()
+            median_resp[k] = _np.median(SA)
+            std_resp[k] = SA.std()
+            num_puffs[k] = len(SA)
+    return mean_resp, median_resp, std_resp, num_puffs
+
+class ENStats:
+    """
+
+    EN statistics of :func:`collect_stats`, accumulated one timepoint at a \
+    time, so that the EN timecourses need not be kept (see sde_wrap's keep_E). \
+    While the response window of a stimulus (+/- 1 sec around its start) is \
+    open, the running max of each EN is kept; during the pre- and \
+    post-Hebbian spontaneous windows, the running (Welford) mean and variance \
+    of all the ENs. The windows are those of the experiment simulated (eg \
+    as shortened by an adaptive calibration).
+
+    >>> en_stats = ENStats()
+    >>> sim_results = sde_wrap(model_params, exp_params, feature_array, keep_E=False, en_stats=en_stats)
+    >>> sim_results['en_stats'][0]['pre_mean_resp']
+
+    """
+    def __init__(self, half_width=1):
+        """
+
+        Args:
+            half_width (float): [optional] seconds on either side of the stimulus start.
+
+        """
+        self.half_width = half_width
+        self.T = None
+
+    def bind(self, exP, T, octo_hits, nE):
+        """
+
+        Set up the windows for a simulation (called by the simulation).
+
+        Args:
+            exP (class): experiment parameters with the timing info.
+            T (numpy array): timepoints of the simulation.
+            octo_hits (numpy array): octopamine strength at each timepoint.
+            nE (int): number of ENs.
+
+        """
+        self.T = T
+        # as in collect_stats, zero magnitude puffs count as class 0 at time 0
+        self.stim_starts = exP.stimStarts*(exP.classMags > 0)
+        self.which_class = exP.whichClass*(exP.classMags > 0)
+
+        # no-octo stimuli, pre- and post-training (octopamine is matched
+        # within a small threshold, see collect_stats)
+        octo_times = T[ octo_hits > 0 ]
+        small = 1e-8
+        if len(octo_times):
+            no_octo = _np.array([ abs(octo_times - t).min() > small for t in self.stim_starts ])
+            self.pre = no_octo & (self.stim_starts < exP.startTrain)
+            self.post = no_octo & (self.stim_starts > exP.endTrain)
+        else:
+            self.pre = _np.ones(len(self.stim_starts), dtype=bool)
+            self.post = _np.zeros(len(self.stim_starts), dtype=bool)
+
+        # step indices [lo, hi) of each window, ie t-1 < T < t+1, in order of
+        # stimulus start (so both bounds increase)
+        self.order = _np.argsort(self.stim_starts, kind='stable')
+        self.order = self.order[ (self.pre | self.post)[self.order] ]
+        starts = self.stim_starts[self.order]
+        self.lo = _np.searchsorted(T, starts - self.half_width, 'right')
+        self.hi = _np.searchsorted(T, starts + self.half_width, 'left')
+        self.spont = [ (_np.searchsorted(T, a, 'right'), _np.searchsorted(T, b, 'left')) for a, b in
+            ((exP.preHebSpontStart, exP.preHebSpontStop),
+             (exP.postHebSpontStart, exP.postHebSpontStop)) ]
+        # timepoints that count towards any stat
+        self.live = _np.zeros(len(T), dtype=bool)
+        for a, b in list(zip(self.lo, self.hi)) + self.spont:
+            self.live[a:b] = True
+
+        self.resp = _np.full((len(self.stim_starts), nE), -_np.inf)
+        self.moments = _np.zeros((2, 3)) # count, mean and m2 of each spont window
+        self.first = 0
+
+    def update(self, n, e):
+        """
+        Add the EN FRs e at timepoint n (timepoints are added in order).
+        """
+        if not self.live[n]:
+            return
+        while self.first < len(self.hi) and self.hi[self.first] <= n:
+            self.first += 1
+        k = self.first
+        while k < len(self.lo) and self.lo[k] <= n:
+            i = self.order[k]
+            _np.maximum(self.resp[i], e, out=self.resp[i])
+            k += 1
+        for w, (a, b) in enumerate(self.spont):
+            if a <= n < b:
+                self._merge(w, e)
+
+    def replay(self, n, E):
+        """
+        Add a block of EN FRs at once: E is [nE x m], timepoints n to n+m-1.
+        """
+        stop = n + E.shape[1]
+        for k in range(len(self.lo)):
+            a, b = max(self.lo[k], n), min(self.hi[k], stop)
+            if a < b:
+                i = self.order[k]
+                _np.maximum(self.resp[i], E[:, a-n:b-n].max(axis=1), out=self.resp[i])
+        for w, (a, b) in enumerate(self.spont):
+            a, b = max(a, n), min(b, stop)
+            if a < b:
+                self._merge(w, E[:, a-n:b-n])
+
+    def _merge(self, w, x):
+        # Chan et al's parallel update of the moments of window w with samples x
+        count, mean, m2 = self.moments[w]
+        x_mean = x.mean(dtype=float)
+        x_count = x.size
+        total = count + x_count
+        delta = x_mean - mean
+        self.moments[w] = ( total, mean + delta*x_count/total,
+            m2 + ((x - x_mean)**2).sum(dtype=float) + delta**2*count*x_count/total )
+
+    def state(self):
+        """
+        The accumulated stats, as arrays (eg to checkpoint).
+        """
+        return { 'en_stats_resp' : self.resp.copy(), 'en_stats_moments' : self.moments.copy() }
+
+    def restore(self, state):
+        """
+        Continue from :meth:`state` (after :meth:`bind`).
+        """
+        # (a branch of another experiment may have more or fewer stimuli,
+        # none of them reached yet)
+        resp = state['en_stats_resp']
+        k = min(len(resp), len(self.resp))
+        self.resp[:k] = resp[:k]
+        self.moments[:] = state['en_stats_moments']
+        self.first = 0
+
+    def spont_stats(self):
+        """
+        Mean and std of the EN FRs in the pre- and post-Hebbian spontaneous \
+        windows: (pre_mean, pre_std, post_mean, post_std), nan if a window \
+        is empty.
+        """
+        out = []
+        for count, mean, m2 in self.moments:
+            out += [mean, _np.sqrt(m2/count)] if count else [_np.nan, _np.nan]
+        return tuple(out)
+
+    def results(self):
+        """
+
+        The EN stats of :func:`collect_stats` (without the percent changes).
+
+        Returns
+        -------
+            results (list)
+                one dict per EN, with pre_train_resp and post_train_resp \
+                ([numStims], -1 for stimuli with octopamine, or outside the \
+                pre- or post-training phase), odor_class, pre_mean_resp, \
+                pre_median_resp, pre_std_resp, post_mean_resp, \
+                post_median_resp, post_std_resp ([numOdors]), pre_spont_mean, \
+                pre_spont_std, post_spont_mean and post_spont_std
+
+        """
+        class_labels = _np.unique(self.which_class)
+        pre_spont_mean, pre_spont_std, post_spont_mean, post_spont_std = self.spont_stats()
+        results = []
+        for en_ind in range(self.resp.shape[1]):
+            en = { 'odor_class' : self.which_class }
+            for phase, tracked in (('pre', self.pre), ('post', self.post)):
+                resp = _np.where(tracked, self.resp[:, en_ind], -1)
+                en[phase + '_train_resp'] = resp
+                en[phase + '_mean_resp'], en[phase + '_median_resp'], \
+                    en[phase + '_std_resp'], _ = class_stats(resp, self.which_class, class_labels)
+            en.update({ 'pre_spont_mean' : pre_spont_mean, 'pre_spont_std' : pre_spont_std,
+                'post_spont_mean' : post_spont_mean, 'post_spont_std' : post_spont_std })
+            results.append(en)
+        return results
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
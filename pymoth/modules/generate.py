@@ -16,7 +16,7 @@ from skimage.transform import downscale_local_mean
 
 def generate_ds_mnist( max_ind, class_labels, crop, downsample_ratio, downsample_method,
 inds_to_ave, pixel_sum, inds_to_calc_RF, num_features, screen_size, save_results_folder,
-show_thumbnails, data_dir='/tmp', data_fname='MNIST_all'):
+show_thumbnails, data_dir='/tmp', data_fname='MNIST_all', dtype=_np.float64):
 	"""
 	Preprocessing:
 		#. Load MNIST
@@ -46,6 +46,8 @@ show_thumbnails, data_dir='/tmp', data_fname='MNIST_all'):
 		show_thumbnails (int): number of thumbnails to show for each class (0 means none)
 		data_dir (str): optional keyword arg specifying where to save data
 		data_fname (str): optional keyword arg specifying filename of saved data
+		dtype (numpy dtype): optional keyword arg specifying the precision of the \
+		returned feature array (eg numpy.float32, to match ModelParams.dtype)
 
 	Returns
 	-------
@@ -165,6 +167,7 @@ show_thumbnails, data_dir='/tmp', data_fname='MNIST_all'):
 		screen_size, save_image_folder=save_results_folder,
 		show_thumbnails=show_thumbnails)
 	feature_array = feature_array[active_pixel_inds,:,:].squeeze() # Project onto the active pixels
+	feature_array = feature_array.astype(dtype, copy=False)
 
 	return feature_array, active_pixel_inds, len_side
 
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: jit
+   :platform: Unix
+   :synopsis: Optional compiled (numba) backend for the SDE evolution.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+from scipy.special import erfinv
+from ..modules.rng import NoiseBlock
+from ..modules.progress import make_progress
+
+try:
+    import numba as _numba
+except ImportError:
+    _numba = None
+
+BACKENDS = ('numpy', 'numba')
+
+def resolve_backend( backend ):
+    """
+    Check the requested simulation backend, falling back to 'numpy' if the \
+    compiled backend is not available.
+
+    Args:
+        backend (str): 'numpy' (reference) or 'numba' (compiled).
+
+    Returns
+    -------
+        backend (str)
+            the backend that will actually be used
+
+    >>> backend = resolve_backend('numba')
+
+    """
+    if backend not in BACKENDS:
+        raise ValueError('unknown backend {!r}: expected one of {}'.format(backend, BACKENDS))
+    if backend == 'numba' and _numba is None:
+        print('numba is not installed: falling back to the numpy backend')
+        return 'numpy'
+    return backend
+
+def _evolve(i0, i1, y, y_new, inp, hist, E_hist, sizes, dt, tau, slope, half_span,
+    noise, noise_scale, octo2, neg_discount, L2P, L2PI, L2L, L2R, R2P, R2PI, R2L, F2R,
+    Rspont, RspontRatios, kGlobalDampVec, P2K, PI2K, K2E, P2Kmask, PI2Kmask, K2Emask,
+    tau_E, num_no_octo_stds, num_octo_stds, max_spont_P2K, class_mag_mat, img_ind,
+    feature_array, octo_hits, heb_region, heb_rates, die_back, heb_max):
+    """
+    Steps i0 ... i1-1 of the Euler-Maruyama evolution, on the flat state y \
+    (ordered [ P, PI, L, R, K, E ]), with the standard normal draws of step i in \
+    noise[i-i0]. Compiled with numba when available.
+    """
+    nP, nPI, nL, nR, nK, nE = sizes
+    oPI = nP
+    oL = oPI + nPI
+    oR = oL + nL
+    oK = oR + nR
+    oE = oK + nK
+    nC = class_mag_mat.shape[0]
+    nF = feature_array.shape[0]
+    Nsave = hist.shape[0]
+
+    neg = _np.zeros(oE)
+    pos = _np.zeros(oE)
+    this_input = _np.zeros(nF)
+    drive = _np.zeros(nR)
+    P2KtimesP = _np.zeros(nK)
+    PI2KtimesPI = _np.zeros(nK)
+    octo = -1.0
+    num_stds = 0.0
+
+    for i in range(i0, i1):
+        # octopamine scaling vectors, only recomputed when octo changes:
+        if octo_hits[i] != octo:
+            octo = octo_hits[i]
+            for j in range(oE):
+                pos[j] = 1 + octo*octo2[j]
+                neg[j] = max(1 - neg_discount[j]*octo*octo2[j], 0)
+            num_stds = (1-octo)*num_no_octo_stds + octo*num_octo_stds
+
+        # feature inputs of all classes presented at this time point:
+        stim_on = False
+        for f in range(nF):
+            this_input[f] = 0
+        for c in range(nC):
+            mag = class_mag_mat[c, i]
+            if mag != 0:
+                stim_on = True
+                for f in range(nF):
+                    this_input[f] += mag*feature_array[f, img_ind[c, i], c]
+
+        # dP, dL (lateral inputs and RN drive):
+        for a in range(nP):
+            s = 0.0
+            for b in range(nL):
+                s += L2P[a, b]*y[oL+b]
+            inp[a] = -neg[a]*s + R2P[a]*y[oR+a]*pos[a]
+        for a in range(nL):
+            s = 0.0
+            for b in range(nL):
+                s += L2L[a, b]*y[oL+b]
+            inp[oL+a] = -neg[oL+a]*s + R2L[a]*y[oR+a]*pos[oL+a]
+
+        # dPI: # no PIs for mnist
+        for a in range(nPI):
+            s = 0.0
+            for b in range(nL):
+                s += L2PI[a, b]*y[oL+b]
+            r = 0.0
+            for b in range(nR):
+                r += R2PI[a, b]*y[oR+b]
+            inp[oPI+a] = -neg[oPI+a]*s + r*pos[oPI+a]
+
+        # dR:
+        # NOTE: octo does not affect Rspont. It affects R's response to input odors.
+        if stim_on:
+            for a in range(nR):
+                s = 0.0
+                for f in range(nF):
+                    s += F2R[a, f]*this_input[f]
+                drive[a] = s*RspontRatios[a]
+        for a in range(nR):
+            s = 0.0
+            for b in range(nL):
+                s += L2R[a, b]*y[oL+b]
+            inp[oR+a] = -neg[oR+a]*s + Rspont[a]
+            if stim_on:
+                inp[oR+a] += drive[a]*pos[oR+a]
+
+        # dK, with global damping set to enforce the KC sparsity target:
+        mean = 0.0
+        for a in range(nK):
+            s = 0.0
+            for b in range(nP):
+                s += P2K[a, b]*y[b]
+            P2KtimesP[a] = s
+            s = 0.0
+            for b in range(nPI):
+                s += PI2K[a, b]*y[oPI+b]
+            PI2KtimesPI[a] = s
+            mean += P2KtimesP[a] - PI2KtimesPI[a]
+        mean /= nK
+        var = 0.0
+        for a in range(nK):
+            d = P2KtimesP[a] - PI2KtimesPI[a] - mean
+            var += d*d
+        damper = max(mean + num_stds*_np.sqrt(var/nK), 1.2*max_spont_P2K)
+        for a in range(nK):
+            inp[oK+a] = P2KtimesP[a]*pos[oK+a] \
+                - (kGlobalDampVec[a]*damper + PI2KtimesPI[a])*neg[oK+a]
+
+        # piecewise linear pseudo sigmoid:
+        for j in range(oE):
+            inp[j] = min(max(slope[j]*inp[j], -half_span[j]), half_span[j])
+
+        # readout neurons (no sigmoid):
+        for e in range(nE):
+            s = 0.0
+            for b in range(nK):
+                s += K2E[e, b]*y[oK+b]
+            inp[oE+e] = s
+
+        # Euler-Maruyama step, with Wiener noise; negative FRs are disallowed
+        # (except for ENs, which have no noise)
+        for j in range(oE):
+            v = y[j] + dt*(inp[j] - tau[j]*y[j]) + noise_scale[j]*noise[i-i0, j]
+            y_new[j] = max(v, 0)
+        for e in range(nE):
+            y_new[oE+e] = y[oE+e] + dt*(inp[oE+e] - tau_E*y[oE+e])
+
+        # Hebbian updates, using 'new' K and 'old' P, 'new' E and 'old' K:
+        if heb_region[i]:
+            for a in range(nK):
+                k = y_new[oK+a]
+                for b in range(nP):
+                    w = P2K[a, b]
+                    if die_back[0] > 0:
+                        w *= -(1/die_back[0])*dt
+                    if P2Kmask[a, b]:
+                        w += k*y[b]*heb_rates[0]
+                    P2K[a, b] = min(max(w, 0), heb_max[0])
+                for b in range(nPI): # no PIs for mnist
+                    w = PI2K[a, b]
+                    d = 0.0
+                    if PI2Kmask[a, b]:
+                        d = k*y[oPI+b]*heb_rates[1]
+                    # kill small increases:
+                    d *= d/(w if w != 0 else 1.0)
+                    if die_back[1] > 0:
+                        w -= w*(1/die_back[1])*dt
+                    PI2K[a, b] = min(max(w + d, 0), heb_max[1])
+            # restrict changes to the rows of the ENs of the training stimuli
+            for c in range(nC):
+                if class_mag_mat[c, i] == 0:
+                    continue
+                e_new = y_new[oE+c]
+                for b in range(nK):
+                    w = K2E[c, b]
+                    d = 0.0
+                    if K2Emask[c, b]:
+                        d = e_new*y[oK+b]*heb_rates[2]
+                    # inactive connections for this EN die back:
+                    if die_back[2] != 0 and d == 0:
+                        w -= (w + 2)*(1/die_back[2])*dt
+                    K2E[c, b] = min(max(w + d, 0), heb_max[2])
+
+        for j in range(oE + nE):
+            y[j] = y_new[j]
+        if i+1 < Nsave:
+            for j in range(oE):
+                hist[i+1, j] = y[j]
+        for e in range(nE):
+            E_hist[i+1, e] = y[oE+e]
+
+if _numba is not None:
+    _evolve = _numba.njit(cache=True)(_evolve)
+
+def sde_evo_jit(tspan, init_cond, time, class_mag_mat, feature_array,
+    octo_hits, mP, exP, rng, progress=None):
+    """
+
+    Compiled counterpart of :func:`sde_evo_mnist`: same dynamics (piecewise \
+    linear pseudo sigmoid, Wiener noise, KC damping, noise calibration and \
+    Hebbian rules), same arguments and outputs. The time loop runs in numba \
+    in chunks, between which the noise calibration and the progress bar are \
+    handled in python.
+
+    The Wiener noise is drawn from rng in the same blocks, and consumed in the \
+    same order, as in :func:`sde_evo_mnist`, so given the same generator both \
+    backends see the same noise; results differ only by floating point \
+    summation order (which noise and learning can amplify). Connection \
+    matrices are always stepped densely here (the masks make the Hebbian \
+    updates sparse), ie mP.sparse_synapses is ignored.
+
+    Args:
+        tspan (tuple): start and stop timepoints (seconds)
+        init_cond (numpy array): [n x 1] starting FRs for all neurons, order-specific
+        time (numpy array): [start:step:stop] vector of timepoints
+        class_mag_mat (numpy array): [# of different classes X vector of time points] \
+        each entry is the strength of a digit presentation.
+        feature_array (numpy array): [numFeatures x numStimsPerClass x numClasses]
+        octo_hits (numpy array): [1 x length(t)] octopamine strengths at each timepoint.
+        mP (class): model_params, including connection matrices, learning rates, etc.
+        exP (class): experiment parameters with some timing info.
+        rng (Generator): random number generator for the Wiener noise.
+        progress (function): [optional] progress reports (between chunks), \
+        see :func:`make_progress`.
+
+    Returns:
+        this_run (dict):
+            - T: [m x 1] timepoints used in evolution
+            - Y: [m x K] all FRs (if mP.saveAllNeuralTimecourses), else []
+            - E: [m x nE] EN timecourses
+            - P2Kfinal: connection matrix
+            - K2Efinal: connection matrix
+
+    """
+    chunk = 500 # steps per compiled call
+
+    nC = class_mag_mat.shape[0]
+    sizes = (mP.nG, mP.nPI, mP.nG, mP.nG, mP.nK, mP.nE)
+    n_al_mb = sum(sizes[:5])
+    bounds = _np.cumsum((0,) + sizes)
+
+    dt = round(time[1] - time[0], 10)
+    N = int(round( (tspan[1] - tspan[0]) / dt )) # number of steps in noise evolution
+    T = _np.linspace(tspan[0], tspan[1]-dt, N) # the time vector
+
+    if mP.saveAllNeuralTimecourses:
+        Nsave = N
+    else:
+        Nsave = min(N, int(_np.searchsorted(T, exP.stopSpontMean3 + 5)) + 1)
+
+    # flat per-neuron constants, ordered [ P, PI, L, R, K ]
+    def flat(*vecs):
+        return _np.concatenate([ _np.asarray(v, dtype=mP.dtype).reshape(-1) for v in vecs ])
+    reps = lambda vals: _np.repeat(_np.asarray(vals, dtype=mP.dtype), sizes[:5])
+    tau = reps((mP.tau_P, mP.tau_PI, mP.tau_L, mP.tau_R, mP.tau_K))
+    spans = (mP.cP, mP.cPI, mP.cL, mP.cR, mP.cK)
+    slope = reps([ mP.slope_param*c/4 for c in spans ])
+    half_span = reps([ c/2 for c in spans ])
+    octo2 = flat(mP.octo2P, mP.octo2PI, mP.octo2L, mP.octo2R, mP.octo2K)
+    # AL neurons: negative inputs are discounted
+    neg_discount = reps([mP.octoNegDiscount]*4 + [1])
+    w_sig = flat(mP.noisePvec, mP.noisePIvec, mP.noiseLvec, mP.noiseRvec, mP.noiseKvec)
+    noise_scale = _np.zeros(n_al_mb, dtype=mP.dtype)
+    noise = NoiseBlock(rng, sizes[:5], dtype=mP.dtype)
+
+    contig = lambda x: _np.ascontiguousarray(x, dtype=mP.dtype)
+    P2K, PI2K, K2E = contig(mP.P2K.copy()), contig(mP.PI2K.copy()), contig(mP.K2E.copy())
+    masks = [ _np.ascontiguousarray(W > 0) for W in (mP.P2K, mP.PI2K, mP.K2E) ]
+    weights = (contig(mP.L2P), contig(mP.L2PI).reshape(mP.nPI, -1), contig(mP.L2L),
+        contig(mP.L2R), flat(mP.R2P), contig(mP.R2PI).reshape(mP.nPI, -1), flat(mP.R2L),
+        contig(mP.F2R), flat(mP.Rspont), flat(mP.Rspont/mP.Rspont.mean()),
+        flat(mP.kGlobalDampVec), P2K, PI2K, K2E, *masks)
+    # hebbian increments are per step (tuned for mP.heb_time_step)
+    heb_scale = dt/mP.heb_time_step
+    heb_rates = _np.array([ (1/tau)*heb_scale for tau in
+        (mP.heb_tau_PK, mP.heb_tau_PIK, mP.heb_tau_KE) ], dtype=mP.dtype)
+    die_back = _np.array([mP.die_back_tau_PK, mP.die_back_tau_PIK, mP.die_back_tau_KE], dtype=float)
+    heb_max = _np.array([mP.hebMaxPK, mP.hebMaxPIK, mP.hebMaxKE], dtype=float)
+
+    # image index of each class at each time point (the class counters):
+    onsets = (class_mag_mat[:,:-1] == 0) & (class_mag_mat[:,1:] > 0)
+    class_counter = _np.zeros(class_mag_mat.shape, dtype=_np.int64)
+    class_counter[:,1:] = _np.cumsum(onsets, axis=1)
+    img_ind = class_counter - 1
+
+    # list of Ts for which heb is active
+    heb_region = _np.zeros(N, dtype=_np.bool_)
+    for start, duration in zip(exP.hebStarts, exP.hebDurations):
+        heb_region |= (T >= start) & (T <= start + duration)
+    courses = (contig(class_mag_mat), img_ind, contig(feature_array), contig(octo_hits),
+        heb_region)
+
+    y = _np.array(init_cond, dtype=mP.dtype)
+    y_new = _np.zeros_like(y)
+    inp = _np.zeros_like(y)
+    hist = _np.zeros((Nsave, n_al_mb), dtype=mP.dtype) # time-major
+    E_hist = _np.zeros((N, mP.nE), dtype=mP.dtype)
+    hist[0] = y[:n_al_mb]
+    E_hist[0] = y[n_al_mb:]
+
+    def window_mean(start, stop):
+        inds = _np.nonzero((T > start) & (T < stop))[0]
+        return hist[inds].mean(axis=0)
+
+    # noise calibration events: the step at which each is applied
+    events = [ (T[:N-1] > t).argmax() if (T[:N-1] > t).any() else N-1
+        for t in (exP.stopPreNoiseSpontMean1, exP.stopSpontMean2, exP.stopSpontMean3) ]
+    max_spont_P2K = 10.0 # placeholder until we have an estimate based on spont PN FRs
+    num_no_octo_stds = _np.sqrt(2)*erfinv(1 - 2*mP.sparsityTarget)
+    num_octo_stds = _np.sqrt(2)*erfinv(1 - 2*mP.octoSparsityTarget)
+
+    progress = make_progress(progress)
+    progress.start(N-1, 'SDE evolution', exP)
+
+    i = 0
+    while i < N-1:
+        if i == events[0]:
+            _np.multiply(_np.sqrt(dt)*w_sig,
+                window_mean(exP.startPreNoiseSpontMean1, exP.stopPreNoiseSpontMean1), out=noise_scale)
+        if i == events[1]:
+            _np.multiply(_np.sqrt(dt)*w_sig,
+                window_mean(exP.startSpontMean2, exP.stopSpontMean2), out=noise_scale)
+        if i == events[2]:
+            ssMeanSpontP = window_mean(exP.startSpontMean3, exP.stopSpontMean3)[:mP.nP]
+            # minimum damping on KCs, sufficient to silence the MB absent odor
+            # (ignore the top outlier K input):
+            max_spont_P2K = float(_np.sort(mP.P2K.dot(ssMeanSpontP))[:-1].max())
+
+        stop = min([ N-1, i + chunk ] + [ e for e in events if e > i ])
+        rows = noise.rows(stop - i) # may end early, at the end of a noise block
+        stop = i + len(rows)
+        progress.update(i, T[i])
+        _evolve(i, stop, y, y_new, inp, hist, E_hist, sizes, dt, tau, slope, half_span,
+            rows, noise_scale, octo2, neg_discount, *weights, float(mP.tau_E), num_no_octo_stds,
+            num_octo_stds, max_spont_P2K, *courses, heb_rates, die_back, heb_max)
+        i = stop
+
+    progress.finish()
+
+    this_run = dict()
+    if mP.saveAllNeuralTimecourses:
+        this_run['Y'] = _np.hstack((hist, E_hist))
+    else:
+        this_run['Y'] = []
+    this_run['T'] = T.T
+    this_run['E'] = E_hist
+    this_run['P2Kfinal'], this_run['K2Efinal'] = P2K, K2E
+
+    return this_run
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
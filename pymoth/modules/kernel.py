@@ -0,0 +1,877 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: kernel
+   :platform: Unix
+   :synopsis: Preallocated, in-place time step of the moth's firing-rate equations.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+from scipy.special import erfinv
+from ..modules.sparse import SparseSynapses
+
+INTEGRATORS = ('euler', 'heun', 'exponential')
+
+class NeuralState:
+    """
+
+    Firing rates of all neurons, stored in one flat vector ordered as \
+    [ P, PI, L, R, K, E ] (the same order as the initial conditions), with one \
+    view per population.
+
+    """
+    def __init__(self, y, sizes):
+        """
+
+        Args:
+            y (numpy array): flat vector of firing rates (not copied)
+            sizes (tuple): (nP, nPI, nL, nR, nK, nE)
+
+        >>> state = NeuralState( init_cond.copy(), (nP, nPI, nL, nR, nK, nE) )
+
+        """
+        self.y = y
+        bounds = _np.cumsum((0,) + tuple(sizes))
+        self.P, self.PI, self.L, self.R, self.K, self.E = \
+            [ y[a:b] for a, b in zip(bounds[:-1], bounds[1:]) ]
+
+class StepKernel:
+    """
+
+    Workspace for stepping the firing-rate SDEs of :func:`sde_evo_mnist` without \
+    per-step array allocation.
+
+    All loop invariants (squeezed connection vectors, the stacked lateral \
+    inhibition operator, sigmoid slopes, KC sparsity thresholds, hebbian rates) \
+    are computed once. Octopamine scaling vectors are \
+    only recomputed when the octopamine level changes, and noise scales only when \
+    the spontaneous FR means are recalibrated. The state lives in two \
+    :class:`NeuralState` buffers that are swapped by reference after each step; \
+    every update is written into preallocated arrays via ufunc 'out=' arguments.
+
+    The plastic weights (P2K, PI2K, K2E) are updated in place: they are only read \
+    (by the forward products) before the hebbian update of the same step.
+
+    Integrators (see :meth:`step`):
+        * 'euler': Euler-Maruyama (the reference scheme).
+        * 'heun': stochastic Heun, ie an Euler predictor followed by a \
+        trapezoidal corrector with the same Wiener increment. Two drift \
+        evaluations per step, second order in the drift.
+        * 'exponential': exponential Euler. The linear decay -tau*y is \
+        integrated exactly over the step (with the matching Ornstein-Uhlenbeck \
+        noise variance), so it stays stable and accurate when tau*dt is not small.
+
+    With a :class:`ModelPlan` (see :func:`compile_model`), dead populations, \
+    zero-weight pathways and noise-free populations are skipped.
+
+    KC activity is sparse, so while at most mP.active_kc_max of the KCs fire, \
+    the K2E hebbian increments are computed on the active KCs only (see \
+    :meth:`active_kcs`). The K2E readout stays a dense product: gathering the \
+    active columns costs about as much as it saves.
+
+    """
+    def __init__(self, mP, dt, init_cond, integrator='euler', plan=None):
+        """
+
+        Args:
+            mP (class): model_params, including connection matrices, learning rates, etc.
+            dt (float): time step (seconds).
+            init_cond (numpy array): [n x 1] starting FRs for all neurons, order-specific
+            integrator (str): [optional] 'euler' (default), 'heun' or 'exponential'.
+            plan (class): [optional] :class:`ModelPlan` of what to compute. \
+            Default everything.
+
+        >>> kernel = StepKernel( model_params, 0.02, init_cond )
+
+        """
+        if integrator not in INTEGRATORS:
+            raise ValueError('unknown integrator {!r}: expected one of {}'.format(
+                integrator, INTEGRATORS))
+        self.integrator = integrator
+        self.dtype = mP.dtype
+        self.sizes = (mP.nG, mP.nPI, mP.nG, mP.nG, mP.nK, mP.nE)
+        nP, nPI, nL, nR, nK, nE = self.sizes
+
+        # double-buffered state
+        self.old = NeuralState(_np.array(init_cond, dtype=self.dtype), self.sizes)
+        self.new = NeuralState(_np.zeros_like(self.old.y), self.sizes)
+
+        # pruned populations and pathways (see compile_model)
+        self.live = (True,)*5 if plan is None else tuple(plan.live[pop] for pop in
+            ('P', 'PI', 'L', 'R', 'K'))
+        paths = { 'L2PI' : True, 'R2PI' : True, 'PI2K' : True, 'octo2P' : True,
+            'octo2K' : True } if plan is None else plan.paths
+        self.use_L2PI, self.use_R2PI, self.use_PI2K = paths['L2PI'], paths['R2PI'], paths['PI2K']
+        self.use_octo2P, self.use_octo2K = paths['octo2P'], paths['octo2K']
+        if not self.live[1]:
+            self.new.PI[:] = self.old.PI # dead PIs are held at their initial FRs
+
+        ## loop invariants:
+        self.tau = [ mP.tau_P, mP.tau_PI, mP.tau_L, mP.tau_R, mP.tau_K ]
+        self.tau_E = mP.tau_E
+        # the slope at x = 0 = mP.slope_param*span/4, and the range is +/- span/2
+        self.slopes = [ mP.slope_param*c/4 for c in (mP.cP, mP.cPI, mP.cL, mP.cR, mP.cK) ]
+        self.half_spans = [ c/2 for c in (mP.cP, mP.cPI, mP.cL, mP.cR, mP.cK) ]
+
+        # the lateral inhibition onto P, PI, L and R all comes from the LNs: stack
+        # L2P, L2PI, L2L and L2R (in state order) into one contiguous operator,
+        # so that a single matvec gives every population's share (the L2PI rows
+        # are kept even when pruned, so pruning does not change the products)
+        self.L2 = _np.ascontiguousarray(_np.vstack((mP.L2P, _np.reshape(mP.L2PI, (nPI, -1)),
+            mP.L2L, mP.L2R)), dtype=self.dtype)
+        self.R2P = mP.R2P.squeeze()
+        self.R2PI = mP.R2PI
+        self.R2L = mP.R2L.squeeze()
+        self.F2R = mP.F2R
+        # with one RN per feature (mP.RperFFr_raw = 1) each feature drives a
+        # single RN, so F2R is a permuted diagonal: keep the RN and weight of
+        # each feature, and scatter instead of a full matvec
+        F2Rrows = _np.argmax(mP.F2R != 0, axis=0)
+        if ((mP.F2R != 0).sum(axis=0) <= 1).all():
+            self.F2Rrows = F2Rrows
+            self.F2Rweights = mP.F2R[F2Rrows, _np.arange(mP.F2R.shape[1])]
+        else:
+            self.F2Rrows = None
+        self.Rspont = mP.Rspont.squeeze()
+        self.RspontRatios = (mP.Rspont/mP.Rspont.mean()).squeeze() # used to scale stim inputs
+        self.kGlobalDampVec = mP.kGlobalDampVec.squeeze()
+
+        self.octoNegDiscount = mP.octoNegDiscount
+        self.octo2 = [ mP.octo2P.squeeze(), _np.asarray(mP.octo2PI).reshape(-1),
+            mP.octo2L.squeeze(), mP.octo2R.squeeze(), mP.octo2K.squeeze() ]
+
+        # the # st devs to give the correct sparsity
+        self.numNoOctoStds = _np.sqrt(2)*erfinv(1 - 2*mP.sparsityTarget)
+        self.numOctoStds = _np.sqrt(2)*erfinv(1 - 2*mP.octoSparsityTarget)
+
+        self.taus = _np.array(self.tau + [self.tau_E], dtype=float)
+        self.tau_vec = _np.repeat(self.taus, self.sizes).astype(self.dtype)
+        self.n_al_mb = sum(self.sizes[:5])
+
+        # noise (set by set_noise once mean spont FRs are known)
+        self.w_sig = [ mP.noisePvec.squeeze(), mP.noisePIvec.reshape(-1),
+            mP.noiseLvec.squeeze(), mP.noiseRvec.squeeze(), mP.noiseKvec.reshape(-1) ]
+        self.noise_scale = [ _np.zeros(n, dtype=self.dtype) for n in self.sizes[:5] ]
+        self.mean_spont = [ _np.zeros(n, dtype=self.dtype) for n in self.sizes[:5] ]
+
+        ## plastic weights (private copies, updated in place):
+        self.sparse = bool(mP.sparse_synapses)
+        if self.sparse:
+            # only existing synapses are stored, so the masks are implicit
+            self.P2K = SparseSynapses(mP.P2K)
+            self.PI2K = SparseSynapses(mP.PI2K) # no PIs for mnist
+            self.K2E = SparseSynapses(mP.K2E)
+        else:
+            self.P2K = mP.P2K.copy()
+            self.PI2K = mP.PI2K.copy() # no PIs for mnist
+            self.K2E = mP.K2E.copy()
+            self.P2Kmask = mP.P2K > 0
+            self.PI2Kmask = mP.PI2K > 0 # no PIs for mnist
+            self.K2Emask = mP.K2E > 0
+
+        self.heb_rates = (1/mP.heb_tau_PK, 1/mP.heb_tau_PIK, 1/mP.heb_tau_KE)
+        self.heb_time_step = mP.heb_time_step
+        self.die_back_tau_PK = mP.die_back_tau_PK
+        self.die_back_tau_PIK = mP.die_back_tau_PIK
+        self.die_back_tau_KE = mP.die_back_tau_KE
+        self.hebMaxPK, self.hebMaxPIK, self.hebMaxKE = mP.hebMaxPK, mP.hebMaxPIK, mP.hebMaxKE
+
+        # largest number of active KCs for the active-set K2E hebbian updates
+        # (the sparse K2E is already O(nnz), so it always uses the full update)
+        self.max_active_K = 0 if self.sparse else \
+            int(getattr(mP, 'active_kc_max', 0)*nK)
+
+        ## workspace:
+        self.inputs = NeuralState(_np.zeros_like(self.old.y), self.sizes) # drift inputs
+        self.tmp = NeuralState(_np.zeros_like(self.old.y), self.sizes) # scratch
+        if integrator != 'euler':
+            self.dW = _np.zeros_like(self.old.y) # Wiener increments (none for ENs)
+            self.f0 = _np.zeros_like(self.old.y) # drift at the start of the step
+        zeros = lambda shape: _np.zeros(shape, dtype=self.dtype)
+        # L2.L, with views L2P.L, L2PI.L, L2L.L and L2R.L
+        self.L2dot = zeros(len(self.L2))
+        bounds = _np.cumsum((0, nP, nPI, nL, nR))
+        self.Ldot = [ self.L2dot[a:b] for a, b in zip(bounds[:-1], bounds[1:]) ]
+        self.P2KtimesP = zeros(nK)
+        self.PI2KtimesPI = zeros(nK)
+        self.R2PItimesR = zeros(nPI)
+        self.drive = zeros(nR) # stimulus drive onto the RNs
+        self.driveTmp = zeros(nR)
+        # RN drive of the stimulus currently presented by each class, as
+        # { class : (image index, F2R.feature*RspontRatios) }
+        self.stim_drives = {}
+        if self.sparse:
+            self.dp2k = zeros(self.P2K.nnz)
+            self.dpi2k = zeros(self.PI2K.nnz)
+            self.dpi2kTmp = zeros(self.PI2K.nnz)
+            self.dpi2kZero = _np.zeros(self.PI2K.nnz, dtype=bool)
+        else:
+            self.dp2k = zeros(self.P2K.shape)
+            self.dpi2k = zeros(self.PI2K.shape)
+            self.dpi2kTmp = zeros(self.PI2K.shape)
+            self.dpi2kZero = _np.zeros(self.PI2K.shape, dtype=bool)
+        self.dk2e = zeros(nK)
+        self.dk2eTmp = zeros(nK)
+        self.dk2eZero = _np.zeros(nK, dtype=bool)
+        self.activeK = _np.zeros(nK, dtype=_np.intp) # indices of the active KCs
+        self.activeMask = _np.zeros(nK, dtype=bool)
+        self.activeKeep = _np.zeros(nK, dtype=bool) # K2E mask at the active KCs
+        self.kcIndex = _np.arange(nK, dtype=_np.intp)
+
+        # octopamine scaling vectors, [neg, pos] per population
+        self.octo = None
+        self.neg_octo = [ zeros(len(o)) for o in self.octo2 ]
+        self.pos_octo = [ zeros(len(o)) for o in self.octo2 ]
+        self.set_octo(0)
+
+        self.dt = None
+        self.set_dt(dt)
+
+    def set_dt(self, dt):
+        """
+
+        Set the time step, and the quantities that depend on it (noise \
+        amplitudes, hebbian increments, exponential integrator factors). Only \
+        recomputed when the time step changes, eg between the fine and the \
+        coarse steps of an adaptive step schedule.
+
+        Args:
+            dt (float): time step (seconds).
+
+        """
+        if dt == self.dt:
+            return
+        self.dt = dt
+        taus = self.taus
+
+        # exponential integrator: exact decay and gain over one step, and the
+        # ratio of the exact (Ornstein-Uhlenbeck) to the Euler noise amplitude
+        self.decay = _np.repeat(_np.exp(-taus*dt), self.sizes).astype(self.dtype)
+        self.gain = _np.repeat(-_np.expm1(-taus*dt)/taus, self.sizes).astype(self.dtype)
+        self.ou = _np.sqrt(-_np.expm1(-2*taus[:5]*dt)/(2*taus[:5]*dt))
+
+        self.heb_weight = None
+        self.set_heb_weight(1)
+
+        self.set_noise(self.mean_spont)
+
+    def set_heb_weight(self, weight):
+        """
+
+        Fraction of the time step with Hebbian learning (see \
+        :meth:`StimTimeline.heb`), which scales the hebbian increments and die \
+        back. Only recomputed when it changes.
+
+        Args:
+            weight (float): fraction of the step, 1 for a whole step.
+
+        """
+        if weight == self.heb_weight:
+            return
+        self.heb_weight = weight
+        self.heb_dt = weight*self.dt
+        # hebbian increments are per step (tuned for mP.heb_time_step)
+        heb_scale = self.heb_dt/self.heb_time_step
+        self.inv_heb_tau_PK, self.inv_heb_tau_PIK, self.inv_heb_tau_KE = \
+            [ rate*heb_scale for rate in self.heb_rates ]
+
+    def set_noise(self, mean_spont):
+        """
+
+        Noise amplitudes sqrt(dt)*w_sig*mean_spont_FR, recomputed only when the \
+        mean spontaneous FRs are recalibrated (or the time step changes).
+
+        Args:
+            mean_spont (list): mean spontaneous FRs of [ P, PI, L, R, K ]
+
+        """
+        self.mean_spont = mean_spont
+        for k, (scale, w, m) in enumerate(zip(self.noise_scale, self.w_sig, mean_spont)):
+            _np.multiply(_np.sqrt(self.dt)*w, m, out=scale)
+            if self.integrator == 'exponential':
+                scale *= self.ou[k]
+
+    def set_octo(self, octo):
+        """
+
+        Octopamine scaling vectors: octo increases responsivity to positive \
+        inputs and to spont firing, and decreases (to a lesser degree) \
+        responsivity to neg inputs. Only recomputed when octo changes.
+
+        Args:
+            octo (float): current octopamine level
+
+        """
+        if octo == self.octo:
+            return
+        self.octo = octo
+        for k, (o2, neg, pos) in enumerate(zip(self.octo2, self.neg_octo, self.pos_octo)):
+            _np.multiply(o2, octo, out=neg)
+            _np.add(neg, 1, out=pos)
+            if k < 4:
+                # AL neurons: negative inputs are discounted
+                neg *= self.octoNegDiscount
+            _np.subtract(1, neg, out=neg)
+            _np.maximum(neg, 0, out=neg) # pos. rectify
+        # select for either octo or no-octo
+        self.numStds = (1-octo)*self.numNoOctoStds + octo*self.numOctoStds
+
+    def set_input(self, class_mag, class_counter, feature_array, this_stim_class_ind):
+        """
+
+        Sum the RN drives of all classes presented at this time point into \
+        self.drive. This allows for simultaneous inputs by different classes, \
+        but current experiments apply only one class at a time.
+
+        Within a stimulus the drive only changes by its magnitude envelope, so \
+        the drive of each stimulus (see :meth:`stim_drive`) is computed once \
+        and then scaled.
+
+        Args:
+            class_mag (numpy array): stimulus magnitude of each class at this time point
+            class_counter (numpy array): number of presentations of each class so far
+            feature_array (numpy array): [numFeatures x numStimsPerClass x numClasses]
+            this_stim_class_ind (list): filled with the indices of the active classes
+
+        Returns
+        -------
+            stim_on (bool)
+                whether any class is presented at this time point
+
+        """
+        for j in _np.flatnonzero(class_mag):
+            imNum = int(class_counter[j] - 1) # indexing: need the '-1' so we don't run out of images
+            cached = self.stim_drives.get(j)
+            if cached is None or cached[0] != imNum:
+                cached = self.stim_drives[j] = (imNum, self.stim_drive(feature_array[:,imNum,j]))
+            if this_stim_class_ind:
+                _np.multiply(cached[1], class_mag[j], out=self.driveTmp)
+                self.drive += self.driveTmp
+            else:
+                _np.multiply(cached[1], class_mag[j], out=self.drive)
+            this_stim_class_ind.append(j)
+        return len(this_stim_class_ind) > 0
+
+    def stim_drive(self, features):
+        """
+
+        RN drive of one stimulus at unit magnitude, F2R.features scaled by the \
+        RN spontaneous FR ratios.
+
+        Args:
+            features (numpy array): [numFeatures x 1] stimulus
+
+        Returns
+        -------
+            drive (numpy array)
+                [nR x 1] drive onto the RNs
+
+        """
+        if self.F2Rrows is None:
+            drive = self.F2R.dot(features)
+        else:
+            drive = _np.bincount(self.F2Rrows, weights=self.F2Rweights*features,
+                minlength=len(self.drive))
+        drive *= self.RspontRatios
+        return drive.astype(self.dtype, copy=False)
+
+    def drift(self, src, stim_on, maxSpontP2KtimesPval):
+        """
+
+        Compute the (squashed) inputs to every population given the FRs in src. \
+        Inside the difference equations we use a piecewise linear pseudo sigmoid, \
+        rather than a true sigmoid, for speed.
+
+        Args:
+            src (class): :class:`NeuralState` to evaluate the inputs at
+            stim_on (bool): whether self.drive is nonzero
+            maxSpontP2KtimesPval (float): minimum global damping on the MB
+
+        """
+        inp, tmp = self.inputs, self.tmp
+        negP, negPI, negL, negR, negK = self.neg_octo
+        posP, posPI, posL, posR, posK = self.pos_octo
+        L2Pdot, L2PIdot, L2Ldot, L2Rdot = self.Ldot
+
+        # lateral inhibition, in one matvec
+        _np.dot(self.L2, src.L, out=self.L2dot)
+
+        # dP:
+        if self.use_octo2P:
+            _np.multiply(negP, L2Pdot, out=inp.P)
+            _np.negative(inp.P, out=inp.P)
+        else:
+            _np.negative(L2Pdot, out=inp.P)
+        _np.multiply(self.R2P, src.R, out=tmp.P)
+        if self.use_octo2P:
+            tmp.P *= posP
+        inp.P += tmp.P
+
+        # dPI: # no PIs for mnist
+        if self.live[1]:
+            _np.multiply(negPI, L2PIdot, out=inp.PI)
+            _np.negative(inp.PI, out=inp.PI)
+            if self.use_R2PI:
+                _np.dot(self.R2PI, src.R, out=self.R2PItimesR)
+            _np.multiply(self.R2PItimesR, posPI, out=tmp.PI)
+            inp.PI += tmp.PI
+
+        # dL:
+        _np.multiply(negL, L2Ldot, out=inp.L)
+        _np.negative(inp.L, out=inp.L)
+        _np.multiply(self.R2L, src.R, out=tmp.L)
+        tmp.L *= posL
+        inp.L += tmp.L
+
+        # dR:
+        # inputs: S = stim,  L = lateral neurons, mP.Rspont = spontaneous FR
+        # NOTE: octo does not affect mP.Rspont. It affects R's response to input odors.
+        _np.multiply(negR, L2Rdot, out=inp.R)
+        _np.negative(inp.R, out=inp.R)
+        if stim_on:
+            _np.multiply(self.drive, posR, out=tmp.R)
+            tmp.R += self.Rspont
+            inp.R += tmp.R
+        else:
+            inp.R += self.Rspont
+
+        # Enforce sparsity on the KCs:
+        # Global damping on KCs is controlled by mP.sparsityTarget
+        # (during octopamine, by octSparsityTarget).
+        # Assume that inputs to KCs form a gaussian, and use a threshold
+        # calculated via std devs to enforce the correct sparsity.
+        if self.sparse:
+            self.P2KtimesP[:] = self.P2K.dot(src.P)
+            if self.use_PI2K:
+                self.PI2KtimesPI[:] = self.PI2K.dot(src.PI)
+        else:
+            _np.dot(self.P2K, src.P, out=self.P2KtimesP)
+            if self.use_PI2K:
+                _np.dot(self.PI2K, src.PI, out=self.PI2KtimesPI)
+        if self.use_PI2K:
+            _np.subtract(self.P2KtimesP, self.PI2KtimesPI, out=tmp.K)
+        else:
+            _np.copyto(tmp.K, self.P2KtimesP) # (no PIs for mnist, only Ps)
+        mean = tmp.K.mean()
+        tmp.K -= mean
+        _np.multiply(tmp.K, tmp.K, out=tmp.K)
+        damper = mean + self.numStds*_np.sqrt(tmp.K.sum()/len(tmp.K))
+        # set a minimum damping based on spontaneous PN activity, so that
+        # the MB is silent absent odor
+        damper = max(damper, 1.2*maxSpontP2KtimesPval)
+
+        _np.multiply(self.kGlobalDampVec, damper, out=tmp.K)
+        if self.use_PI2K:
+            tmp.K += self.PI2KtimesPI
+        if self.use_octo2K:
+            _np.multiply(self.P2KtimesP, posK, out=inp.K)
+            tmp.K *= negK
+        else: # mP.octo2K == 0
+            _np.copyto(inp.K, self.P2KtimesP)
+        inp.K -= tmp.K # but no PIs for mnist
+
+        for x, slope, half_span, live in zip((inp.P, inp.PI, inp.L, inp.R, inp.K),
+            self.slopes, self.half_spans, self.live):
+            if not live:
+                continue
+            x *= slope
+            _np.clip(x, -half_span, half_span, out=x)
+
+        # Readout neurons E (EN = 'extrinsic neurons'):
+        # These are readouts, so there is no sigmoid.
+        # mP.octo2E == 0, since we are not stimulating ENs with octo.
+        if self.sparse:
+            inp.E[:] = self.K2E.dot(src.K)
+        else:
+            _np.dot(self.K2E, src.K, out=inp.E)
+
+    def active_kcs(self, K):
+        """
+
+        Indices of the active (nonzero) KCs, if there are few enough of them \
+        for the active-set hebbian updates to pay off.
+
+        Args:
+            K (numpy array): KC firing rates
+
+        Returns
+        -------
+            active (numpy array)
+                indices of the nonzero entries of K, or None if there are \
+                more than mP.active_kc_max of them (or the active set is not used)
+
+        """
+        if not self.max_active_K:
+            return None
+        _np.not_equal(K, 0, out=self.activeMask)
+        n = _np.count_nonzero(self.activeMask)
+        if n > self.max_active_K:
+            return None
+        active = self.activeK[:n]
+        _np.compress(self.activeMask, self.kcIndex, out=active)
+        return active
+
+    def step(self, noise, stim_on, maxSpontP2KtimesPval, advance=None):
+        """
+
+        Advance self.new from self.old with the chosen integrator, evaluating \
+        the inputs (see :meth:`drift`) as often as the scheme needs.
+
+        Args:
+            noise (list): standard normal draws for [ P, PI, L, R, K ]
+            stim_on (bool): whether self.drive is nonzero
+            maxSpontP2KtimesPval (float): minimum global damping on the MB
+            advance (function): [optional] sets the stimulus drive and \
+            octopamine at the end of the step (see :meth:`set_input` and \
+            :meth:`set_octo`) and returns its stim_on. Only used by the Heun \
+            corrector; without it, the inputs are held over the step.
+
+        """
+        self.drift(self.old, stim_on, maxSpontP2KtimesPval)
+        if self.integrator == 'euler':
+            self.euler(noise)
+        elif self.integrator == 'exponential':
+            self.exponential(noise)
+        else:
+            self.heun(noise, stim_on, maxSpontP2KtimesPval, advance)
+
+    def euler(self, noise):
+        """
+
+        Euler-Maruyama update of self.new from self.old and self.inputs. \
+        Disallows negative FRs (except for ENs, which are always non-neg).
+
+        Args:
+            noise (list): standard normal draws for [ P, PI, L, R, K ] (None \
+            for noise-free populations)
+
+        """
+        old, new, inp = self.old, self.new, self.inputs
+        pops = ('P', 'PI', 'L', 'R', 'K')
+        for pop, tau, scale, z, live in zip(pops, self.tau, self.noise_scale, noise,
+            self.live):
+            if not live:
+                continue # dead populations keep their FRs
+            y = getattr(new, pop)
+            _np.multiply(getattr(old, pop), -tau, out=y)
+            y += getattr(inp, pop)
+            y *= self.dt
+            y += getattr(old, pop)
+            # Wiener noise:
+            if z is not None:
+                z *= scale
+                y += z
+            _np.maximum(y, 0, out=y)
+
+        # dWE == 0 since we assume no noise in ENs.
+        _np.multiply(old.E, -self.tau_E, out=new.E)
+        new.E += inp.E
+        new.E *= self.dt
+        new.E += old.E
+
+    def _wiener(self, noise):
+        """
+        Scaled Wiener increments of this step, into the flat self.dW.
+        """
+        a = 0
+        for scale, z in zip(self.noise_scale, noise):
+            if z is not None: # else the increments stay zero
+                _np.multiply(z, scale, out=self.dW[a:a+len(scale)])
+            a += len(scale)
+
+    def _hold(self):
+        """
+        Copy the FRs of dead populations from self.old to self.new.
+        """
+        if not self.live[1]:
+            self.new.PI[:] = self.old.PI
+
+    def exponential(self, noise):
+        """
+
+        Exponential Euler update of self.new from self.old and self.inputs: \
+        y_new = exp(-tau*dt)*y + (1 - exp(-tau*dt))/tau*inputs + noise, with the \
+        inputs held constant over the step. Disallows negative FRs (except for ENs).
+
+        Args:
+            noise (list): standard normal draws for [ P, PI, L, R, K ]
+
+        """
+        old, new, inp = self.old, self.new, self.inputs
+        self._wiener(noise)
+        _np.multiply(old.y, self.decay, out=new.y)
+        _np.multiply(inp.y, self.gain, out=self.f0)
+        new.y += self.f0
+        new.y += self.dW
+        y = new.y[:self.n_al_mb]
+        _np.maximum(y, 0, out=y)
+        self._hold()
+
+    def heun(self, noise, stim_on, maxSpontP2KtimesPval, advance=None):
+        """
+
+        Stochastic Heun update of self.new from self.old. self.inputs must hold \
+        the inputs at self.old (see :meth:`step`); they are re-evaluated at the \
+        Euler predictor, with the stimulus and octopamine of the end of the \
+        step, and the step uses the mean of the two drifts. Disallows negative \
+        FRs (except for ENs), for the predictor and the corrector.
+
+        Args:
+            noise (list): standard normal draws for [ P, PI, L, R, K ]
+            stim_on (bool): whether self.drive is nonzero
+            maxSpontP2KtimesPval (float): minimum global damping on the MB
+            advance (function): [optional] sets the stimulus drive and \
+            octopamine at the end of the step and returns its stim_on (see \
+            :meth:`step`). Without it, a changing stimulus makes the step \
+            first order.
+
+        """
+        old, new, inp, f0 = self.old, self.new, self.inputs, self.f0
+        self._wiener(noise)
+        y = new.y[:self.n_al_mb]
+
+        # drift at the start of the step, and Euler predictor:
+        _np.multiply(old.y, self.tau_vec, out=f0)
+        _np.subtract(inp.y, f0, out=f0)
+        _np.multiply(f0, self.dt, out=new.y)
+        new.y += old.y
+        new.y += self.dW
+        _np.maximum(y, 0, out=y)
+
+        # drift at the predictor (with the inputs at the end of the step), and
+        # trapezoidal corrector:
+        if advance is not None:
+            stim_on = advance()
+        self.drift(new, stim_on, maxSpontP2KtimesPval)
+        _np.multiply(new.y, self.tau_vec, out=new.y)
+        _np.subtract(inp.y, new.y, out=new.y)
+        new.y += f0
+        new.y *= self.dt/2
+        new.y += old.y
+        new.y += self.dW
+        _np.maximum(y, 0, out=y)
+        self._hold()
+
+    def fixed_point(self, stim_on, maxSpontP2KtimesPval, damping=0.5, tol=1e-10,
+        max_iter=10000):
+        """
+
+        Noise-free steady state under constant input, by damped fixed-point \
+        iteration of y = max(inputs(y)/tau, 0) (no rectification for ENs). \
+        Like a time step, it starts from self.old and writes to self.new.
+
+        Args:
+            stim_on (bool): whether self.drive is nonzero
+            maxSpontP2KtimesPval (float): minimum global damping on the MB
+            damping (float): [optional] weight of each new iterate (1 = undamped).
+            tol (float): [optional] convergence threshold on the largest change, \
+            relative to the largest FR.
+            max_iter (int): [optional] maximum number of iterations.
+
+        Returns
+        -------
+            iterations (int)
+                number of iterations done
+
+        """
+        for it in range(1, max_iter+1):
+            old, new = self.old, self.new
+            self.drift(old, stim_on, maxSpontP2KtimesPval)
+            _np.divide(self.inputs.y, self.tau_vec, out=new.y)
+            y = new.y[:self.n_al_mb]
+            _np.maximum(y, 0, out=y)
+            new.y -= old.y
+            change = _np.abs(new.y).max()
+            new.y *= damping
+            new.y += old.y
+            self._hold()
+            self.swap()
+            if change <= tol*max(_np.abs(new.y).max(), 1):
+                break
+        self.swap() # the result is the new state
+        return it
+
+    def swap(self):
+        """
+        Make the newly computed state the current state (by reference).
+        """
+        self.old, self.new = self.new, self.old
+
+    def hebbian(self, this_stim_class_ind):
+        """
+
+        Apply Hebbian learning to P2K, PI2K, K2E, using 'new' K and 'old' P, and \
+        'new' E and 'old' K, ie 1 timestep of delay. Growth in K2E is restricted \
+        to connections into the EN of the training stimulus.
+
+        Args:
+            this_stim_class_ind (list): indices of the classes being presented
+
+        """
+        old, new, dt = self.old, self.new, self.heb_dt
+        # the PN contribution to hebbian is based on raw FR;
+        # new.K is already non-neg
+
+        ## dP2K:
+        if self.sparse:
+            self.P2K.outer(new.K, old.P, self.inv_heb_tau_PK, out=self.dp2k)
+            P2K, PI2K = self.P2K.data, self.PI2K.data
+        else:
+            _np.multiply.outer(new.K, old.P, out=self.dp2k)
+            self.dp2k *= self.inv_heb_tau_PK
+            self.dp2k *= self.P2Kmask #  if original synapse does not exist, it will never grow
+            P2K, PI2K = self.P2K, self.PI2K
+
+        # decay some P2K connections if wished: (not used for mnist experiments)
+        if self.die_back_tau_PK > 0:
+            P2K *= -(1/self.die_back_tau_PK)*dt
+
+        P2K += self.dp2k
+        _np.clip(P2K, 0, self.hebMaxPK, out=P2K)
+
+        ## dPI2K: # no PIs for mnist
+        if self.use_PI2K:
+            if self.sparse:
+                self.PI2K.outer(new.K, old.PI, self.inv_heb_tau_PIK, out=self.dpi2k)
+            else:
+                _np.multiply.outer(new.K, old.PI, out=self.dpi2k)
+                self.dpi2k *= self.inv_heb_tau_PIK
+                self.dpi2k *= self.PI2Kmask # if original synapse does not exist, it will never grow
+
+            # kill small increases:
+            # (this detour prevents dividing by zero)
+            _np.equal(PI2K, 0, out=self.dpi2kZero)
+            _np.copyto(self.dpi2kTmp, PI2K)
+            _np.copyto(self.dpi2kTmp, 1, where=self.dpi2kZero)
+            _np.divide(self.dpi2k, self.dpi2kTmp, out=self.dpi2kTmp)
+            self.dpi2k *= self.dpi2kTmp
+            if self.die_back_tau_PIK > 0:
+                _np.multiply(PI2K, (1/self.die_back_tau_PIK)*dt, out=self.dpi2kTmp)
+                PI2K -= self.dpi2kTmp
+            PI2K += self.dpi2k
+            _np.clip(PI2K, 0, self.hebMaxPIK, out=PI2K)
+
+        ## dK2E:
+        # restrict changes to just the i'th row of mP.K2E, where i = ind of training stim
+        active = self.active_kcs(old.K) if this_stim_class_ind else None
+        for row in this_stim_class_ind:
+            if self.sparse:
+                syn = self.K2E.row_slice(row)
+                w = self.K2E.data[syn]
+                dk2e = self.dk2e[:len(w)]
+                _np.take(old.K, self.K2E.cols[syn], out=dk2e)
+                dk2e *= new.E[row]
+            elif active is not None:
+                # increments only for the active KCs (the others are zero)
+                self._hebbian_active_row(row, active, new.E[row], dt)
+                continue
+            else:
+                w = self.K2E[row]
+                dk2e = self.dk2e
+                _np.multiply(new.E[row], old.K, out=dk2e)
+            dk2e *= self.inv_heb_tau_KE
+            if not self.sparse:
+                dk2e *= self.K2Emask[row]
+
+            # inactive connections for this EN die back:
+            if self.die_back_tau_KE:
+                tmp, zero = self.dk2eTmp[:len(w)], self.dk2eZero[:len(w)]
+                _np.equal(dk2e, 0, out=zero)
+                _np.add(w, 2, out=tmp)
+                tmp *= 1/self.die_back_tau_KE
+                tmp *= dt
+                tmp *= zero
+                # the '+1' allows weights to die to absolute 0
+                w -= tmp
+
+            w += dk2e
+            _np.clip(w, 0, self.hebMaxKE, out=w)
+
+    def _hebbian_active_row(self, row, active, e, dt):
+        """
+        K2E hebbian update of one EN row, given the indices of the active KCs \
+        (see :meth:`hebbian`).
+        """
+        w = self.K2E[row]
+        dk2e = self.dk2e[:len(active)]
+        _np.take(self.old.K, active, out=dk2e)
+        dk2e *= e
+        dk2e *= self.inv_heb_tau_KE
+        keep = self.activeKeep[:len(active)]
+        _np.take(self.K2Emask[row], active, out=keep)
+        dk2e *= keep
+
+        # inactive connections for this EN die back: all inactive KCs, and the
+        # active ones with a zero increment
+        if self.die_back_tau_KE:
+            zero = self.dk2eZero
+            zero.fill(True)
+            _np.equal(dk2e, 0, out=keep)
+            zero[active] = keep
+            _np.add(w, 2, out=self.dk2eTmp)
+            self.dk2eTmp *= 1/self.die_back_tau_KE
+            self.dk2eTmp *= dt
+            self.dk2eTmp *= zero
+            w -= self.dk2eTmp
+            w[active] += dk2e
+            _np.clip(w, 0, self.hebMaxKE, out=w)
+        else:
+            w[active] = _np.clip(w.take(active) + dk2e, 0, self.hebMaxKE)
+
+    def final_weights(self):
+        """
+        Dense copies of the final P2K and K2E connection matrices.
+        """
+        if self.sparse:
+            return self.P2K.toarray(), self.K2E.toarray()
+        return self.P2K.copy(), self.K2E.copy()
+
+    def weights(self):
+        """
+
+        Copies of the plastic weights as stored (dense matrices, or the values \
+        of the stored synapses if sparse), eg for checkpoints.
+
+        Returns
+        -------
+            weights (dict)
+                'P2K', 'PI2K' and 'K2E' arrays
+
+        """
+        return { name : (w.data if self.sparse else w).copy() for name, w in
+            (('P2K', self.P2K), ('PI2K', self.PI2K), ('K2E', self.K2E)) }
+
+    def load_weights(self, weights):
+        """
+
+        Overwrite the plastic weights in place with a copy from :meth:`weights`.
+
+        Args:
+            weights (dict): 'P2K', 'PI2K' and 'K2E' arrays
+
+        """
+        for name in ('P2K', 'PI2K', 'K2E'):
+            w = getattr(self, name)
+            target = w.data if self.sparse else w
+            if target.shape != weights[name].shape:
+                raise ValueError('{} weights have shape {}, expected {}'.format(
+                    name, weights[name].shape, target.shape))
+            target[...] = weights[name]
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
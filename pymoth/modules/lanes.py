@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: lanes
+   :platform: Unix
+   :synopsis: Frozen-weight inference, with each stimulus simulated as a parallel lane.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+from ..modules.kernel import StepKernel
+from ..modules.rng import make_rng, NoiseBlock
+from ..modules.stream import stim_windows
+from ..modules.timeline import StimTimeline, time_vector
+from ..modules.sde import initial_conditions
+
+def calibrate_spont( model_params, exp_params, rng=None, time_step=2*0.01 ):
+    """
+    Runs the spontaneous (stimulus-free) start of a simulation through the \
+    three-stage noise calibration of :func:`sde_evo_mnist`, and returns the \
+    calibrated state. The spontaneous FR means are accumulated as running \
+    sums, so no timecourses are stored.
+
+    Args:
+        model_params (class): object with connection matrices, etc.
+        exp_params (class): object with timing info about experiment, eg when stimuli are given.
+        rng (Generator or int): [optional] random number generator (or seed) for \
+        the neural noise. Defaults to exp_params.rng.
+        time_step (float): [optional] simulation time step (seconds).
+
+    Returns
+    -------
+        spont (dict)
+            y (numpy array)
+                FRs [ P, PI, L, R, K, E ] at the end of the calibration
+            step (int)
+                index of that timepoint in the time vector
+            T (float)
+                that timepoint (seconds), ie the first one after stopSpontMean3
+            mean_spont (list)
+                mean spontaneous FRs of [ P, PI, L, R, K ] that set the noise
+            ssMeanSpontP, ssStdSpontP (numpy array)
+                steady state mean and std of the spontaneous PN FRs
+            maxSpontP2KtimesPval (float)
+                minimum global damping on the MB
+
+    >>> spont = calibrate_spont(model_params, exp_params)
+
+    """
+    mP, exP = model_params, exp_params
+    rng = exP.rng if rng is None else make_rng(rng)
+    time = time_vector(exP, time_step)
+    dt = round(time[1] - time[0], 10)
+
+    kernel = StepKernel(mP, dt, initial_conditions(mP))
+    pop_sizes = kernel.sizes[:5]
+    noise = NoiseBlock(rng, pop_sizes, dtype=mP.dtype)
+
+    # running sums over the three spontaneous windows (see sde_evo_ensemble)
+    windows = [ (exP.startPreNoiseSpontMean1, exP.stopPreNoiseSpontMean1),
+                (exP.startSpontMean2, exP.stopSpontMean2),
+                (exP.startSpontMean3, exP.stopSpontMean3) ]
+    win_sums = [ [ _np.zeros(n) for n in pop_sizes ] for _ in windows ]
+    win_counts = [0]*len(windows)
+    win_sum_sq_P = _np.zeros(pop_sizes[0]) # for ssStdSpontP
+    means = lambda w: [ s/win_counts[w] for s in win_sums[w] ]
+
+    # placeholder until we have an estimate based on spontaneous PN firing rates
+    maxSpontP2KtimesPval = 10
+    stage = 0
+    for n, t in enumerate(time):
+        old = kernel.old
+        for w, (start, stop) in enumerate(windows):
+            if start < t < stop:
+                for s, x in zip(win_sums[w], (old.P, old.PI, old.L, old.R, old.K)):
+                    s += x
+                win_counts[w] += 1
+                if w == 2:
+                    win_sum_sq_P += old.P**2
+
+        # the stages end as in sde_evo_mnist
+        if stage == 0 and t > exP.stopPreNoiseSpontMean1:
+            kernel.set_noise(means(0))
+            stage = 1
+        if stage == 1 and t > exP.stopSpontMean2:
+            kernel.set_noise(means(1))
+            stage = 2
+        if stage == 2 and t > exP.stopSpontMean3:
+            break
+
+        kernel.step(noise.next(), False, maxSpontP2KtimesPval)
+        kernel.swap()
+    else:
+        raise ValueError('the simulation ends before the noise calibration (stopSpontMean3)')
+
+    ssMeanSpontP = win_sums[2][0]/win_counts[2] # 'ss' means steady state
+    ssStdSpontP = _np.sqrt(_np.maximum(win_sum_sq_P/win_counts[2] - ssMeanSpontP**2, 0))
+    temp = _np.sort(mP.P2K.dot(ssMeanSpontP))
+    maxSpontP2KtimesPval = temp[:-1].max() # ignore the top outlier K input
+
+    return { 'y' : kernel.old.y.copy(), 'step' : n, 'T' : time[n],
+        'mean_spont' : kernel.mean_spont, 'ssMeanSpontP' : ssMeanSpontP,
+        'ssStdSpontP' : ssStdSpontP, 'maxSpontP2KtimesPval' : maxSpontP2KtimesPval }
+
+def sde_lanes( model_params, exp_params, feature_array, P2K=None, K2E=None, rng=None,
+    time_step=2*0.01, phases=('baseline', 'val'), settle=1, max_lanes=256, spont=None ):
+    """
+    Frozen-weight inference: simulates the baseline and validation stimuli of \
+    an experiment as independent parallel lanes of one batched state matrix.
+
+    Outside the training window P2K and K2E are frozen, and the stimuli are \
+    far enough apart for the network to return to its spontaneous state, so \
+    they are effectively independent trials. Each lane starts from the \
+    calibrated spontaneous state (see :func:`calibrate_spont`) 'settle' \
+    seconds before its response window (+/- 1 sec around the stimulus start, \
+    as in :func:`collect_stats`), with its own Wiener noise, and is stepped \
+    with Euler-Maruyama (as :func:`sde_evo_mnist`) to the end of the window. \
+    Each step is a handful of matrix-matrix products over all lanes.
+
+    Args:
+        model_params (class): object with connection matrices, etc.
+        exp_params (class): object with timing info about experiment, eg when stimuli are given.
+        feature_array (numpy array): stimuli (numFeatures x numStimsPerClass x numClasses).
+        P2K, K2E (numpy array): [optional] trained connection matrices for the \
+        validation stimuli (eg sim_results['P2Kfinal'] and sim_results['K2Efinal']). \
+        Default model_params.P2K and model_params.K2E. Baseline stimuli always \
+        use the model_params weights.
+        rng (Generator or int): [optional] random number generator (or seed) for \
+        the neural noise. Defaults to exp_params.rng.
+        time_step (float): [optional] simulation time step (seconds).
+        phases (tuple): [optional] phases of the stimuli to simulate.
+        settle (float): [optional] seconds each lane runs before its response \
+        window, so that the noise of the lanes decorrelates.
+        max_lanes (int): [optional] number of lanes stepped together.
+        spont (dict): [optional] calibrated spontaneous state. Default \
+        :func:`calibrate_spont` (with the same rng and time_step).
+
+    Returns
+    -------
+        lane_results (dict)
+            index (numpy array)
+                index in exp_params.stimStarts of the stimulus of each lane
+            phase (list)
+                phase of each lane, 'baseline' or 'val'
+            peaks (numpy array)
+                [lanes x nE] peak EN responses in each window
+            pre_train_resp, post_train_resp (numpy array)
+                [nE x numStims] peak EN responses to the baseline and \
+                validation stimuli, -1 for other stimuli (as in :func:`collect_stats`)
+
+    >>> lane_results = sde_lanes(model_params, exp_params, feature_array,
+    ...     sim_results['P2Kfinal'], sim_results['K2Efinal'])
+
+    """
+    mP, exP = model_params, exp_params
+    rng = exP.rng if rng is None else make_rng(rng)
+    time = time_vector(exP, time_step)
+    dt = round(time[1] - time[0], 10)
+    if spont is None:
+        spont = calibrate_spont(mP, exP, rng, time_step)
+
+    # the stimuli (presented without octopamine, as in collect_stats)
+    timeline = StimTimeline(exP, time)
+    event = { k : e for e, k in enumerate(timeline.stims.index) }
+    windows = [ w for w in stim_windows(exP) if w['phase'] in phases and w['index'] in event ]
+    onsets = _np.searchsorted(time, [ w['onset'] for w in windows ])
+    windows = [ w for w, octo in zip(windows, timeline.octo_course(onsets)) if octo == 0 ]
+
+    weights = { 'baseline' : (mP.P2K, mP.K2E),
+        'val' : (mP.P2K if P2K is None else P2K, mP.K2E if K2E is None else K2E) }
+    if set(phases) - set(weights):
+        raise ValueError('only the frozen-weight phases {} can run as lanes, got {}'.format(
+            tuple(weights), phases))
+
+    kernel = StepKernel(mP, dt, spont['y'])
+    kernel.set_noise(spont['mean_spont'])
+
+    peaks = _np.zeros((len(windows), mP.nE))
+    settle_steps = int(round(settle/dt))
+    for phase in phases:
+        lanes = [ k for k, w in enumerate(windows) if w['phase'] == phase ]
+        for a in range(0, len(lanes), max_lanes):
+            chunk = lanes[a:a+max_lanes]
+            peaks[chunk] = _step_lanes(kernel, spont, timeline, feature_array,
+                [ windows[k] for k in chunk ], [ event[windows[k]['index']] for k in chunk ],
+                time, settle_steps, rng, *weights[phase])
+
+    # per EN, in the layout of collect_stats
+    pre_train_resp = -_np.ones((mP.nE, len(exP.stimStarts)))
+    post_train_resp = -_np.ones((mP.nE, len(exP.stimStarts)))
+    for k, w in enumerate(windows):
+        resp = pre_train_resp if w['phase'] == 'baseline' else post_train_resp
+        resp[:, w['index']] = peaks[k]
+
+    return { 'index' : _np.array([ w['index'] for w in windows ], dtype=int),
+        'phase' : [ w['phase'] for w in windows ], 'peaks' : peaks,
+        'pre_train_resp' : pre_train_resp, 'post_train_resp' : post_train_resp }
+
+def _step_lanes( kernel, spont, timeline, feature_array, windows, events, time,
+    settle_steps, rng, P2K, K2E ):
+    """
+    Steps one batch of lanes (see :func:`sde_lanes`) through their windows, \
+    and returns their [lanes x nE] peak EN responses.
+    """
+    B = len(windows)
+    nP, nPI, nL, nR, nK, nE = kernel.sizes
+    dtype = kernel.dtype
+
+    # step indices: [first, stop) response window, starting settle_steps earlier
+    first = _np.searchsorted(time, [ w['start'] for w in windows ], 'right')
+    stop = _np.searchsorted(time, [ w['stop'] for w in windows ], 'left')
+    start = _np.maximum(first - settle_steps, 0)
+    W = int((stop - start).max())
+
+    # each lane's stimulus drive at unit magnitude
+    drive = _np.stack([ kernel.stim_drive(feature_array[:, timeline.stim_image[e]-1,
+        timeline.stim_class[e]]) for e in events ])
+    events = _np.array(events)
+
+    # state [lanes x n], all lanes from the calibrated spontaneous state
+    Y = _np.tile(_np.asarray(spont['y'], dtype=dtype), (B, 1))
+    bounds = _np.cumsum(kernel.sizes)[:-1]
+    P, PI, L, R, K, E = _np.split(Y, bounds, axis=1)
+    L2bounds = _np.cumsum((nP, nPI, nL))
+    PI2K = kernel.PI2K.toarray() if kernel.sparse else kernel.PI2K # frozen
+    PI2K = _np.asarray(PI2K).reshape(nK, -1)
+    R2PI = _np.asarray(kernel.R2PI).reshape(nPI, -1)
+    dt = kernel.dt
+    min_damper = 1.2*spont['maxSpontP2KtimesPval']
+
+    noise = NoiseBlock(rng, [ (B, n) for n in (nP, nPI, nL, nR, nK) ], block_steps=16,
+        dtype=dtype)
+    peaks = _np.full((B, nE), -_np.inf)
+    for j in range(W):
+        i = start + j
+
+        # inputs, as StepKernel.drift without octopamine:
+        L2P_L, L2PI_L, L2L_L, L2R_L = _np.split(L.dot(kernel.L2.T), L2bounds, axis=1)
+        Pin = kernel.R2P*R - L2P_L
+        PIin = R.dot(R2PI.T) - L2PI_L
+        Lin = kernel.R2L*R - L2L_L
+        mags = timeline.stims.envelopes(events, i)[:, None]
+        Rin = mags*drive + kernel.Rspont - L2R_L
+
+        # KC sparsity: damping from the mean and std of the inputs of each lane
+        P2KtimesP = P.dot(P2K.T)
+        PI2KtimesPI = PI.dot(PI2K.T)
+        Kinput = P2KtimesP - PI2KtimesPI
+        damper = Kinput.mean(axis=1, keepdims=True) + \
+            kernel.numNoOctoStds*Kinput.std(axis=1, keepdims=True)
+        damper = _np.maximum(damper, min_damper)
+        Kin = P2KtimesP - (damper*kernel.kGlobalDampVec + PI2KtimesPI)
+
+        Ein = K.dot(K2E.T)
+
+        # Euler-Maruyama, disallowing negative FRs (except for ENs):
+        for x, inp, tau, slope, half_span, scale, z in zip((P, PI, L, R, K),
+            (Pin, PIin, Lin, Rin, Kin), kernel.tau, kernel.slopes, kernel.half_spans,
+            kernel.noise_scale, noise.next()):
+            inp *= slope
+            _np.clip(inp, -half_span, half_span, out=inp)
+            inp -= tau*x
+            inp *= dt
+            x += inp
+            x += scale*z
+            _np.maximum(x, 0, out=x)
+        E += dt*(Ein - kernel.tau_E*E)
+
+        in_window = (i >= first) & (i < stop)
+        peaks = _np.where(in_window[:, None], _np.maximum(peaks, E), peaks)
+
+    return peaks
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
@@ -12,7 +12,7 @@
 
 # import packages
 import numpy as _np
-import numpy.random as r
+from ..modules.rng import make_rng
 
 class ModelParams:
 	"""
@@ -49,7 +49,7 @@ class ModelParams:
 	interconnections, PNs, and RNs are indexed according to the G.
 
 	"""
-	def __init__(self, nF, goal):
+	def __init__(self, nF, goal, rng=None):
 		"""
 
 		Args:
@@ -58,6 +58,8 @@ class ModelParams:
 			goal (int): measure of learning rate (goal = N means we expect the moth \
 			to hit max accuracy when trained on N samples per class. ie goal = 1 \
 			gives a fast learner, goal = 20 gives a slower learner).
+			rng (Generator or int): [optional] random number generator (or seed) \
+			used to draw the connection matrices. See :func:`make_rng`.
 
 		Returns
 		-------
@@ -70,6 +72,7 @@ class ModelParams:
 
 		self.nF = nF
 		self.goal = goal
+		self.rng = make_rng(rng) # draws connection matrices, noise vectors, etc
 
 		self.nG = nF
 		self.nP = self.nG # Pn = n of excitatory Pn. (one per glomerulus)
@@ -107,6 +110,11 @@ class ModelParams:
 		# weights, and subtract.
 		self.die_back_tau_PIK = 0 # no PIs in mnist moths (no PIs for mnist)
 
+		# The hebbian increments above are applied once per time step, and were tuned
+		# for this step size. With other step sizes they are scaled by dt/heb_time_step,
+		# so that the learning per second of stimulus stays the same.
+		self.heb_time_step = 2*0.01
+
 		#-------------------------------------------------------------------------------
 
 		## Time constants for the diff eqns
@@ -379,6 +387,22 @@ class ModelParams:
 		# Pre-allocate connection matrix attributes for later
 		self.trueClassLabels = None
 		self.saveAllNeuralTimecourses = None
+		# if set, saveAllNeuralTimecourses writes the timecourses to memory-mapped
+		# .npy files in this run directory instead of RAM
+		self.timecourse_dir = None
+
+		# store P2K, PI2K and K2E as sparse matrices during simulation, so that
+		# forward products and hebbian updates only touch existing synapses
+		self.sparse_synapses = False
+
+		# KC activity is sparse (see sparsityTarget): while at most this fraction of
+		# the KCs are active, the K2E hebbian updates only gather the active KCs
+		# (0 always uses the full updates)
+		self.active_kc_max = 0.25
+
+		# floating point precision of the neural states and connection matrices
+		# during simulation (eg numpy.float32 roughly halves the memory traffic)
+		self.dtype = _np.float64
 
 	def create_connection_matrix(self):
 		"""
@@ -401,7 +425,7 @@ class ModelParams:
 
 		# first make a binary mask S2Rbinary
 		if self.RperFFr_mu > 0:
-			self.F2Rbinary = r.rand(self.nR, self.nF) < self.RperSFr_mu # 1s and 0s
+			self.F2Rbinary = self.rng.random((self.nR, self.nF)) < self.RperSFr_mu # 1s and 0s
 			# DEV NOTE: The following flag doesn't exist - remove? Check w/ CBD
 			if self.makeFeaturesOrthogonalFlag:
 				# remove any overlap in the active odors, by keeping only one non-zero entry in each row
@@ -410,7 +434,7 @@ class ModelParams:
 					row = b[i,:]
 					if row.sum() > 1:
 						c = _np.nonzero(row==1)[0]
-						t = _np.ceil(r.rand(1, c)) # pick one index to be non-zero
+						t = _np.ceil(self.rng.random((1, c))) # pick one index to be non-zero
 						b[i,:] = 0
 						b[i,c[t]] = 1
 				self.F2Rbinary = b
@@ -424,12 +448,12 @@ class ModelParams:
 			for i in range(self.RperFFr_raw):
 				for j in range(self.nF):
 					inds = _np.nonzero(counts < maxFperR)[0]
-					a = _np.random.randint(len(inds))
+					a = self.rng.integers(len(inds))
 					counts[inds[a]] += 1
 					self.F2Rbinary[inds[a],j] = 1
 
 		# now mask a matrix of gaussian weights
-		rand_mat = r.normal(0,1,self.F2Rbinary.shape)
+		rand_mat = self.rng.normal(0,1,self.F2Rbinary.shape)
 		# Note: S (stimuli) for odor case is replaced by F (features) for MNIST version
 		self.F2R = ( self.F2R_mu*self.F2Rbinary + self.F2R_std*rand_mat )*self.F2Rbinary # the last term ensures 0s stay 0s
 		self.F2R = _np.maximum(0, self.F2R) # to prevent any negative weights
@@ -437,28 +461,28 @@ class ModelParams:
 		# spontaneous FRs for Rs
 		if self.spontRdistFlag==1: # case: gaussian distribution
 			#  steady-state RN FR, base + noise:
-			self.Rspont = self.spontR_mu*_np.ones((self.nG, 1)) + self.spontR_std*r.normal(0,1,(self.nG,1))
+			self.Rspont = self.spontR_mu*_np.ones((self.nG, 1)) + self.spontR_std*self.rng.normal(0,1,(self.nG,1))
 			self.Rspont = _np.maximum(0, self.Rspont)
 		else: # case: 2 gamma distribution
 			a = self.spontR_mu/self.spontR_std
 			b = self.spontR_mu/a # spontR_std
-			g = _np.random.gamma(a, scale=b, size=(self.nG,1))
+			g = self.rng.gamma(a, scale=b, size=(self.nG,1))
 			self.Rspont = self.spontRbase + g
 
 		# R2G connection vector: nG x 1 col vector
-		self.R2G = self.R2G_mu*_np.ones((self.nG, 1)) + self.R2G_std*r.normal(0,1,(self.nG,1)) # col vector,
+		self.R2G = self.R2G_mu*_np.ones((self.nG, 1)) + self.R2G_std*self.rng.normal(0,1,(self.nG,1)) # col vector,
 		# each entry is strength of an R in its G. the last term prevents negative R2G effects
 
 		# now make R2P, etc, all are cols nG x 1
-		self.R2P = ( self.R2P_mult + self.R2P_std*r.normal(0,1,(self.nG,1)) )*self.R2G
-		self.R2L = ( self.R2L_mult + self.R2L_std*r.normal(0,1,(self.nG,1)) )*self.R2G
+		self.R2P = ( self.R2P_mult + self.R2P_std*self.rng.normal(0,1,(self.nG,1)) )*self.R2G
+		self.R2L = ( self.R2L_mult + self.R2L_std*self.rng.normal(0,1,(self.nG,1)) )*self.R2G
 
 		# this interim nG x 1 col vector gives the effect of each R on any PI in the R's glom.
-		self.R2PIcol = ( self.R2PI_mult + self.R2PI_std*r.normal(0,1,(self.nG,1)) )*self.R2G
+		self.R2PIcol = ( self.R2PI_mult + self.R2PI_std*self.rng.normal(0,1,(self.nG,1)) )*self.R2G
 		# It will be used below with G2PI to get full effect of Rs on PIs
 
 		# Construct L2G = nG x nG matrix of lateral neurons. This is a precursor to L2P etc
-		self.L2G = self.L2G_mu + self.L2G_std*r.normal(0,1,(self.nG, self.nG))
+		self.L2G = self.L2G_mu + self.L2G_std*self.rng.normal(0,1,(self.nG, self.nG))
 		self.L2G = _np.maximum(0, self.L2G) # kill any vals < 0
 		self.L2G -= _np.diag(_np.diag(self.L2G)) # set diagonal = 0
 
@@ -467,7 +491,7 @@ class ModelParams:
 		numToKill = _np.floor( (1-self.L2Gfr)*(self.nG**2 - self.nG) - numZero )
 		if numToKill > 0: # case: we need to set more vals to 0 to satisfy frLN constraint
 			self.L2G = self.L2G.flatten()
-			randList = r.rand(*self.L2G.shape) < numToKill/(self.nG**2 - self.nG - numZero)
+			randList = self.rng.random(self.L2G.shape) < numToKill/(self.nG**2 - self.nG - numZero)
 			self.L2G[(self.L2G > 0) & (randList == 1)] = 0
 
 		self.L2G = self.L2G.reshape((self.nG,self.nG), order="F") # using Fortran order (as MATLAB does)
@@ -477,25 +501,25 @@ class ModelParams:
 
 		# gloms vary widely in their sensitivity to gaba (Hong, Wilson 2014).
 		# multiply the L2* vectors by Gsens + Gsens_std:
-		gabaSens = self.Gsens_mu + self.Gsens_std*r.normal(0,1,(self.nG,1))
+		gabaSens = self.Gsens_mu + self.Gsens_std*self.rng.normal(0,1,(self.nG,1))
 		L2GgabaSens = self.L2G * _np.tile( gabaSens, (1, self.nG) ) # ie each row is multiplied by a different value,
 			# since each row represents a destination glom
 		# this version of L2G does not encode variable sens to gaba, but is scaled by Gsens_mu:
 		self.L2G *= self.Gsens_mu
 
 		# now generate all the L2etc matrices:
-		self.L2R = _np.maximum(0,  self.L2R_mult + self.L2R_std*r.normal(0,1,(self.nG,self.nG)) ) * L2GgabaSens
+		self.L2R = _np.maximum(0,  self.L2R_mult + self.L2R_std*self.rng.normal(0,1,(self.nG,self.nG)) ) * L2GgabaSens
 		 # the last term will keep 0 entries = 0
-		self.L2P = _np.maximum(0,  self.L2P_mult + self.L2P_std*r.normal(0,1,(self.nG,self.nG)) ) * L2GgabaSens
-		self.L2L = _np.maximum(0,  self.L2L_mult + self.L2L_std*r.normal(0,1,(self.nG,self.nG)) ) * L2GgabaSens
-		self.L2PI = _np.maximum(0,  self.L2L_mult + self.L2PI_std*r.normal(0,1,(self.nG,self.nG)) ) * L2GgabaSens
+		self.L2P = _np.maximum(0,  self.L2P_mult + self.L2P_std*self.rng.normal(0,1,(self.nG,self.nG)) ) * L2GgabaSens
+		self.L2L = _np.maximum(0,  self.L2L_mult + self.L2L_std*self.rng.normal(0,1,(self.nG,self.nG)) ) * L2GgabaSens
+		self.L2PI = _np.maximum(0,  self.L2L_mult + self.L2PI_std*self.rng.normal(0,1,(self.nG,self.nG)) ) * L2GgabaSens
 		 # Masked by G2PI later (no PIs for mnist)
 
 		# Ps (excitatory):
-		P2KconnMatrix = r.rand(self.nK, self.nP) < self.KperPfr_mu # each col is a P, and a fraction of the entries will = 1
+		P2KconnMatrix = self.rng.random((self.nK, self.nP)) < self.KperPfr_mu # each col is a P, and a fraction of the entries will = 1
 		 # different cols (PNs) will have different numbers of 1's (~binomial dist)
 
-		self.P2K = _np.maximum(0,  self.P2K_mu + self.P2K_std*r.normal(0,1,(self.nK, self.nP)) ) # all >= 0
+		self.P2K = _np.maximum(0,  self.P2K_mu + self.P2K_std*self.rng.normal(0,1,(self.nK, self.nP)) ) # all >= 0
 		self.P2K *= P2KconnMatrix
 		# cap P2K values at hebMaxP2K, so that hebbian training never decreases wts:
 		self.P2K[self.P2K > self.hebMaxPK] = self.hebMaxPK
@@ -513,8 +537,8 @@ class ModelParams:
 		# 2. b) Multiply the binary map by a random matrix to get the synapse weights.
 
 		# In the moth, each PI is fed by many gloms
-		self.G2PIconn = r.rand(self.nPI, self.nG) < self.GperPI_fr_mu # step 1a
-		self.G2PI = _np.maximum(0, self.G2PI_std*r.normal(0,1,(self.nPI,self.nG)) + self.G2PI_mu) # step 1b
+		self.G2PIconn = self.rng.random((self.nPI, self.nG)) < self.GperPI_fr_mu # step 1a
+		self.G2PI = _np.maximum(0, self.G2PI_std*self.rng.normal(0,1,(self.nPI,self.nG)) + self.G2PI_mu) # step 1b
 		self.G2PI *= self.G2PIconn # mask with double values, step 1b (cont)
 		self.G2PI /= _np.tile(self.G2PI.sum(axis=1).reshape(-1, 1),(1, self.G2PI.shape[1]))
 		# no PIs for mnist
@@ -528,8 +552,8 @@ class ModelParams:
 		# eg, the cols with non-zero entries in the i'th row of R2PI are those Rs feeding gloms that feed the i'th PI.
 
 		if self.nPI>0:
-			self.PI2Kconn = r.rand(self.nK, self.nPI) < self.KperPI_fr_mu # step 2a
-			self.PI2K = _np.maximum(0, self.PI2K_mu + self.PI2K_std*r.normal(0,1,(self.nK,self.nPI))) # step 2b
+			self.PI2Kconn = self.rng.random((self.nK, self.nPI)) < self.KperPI_fr_mu # step 2a
+			self.PI2K = _np.maximum(0, self.PI2K_mu + self.PI2K_std*self.rng.normal(0,1,(self.nK,self.nPI))) # step 2b
 			self.PI2K *= self.PI2Kconn # mask
 			self.PI2K[self.PI2K > self.hebMaxPIK] = self.hebMaxPIK
 
@@ -542,25 +566,25 @@ class ModelParams:
 	#-------------------------------------------------------------------------------
 
 		# K2E (excit):
-		self.K2EconnMatrix = r.rand(self.nE, self.nK) < self.KperEfr_mu # each col is a K, and a fraction of the entries will = 1.
+		self.K2EconnMatrix = self.rng.random((self.nE, self.nK)) < self.KperEfr_mu # each col is a K, and a fraction of the entries will = 1.
 		#    different cols (KCs) will have different numbers of 1's (~binomial dist).
 
-		self.K2E = _np.maximum(0,  self.K2E_mu + self.K2E_std*r.normal(0,1,(self.nE,self.nK)) ) # all >= 0
+		self.K2E = _np.maximum(0,  self.K2E_mu + self.K2E_std*self.rng.normal(0,1,(self.nE,self.nK)) ) # all >= 0
 		self.K2E = _np.multiply(self.K2E, self.K2EconnMatrix)
 		self.K2E[self.K2E > self.hebMaxKE] = self.hebMaxKE
 		# K2E maps from the KCs to the ENs. Given firing rates KC, K2E gives the effect on the various ENs.
 		# It is nE x nK with entries >= 0.
 
 		# octopamine to Gs and to Ks
-		self.octo2G = _np.maximum(0,  self.octo2G_mu + self.octo2G_std*r.normal(0,1,(self.nG,1)) ) # intermediate step
+		self.octo2G = _np.maximum(0,  self.octo2G_mu + self.octo2G_std*self.rng.normal(0,1,(self.nG,1)) ) # intermediate step
 		# uniform distribution (experiment)
 		# self.octo2G = _np.maximum(0,  self.octo2G_mu + 4*self.octo2G_std*r.rand(self.nG, 1) - 2*self.octo2G_std ) # 2*(linspace(0,1,nG) )' )
-		self.octo2K = _np.maximum(0,  self.octo2K_mu + self.octo2K_std*r.normal(0,1,(self.nK, 1)) )
+		self.octo2K = _np.maximum(0,  self.octo2K_mu + self.octo2K_std*self.rng.normal(0,1,(self.nK, 1)) )
 		# each of these is a col vector with entries >= 0
 
-		self.octo2P = _np.maximum(0,  self.octo2P_mult*self.octo2G + self.octo2P_std*r.normal(0,1,(self.nG,1)) ) # effect of octo on P, includes gaussian variation from P to P
-		self.octo2L = _np.maximum(0,  self.octo2L_mult*self.octo2G + self.octo2L_std*r.normal(0,1,(self.nG,1)) )
-		self.octo2R = _np.maximum(0,  self.octo2R_mult*self.octo2G + self.octo2R_std*r.normal(0,1,(self.nG,1)) )
+		self.octo2P = _np.maximum(0,  self.octo2P_mult*self.octo2G + self.octo2P_std*self.rng.normal(0,1,(self.nG,1)) ) # effect of octo on P, includes gaussian variation from P to P
+		self.octo2L = _np.maximum(0,  self.octo2L_mult*self.octo2G + self.octo2L_std*self.rng.normal(0,1,(self.nG,1)) )
+		self.octo2R = _np.maximum(0,  self.octo2R_mult*self.octo2G + self.octo2R_std*self.rng.normal(0,1,(self.nG,1)) )
 		# #  uniform distributions (experiments)
 		# self.octo2P = _np.maximum(0,  self.octo2P_mult*self.octo2G + 4*self.octo2P_std*r.rand(self.nG,1) - 2*self.octo2P_std )
 		# self.octo2L = _np.maximum(0,  self.octo2L_mult*self.octo2G + 4*self.octo2L_std*r.rand(self.nG,1) - 2*self.octo2L_std )
@@ -571,41 +595,183 @@ class ModelParams:
 		self.octo2PI = self.octo2PIwts.sum(axis=1)/self.G2PIconn.sum(axis=1) # net, averaged effect of octo on PI. Includes varying effects of octo on Gs & varying contributions of Gs to PIs.
 		# no PIs for mnist
 
-		self.octo2E = _np.maximum(0,  self.octo2E_mu + self.octo2E_std*r.normal(0,1,(self.nE,1)) )
+		self.octo2E = _np.maximum(0,  self.octo2E_mu + self.octo2E_std*self.rng.normal(0,1,(self.nE,1)) )
 
 
 		# each neuron has slightly different noise levels for sde use. Define noise vectors for each type:
 		# Gaussian versions:
-		# self.noiseRvec = _np.maximum(0,  self.self.epsR_std + self.RnoiseSig*r.normal(0,1,(self.nR,1)) ) # remove negative noise entries
-		# self.noisePvec = _np.maximum(0,  self.epsP_std + self.PnoiseSig*r.normal(0,1,(self.nP,1)) )
-		# self.noiseLvec = _np.maximum(0,  self.epsL_std + self.LnoiseSig*r.normal(0,1,(self.nG,1)) )
-		self.noisePIvec = _np.maximum(0,  self.noisePI + self.PInoise_std*r.normal(0,1,(self.nPI,1)) ) # no PIs for mnist
-		self.noiseKvec = _np.maximum(0,  self.noiseK + self.Knoise_std*r.normal(0,1,(self.nK,1)) )
-		self.noiseEvec = _np.maximum(0,  self.noiseE + self.Enoise_std*r.normal(0,1,(self.nE,1)) )
+		# self.noiseRvec = _np.maximum(0,  self.self.epsR_std + self.RnoiseSig*self.rng.normal(0,1,(self.nR,1)) ) # remove negative noise entries
+		# self.noisePvec = _np.maximum(0,  self.epsP_std + self.PnoiseSig*self.rng.normal(0,1,(self.nP,1)) )
+		# self.noiseLvec = _np.maximum(0,  self.epsL_std + self.LnoiseSig*self.rng.normal(0,1,(self.nG,1)) )
+		self.noisePIvec = _np.maximum(0,  self.noisePI + self.PInoise_std*self.rng.normal(0,1,(self.nPI,1)) ) # no PIs for mnist
+		self.noiseKvec = _np.maximum(0,  self.noiseK + self.Knoise_std*self.rng.normal(0,1,(self.nK,1)) )
+		self.noiseEvec = _np.maximum(0,  self.noiseE + self.Enoise_std*self.rng.normal(0,1,(self.nE,1)) )
 
 		# gamma versions:
 		a = self.noiseR/self.Rnoise_std
 		b = self.noiseR/a
-		self.noiseRvec = _np.random.gamma(a, scale=b, size=(self.nR,1))
+		self.noiseRvec = self.rng.gamma(a, scale=b, size=(self.nR,1))
 		# DEV NOTE: Run below by CBD - Still necessary?
 		self.noiseRvec[self.noiseRvec > 15] = 0 # experiment to see if just outlier noise vals boost KC noise
 
 		a = self.noiseP/self.Pnoise_std
 		b = self.noiseP/a
-		self.noisePvec = _np.random.gamma(a, scale=b, size=(self.nR,1))
+		self.noisePvec = self.rng.gamma(a, scale=b, size=(self.nR,1))
 		# DEV NOTE: Run below by CBD - Still necessary?
 		self.noisePvec[self.noisePvec > 15] = 0 # experiment to see if outlier noise vals boost KC noise
 
 		a = self.noiseL/self.Lnoise_std
 		b = self.noiseL/a
-		self.noiseLvec = _np.random.gamma(a, scale=b, size=(self.nG,1))
+		self.noiseLvec = self.rng.gamma(a, scale=b, size=(self.nG,1))
 
-		self.kGlobalDampVec = self.kGlobalDampFactor + self.kGlobalDamp_std*r.normal(0,1,(self.nK,1))
+		if not self.noise:
+			# noise free moth (the noise vectors are still drawn above, so that the
+			# rest of the moth is the same as its noisy version)
+			for pop in ('P', 'PI', 'L', 'R', 'K', 'E'):
+				name = 'noise{}vec'.format(pop)
+				setattr(self, name, 0*getattr(self, name))
+
+		self.kGlobalDampVec = self.kGlobalDampFactor + self.kGlobalDamp_std*self.rng.normal(0,1,(self.nK,1))
 		# each KC may be affected a bit differently by LH inhibition
 
+		self.set_dtype(self.dtype)
+
+	def set_dtype(self, dtype):
+		"""
+
+		Set the floating point precision of the simulation, and cast the existing \
+		connection matrices and noise/octopamine vectors to it.
+
+		Args:
+			dtype (numpy dtype): eg numpy.float32 or numpy.float64
+
+		Returns
+		-------
+			None
+
+		>>> model_params.set_dtype( numpy.float32 )
+
+		"""
+		self.dtype = _np.dtype(dtype).type
+		for name, val in vars(self).items():
+			if isinstance(val, _np.ndarray) and val.dtype.kind == 'f':
+				setattr(self, name, val.astype(self.dtype, copy=False))
+
+class Protocol:
+	"""
+
+	Declarative timeline of a time-evolution experiment, compiled by \
+	:class:`ExpParams` into the stimulus, octopamine and Hebbian arrays. The \
+	phases, in order:
+		#. settle: no events, while the noise is calibrated (the three \
+		calibration windows, in seconds from sim_start)
+		#. baseline: a group of digits for each class, 'isi' seconds apart, \
+		with 'gap' seconds from the onset of the last digit of a group to the \
+		onset of the first digit of the next (see :meth:`groups`)
+		#. buffer: the first training digit is 'buffer' seconds after the \
+		onset of the last baseline digit
+		#. train: the training digits, 'train_isi' seconds apart
+		#. buffer: the first val digit is 'buffer' seconds after the onset of \
+		the last training digit
+		#. val: as baseline
+		#. tail: 'tail' seconds after the last digit
+
+	Simulation cost is linear in the total duration (see \
+	:meth:`ExpParams.report`). The checks on the arguments keep a shortened \
+	protocol safe: the EN response windows (+/- 1 sec around each stimulus \
+	start, see :func:`collect_stats`) stay apart, and the pre- and \
+	post-training spontaneous windows stay non-empty.
+
+	>>> exp_params = ExpParams( train_classes, class_labels, 1, protocol=Protocol.compact() )
+
+	"""
+	def __init__(self, settle=60, calibration=((5, 15), (20, 25), (30, 58)), isi=3,
+		train_isi=5, gap=10, buffer=25, tail=10, sim_start=-30):
+		"""
+
+		Args:
+			settle (float): [optional] seconds from sim_start to the first \
+			baseline digit.
+			calibration (tuple): [optional] (start, stop) of the three noise \
+			calibration windows, in seconds from sim_start (see \
+			:func:`sde_evo_mnist`).
+			isi (float): [optional] seconds between baseline (and val) digits.
+			train_isi (float): [optional] seconds between training digits.
+			gap (float): [optional] seconds from the onset of the last digit of \
+			a class group to the onset of the first digit of the next.
+			buffer (float): [optional] seconds from the onset of the last digit \
+			of a phase (baseline, train) to the onset of the first digit of the next.
+			tail (float): [optional] seconds simulated after the last digit.
+			sim_start (float): [optional] start time (negative, for convenience).
+
+		"""
+		if min(isi, train_isi) < 2:
+			raise ValueError('isi and train_isi must be >= 2 sec, so that the ' +
+				'response windows (+/- 1 sec) stay apart')
+		if gap < isi:
+			raise ValueError('gap must be >= isi')
+		if buffer <= 8:
+			raise ValueError('buffer must be > 8 sec, for the spontaneous windows ' +
+				'around training (5 sec after it, to 3 sec before val)')
+		if tail < 1:
+			raise ValueError('tail must be >= 1 sec, for the last response window')
+		stops = [ stop for _, stop in calibration ]
+		if any( start >= stop for start, stop in calibration ) or stops != sorted(stops) \
+			or stops[-1] > settle - 1:
+			raise ValueError('the calibration windows must be in order, and end ' +
+				'at least 1 sec before the first digit')
+
+		self.settle = settle
+		self.calibration = calibration
+		self.isi = isi
+		self.train_isi = train_isi
+		self.gap = gap
+		self.buffer = buffer
+		self.tail = tail
+		self.sim_start = sim_start
+
+	@classmethod
+	def compact(cls, **kwargs):
+		"""
+
+		The shortest safe protocol with the default noise calibration: digits \
+		2 sec apart (3 sec while training, so that octopamine ends well before \
+		the next digit), no extra gap between class groups, 10 sec buffers and \
+		a 2 sec tail.
+
+		Args:
+			kwargs: [optional] overrides, as in :class:`Protocol`.
+
+		Returns
+		-------
+			protocol (class)
+
+		>>> protocol = Protocol.compact()
+
+		"""
+		options = dict(isi=2, train_isi=3, gap=2, buffer=10, tail=2)
+		options.update(kwargs)
+		return cls(**options)
+
+	def groups(self, start, val_per_class, nC):
+		"""
+
+		Onsets of nC class groups of val_per_class digits each (as in the \
+		baseline and val phases), starting at 'start'.
+
+		Returns
+		-------
+			times (numpy array)
+				[nC*val_per_class] onsets, class group by class group
+
+		"""
+		group = (val_per_class - 1)*self.isi + self.gap # first digit to first digit
+		return ( start + _np.arange(nC)[:, None]*group
+			+ _np.arange(val_per_class)[None, :]*self.isi ).ravel().astype(float)
+
 class ExpParams:
 
-	def __init__( self, train_classes, class_labels, val_per_class ):
+	def __init__( self, train_classes, class_labels, val_per_class, rng=None, protocol=None ):
 		"""
 		Experiment parameters of a time-evolution experiment:
 			* overall timing
@@ -616,7 +782,7 @@ class ExpParams:
 
 		Analyze the SDE time-stepped evolution of the neural firing rates.
 
-		Order of time periods:
+		Order of time periods (see :class:`Protocol`):
 			#. no event period: allow system to settle to a steady state spontaneous FR baseline
 			#. baseline period: deliver a group of digits for each class
 			#. no event buffer
@@ -629,6 +795,10 @@ class ExpParams:
 			training digits in order. The first entry must be nonzero.
 			class_labels (numpy array): a list of labels, eg 1:10 for mnist
 			val_per_class (int): how many digits of each class to use for baseline and post-train
+			rng (Generator or int): [optional] random number generator (or seed) \
+			for the neural noise of simulations of this experiment. See :func:`make_rng`.
+			protocol (class): [optional] timeline of the experiment. Defaults to \
+			Protocol(), ie the original timing.
 
 		Returns
 		-------
@@ -637,6 +807,9 @@ class ExpParams:
 		>>> experiment_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
 
 		"""
+		self.rng = make_rng(rng) # draws the Wiener noise in sde_wrap
+		self.protocol = Protocol() if protocol is None else protocol
+		pr = self.protocol
 		self.stimMag = 20 # stim magnitudes as passed into AL
 		# (See original version in smartAsABug codebase)
 		self.stimLength = 0.22
@@ -644,41 +817,28 @@ class ExpParams:
 		self.nC = len(class_labels) # the number of classes in this experiment
 
 		## Define the time span and events:
-		self.step = 3 # the time between digits (3 seconds)
-		self.trStep = self.step + 2 # allow more time between training digits
+		self.step = pr.isi # the time between digits (3 seconds)
+		self.trStep = pr.train_isi # allow more time between training digits
+		self.gap = pr.gap
 
-		self.sim_start = -30 # use negative start-time for convenience (artifact)
+		self.sim_start = pr.sim_start # use negative start-time for convenience (artifact)
 
 		## Baseline period:
-		# do a loop, to allow gaps between class groups:
-		self.baselineTimes = _np.empty(0)
-		self.startTime = 30
-		self.gap = 10
-		for i in range(self.nC):
-			# vector of timepoints
-			self.baselineTimes = _np.append(self.baselineTimes,
-				range(self.startTime, self.startTime + val_per_class*self.step, self.step) )
-			self.startTime = int(_np.max(self.baselineTimes) + self.gap)
+		# class groups of digits, with gaps between the groups
+		self.baselineTimes = pr.groups(pr.sim_start + pr.settle, val_per_class, self.nC)
 		# include extra buffer before training
-		self.endOfBaseline = int(_np.max(self.baselineTimes) + 25)
+		self.endOfBaseline = _np.max(self.baselineTimes) + pr.buffer
 
 		## Training period:
 		# vector of timepoints, one digit every 'trStep' seconds
-		self.trainTimes = _np.array(range(self.endOfBaseline,
-			self.endOfBaseline + len(train_classes)*self.trStep, self.trStep))
+		self.trainTimes = self.endOfBaseline + self.trStep*_np.arange(len(train_classes))
 		# includes buffer before Validation
-		self.endOfTrain = int(_np.max(self.trainTimes) + 25)
+		self.endOfTrain = _np.max(self.trainTimes) + pr.buffer
 
 		# Val period:
-		# do a loop, to allow gaps between class groups
-		self.valTimes = _np.empty(0)
-		self.startTime = self.endOfTrain
-		for i in range(self.nC):
-			# vector of timepoints
-			self.valTimes = _np.append(self.valTimes,
-				range(self.startTime, self.startTime + val_per_class*self.step, self.step) )
-			self.startTime = int(_np.max(self.valTimes) + self.gap)
-		self.endOfVal = _np.max(self.valTimes) + 4
+		# class groups of digits, with gaps between the groups
+		self.valTimes = pr.groups(self.endOfTrain, val_per_class, self.nC)
+		self.endOfVal = _np.max(self.valTimes) + min(4, pr.tail)
 
 		## assemble vectors of stimulus data for export:
 
@@ -687,18 +847,10 @@ class ExpParams:
 
 		self.stimStarts = _np.hstack(( self.baselineTimes, self.trainTimes, self.valTimes ))
 
-		self.whichClass = _np.empty(self.stimStarts.shape) * _np.nan
 		self.numBaseline = val_per_class*self.nC
 		self.numTrain = len(train_classes)
-		for c in range(self.nC):
-			# the baseline groups
-			self.whichClass[ c*val_per_class : (c+1)*val_per_class ] = class_labels[c]
-
-			# the val groups
-			self.whichClass[ self.numBaseline + self.numTrain + c*val_per_class : \
-				self.numBaseline + self.numTrain + (c+1)*val_per_class ]  = class_labels[c]
-
-		self.whichClass[ self.numBaseline : self.numBaseline + self.numTrain ] = train_classes
+		blocks = _np.repeat(class_labels, val_per_class) # baseline and val groups
+		self.whichClass = _np.hstack(( blocks, train_classes, blocks )).astype(float)
 
 		# self.whichClass = whichClass
 		# self.stimStarts = stimStarts # starting times
@@ -725,15 +877,13 @@ class ExpParams:
 		# This ensures that in steady state, noise levels are correct in relation to mean FRs.
 		# the numbers 1,2,3 do refer to time periods where spont responses are
 		# allowed to settle before recalibration.
-		self.startPreNoiseSpontMean1 = -25
-		self.stopPreNoiseSpontMean1 = -15
+		(self.startPreNoiseSpontMean1, self.stopPreNoiseSpontMean1), \
+			(self.startSpontMean2, self.stopSpontMean2), \
+			(self.startSpontMean3, self.stopSpontMean3) = \
+			[ (pr.sim_start + a, pr.sim_start + b) for a, b in pr.calibration ]
 		# Currently no change is made in start/stopSpontMean2.
 		# So spontaneous behavior may be stable in this range.
-		self.startSpontMean2 = -10
-		self.stopSpontMean2 = -5
 		# currently, spontaneous behavior is steady-state by startSpontMean3.
-		self.startSpontMean3 = 0
-		self.stopSpontMean3 = 28
 
 		self.preHebPollTime = min(self.trainTimes) - 5
 		self.postHebPollTime = max(self.trainTimes) + 5
@@ -750,7 +900,43 @@ class ExpParams:
 		# The lp filter is applied to odors and to octo
 		self.lpParam =  0.12
 
-		self.sim_stop = max(self.stimStarts) + 10
+		self.sim_stop = max(self.stimStarts) + pr.tail
+
+	def phases(self):
+		"""
+		(start, stop) in seconds of each phase of the experiment: settle \
+		(including the noise calibration), baseline, train and val.
+		"""
+		return { 'settle' : (self.sim_start, min(self.baselineTimes)),
+			'baseline' : (min(self.baselineTimes), self.endOfBaseline),
+			'train' : (self.endOfBaseline, self.endOfTrain),
+			'val' : (self.endOfTrain, self.sim_stop) }
+
+	def report(self, time_step=2*0.01):
+		"""
+
+		Print the phases of the experiment, its total simulated duration and \
+		the number of time steps, eg to size a run before it starts.
+
+		Args:
+			time_step (float): [optional] simulation time step (seconds).
+
+		Returns
+		-------
+			summary (dict)
+				duration (seconds), steps, and (start, stop) of each phase
+
+		>>> experiment_params.report()
+
+		"""
+		phases = self.phases()
+		duration = self.sim_stop - self.sim_start
+		steps = int(round(duration/time_step)) # as time_vector
+		print('Experiment protocol: {} sec, {:,} steps of {} sec'.format(
+			round(duration, 3), steps, time_step))
+		for name, (start, stop) in phases.items():
+			print(' {}: {} to {} sec'.format(name, round(start, 3), round(stop, 3)))
+		return { 'duration' : duration, 'steps' : steps, 'phases' : phases }
 
 # MIT license:
 # Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: progress
+   :platform: Unix
+   :synopsis: Rate-limited progress reports of long simulations.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import sys as _sys
+import time as _time
+import bisect as _bisect
+
+class Progress:
+    """
+
+    Progress of a time-stepped simulation, reported at most once per \
+    'interval' seconds of wall-clock time (and once at the end): the step, \
+    steps/sec, ETA and the phase of the experiment. Updates go to a sink \
+    (eg a job runner), as dicts, or else to a spinner line on the terminal. \
+    Without a sink, nothing is reported unless stdout is a terminal, so \
+    redirected output stays clean.
+
+    >>> sim_results = sde_wrap(model_params, exp_params, feature_array,
+    ...     progress=Progress(interval=10, sink=print))
+
+    """
+    spin = '/-\\|' # spinner for the terminal line
+
+    def __init__(self, interval=0.5, sink=None, terminal=True, clock=_time.monotonic):
+        """
+
+        Args:
+            interval (float): [optional] minimum seconds between updates.
+            sink (function): [optional] called with each update, a dict with \
+            label, step, total, fraction, time (simulated seconds), phase, \
+            elapsed (seconds), rate (steps/sec), eta (seconds) and done.
+            terminal (bool): [optional] without a sink, show a progress line \
+            if stdout is a terminal.
+            clock (function): [optional] wall-clock time, in seconds.
+
+        """
+        self.interval = interval
+        self.sink = sink
+        self.terminal = terminal
+        self.clock = clock
+        self.enabled = False
+
+    def start(self, total, label='SDE evolution', exp_params=None, first=0):
+        """
+
+        Start reporting a run (called by the simulation).
+
+        Args:
+            total (int): number of steps in the run.
+            label (str): [optional] name of the run.
+            exp_params (class): [optional] the experiment, to report its phases \
+            (see :meth:`ExpParams.phases`).
+            first (int): [optional] step the run starts at (eg when resuming).
+
+        """
+        self.enabled = self.sink is not None or (self.terminal and
+            getattr(_sys.stdout, 'isatty', lambda: False)())
+        self.total = total
+        self.label = label
+        self.first = first
+        self.step = first
+        self.time = None
+        self.phases = []
+        if exp_params is not None:
+            self.phases = sorted( (start, name) for name, (start, stop) in exp_params.phases().items() )
+        self.starts = [ start for start, _ in self.phases ]
+        self.started = self.clock()
+        self.due = self.started + self.interval
+        self.count = 0 # updates so far
+        self.width = 0 # of the last terminal line
+
+    def update(self, n, t=None):
+        """
+        Step n (at simulated time t) is being computed. Cheap unless an update is due.
+        """
+        if not self.enabled:
+            return
+        now = self.clock()
+        if now < self.due:
+            return
+        self.step, self.time = n, t
+        self._emit(now, False)
+
+    def finish(self):
+        """
+        The run is over: the last update.
+        """
+        if not self.enabled:
+            return
+        self.step = self.total
+        self._emit(self.clock(), True)
+        self.enabled = False
+
+    def phase(self, t):
+        """
+        Phase of the experiment at simulated time t (or None).
+        """
+        k = _bisect.bisect_right(self.starts, t) - 1 if t is not None else -1
+        return self.phases[k][1] if k >= 0 else None
+
+    def _emit(self, now, done):
+        elapsed = now - self.started
+        steps = self.step - self.first
+        rate = steps/elapsed if elapsed > 0 else 0.
+        update = { 'label' : self.label, 'step' : self.step, 'total' : self.total,
+            'fraction' : self.step/max(self.total, 1), 'time' : self.time,
+            'phase' : self.phase(self.time), 'elapsed' : elapsed, 'rate' : rate,
+            'eta' : (self.total - self.step)/rate if rate > 0 else None, 'done' : done }
+        self.due = now + self.interval
+        self.count += 1
+        if self.sink is not None:
+            self.sink(update)
+        else:
+            self._show(update)
+
+    def _show(self, update):
+        # one spinner line, rewritten in place
+        prog = int(15*update['fraction'])
+        line = '{} {}:[{}{}] {:3.0f}%'.format(self.spin[self.count % len(self.spin)],
+            update['label'], prog*'*', (15-prog)*' ', 100*update['fraction'])
+        if update['rate'] > 0:
+            line += ', {:,.0f} steps/sec'.format(update['rate'])
+        if update['eta'] is not None and not update['done']:
+            line += ', ETA {}:{:02d}'.format(*divmod(int(round(update['eta'])), 60))
+        if update['phase'] is not None and not update['done']:
+            line += ' ({})'.format(update['phase'])
+        print(line.ljust(self.width), end='\n' if update['done'] else '\r', flush=True)
+        self.width = len(line)
+
+def make_progress( progress=None ):
+    """
+    Build a progress reporter: None (default) reports on the terminal (if \
+    stdout is one), False not at all, a function is the sink of the updates \
+    (see :class:`Progress`), and a :class:`Progress` is returned unchanged.
+
+    >>> progress = make_progress(job.report)
+
+    """
+    if isinstance(progress, Progress):
+        return progress
+    if progress is None:
+        return Progress()
+    if progress is False:
+        return Progress(terminal=False)
+    if callable(progress):
+        return Progress(sink=progress)
+    raise ValueError('progress must be None, False, a function or a Progress, got {!r}'.format(progress))
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
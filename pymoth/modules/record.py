@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: record
+   :platform: Unix
+   :synopsis: Record selected neural timecourses during a simulation.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import os as _os
+import numpy as _np
+
+POPULATIONS = ('P', 'PI', 'L', 'R', 'K', 'E')
+
+class Recorder:
+    """
+
+    Records the FRs of selected populations (and neuron subsets) during a \
+    simulation, eg every 10th step of 200 KCs over the whole run, into \
+    preallocated buffers. Pass it to :func:`sde_wrap`; the recordings are \
+    then available from :meth:`results`.
+
+    With a capacity smaller than the number of recorded timepoints, the \
+    buffers are rings that keep only the latest capacity samples.
+
+    With a directory, the buffers are memory-mapped .npy files (one per \
+    population, plus T.npy), so long recordings are not bounded by RAM. \
+    Samples are then gathered in RAM in chunks of chunk_steps and written \
+    out one chunk at a time.
+
+    """
+    def __init__(self, populations=POPULATIONS, neurons=None, stride=1,
+        window=(None, None), capacity=None, directory=None, chunk_steps=256):
+        """
+
+        Args:
+            populations (tuple): [optional] populations to record, from \
+            ('P', 'PI', 'L', 'R', 'K', 'E'). Default all.
+            neurons (dict): [optional] indices of the neurons to record, per \
+            population (eg {'K': range(0, 2000, 10)}). Default all neurons.
+            stride (int): [optional] record every stride'th timepoint.
+            window (tuple): [optional] (start, stop) times (seconds) to record, \
+            inclusive. None means the start (or end) of the simulation.
+            capacity (int): [optional] number of samples to keep (the latest \
+            ones). Default all.
+            directory (str): [optional] run directory for memory-mapped .npy \
+            files (created if needed). Default in RAM.
+            chunk_steps (int): [optional] samples per write to the files.
+
+        >>> recorder = Recorder( populations=('K',), neurons={'K': range(200)}, stride=10 )
+
+        """
+        unknown = set(populations) - set(POPULATIONS)
+        if unknown:
+            raise ValueError('unknown populations {}: expected some of {}'.format(
+                sorted(unknown), POPULATIONS))
+        if int(stride) < 1:
+            raise ValueError('stride must be a positive integer, got {}'.format(stride))
+        if capacity is not None and int(capacity) < 1:
+            raise ValueError('capacity must be None or a positive integer, got {}'.format(capacity))
+        self.populations = tuple(populations)
+        self.neurons = dict(neurons or {})
+        self.stride = int(stride)
+        self.window = window
+        self.capacity = None if capacity is None else int(capacity)
+        self.directory = directory
+        self.chunk_steps = int(chunk_steps)
+
+    def allocate(self, T, sizes, dtype=_np.float64):
+        """
+
+        Choose the timepoints to record and preallocate the buffers. Called \
+        by the simulation before stepping.
+
+        Args:
+            T (numpy array): timepoints of the simulation.
+            sizes (tuple): (nP, nPI, nL, nR, nK, nE)
+            dtype (numpy dtype): [optional] precision of the buffers.
+
+        """
+        start, stop = self.window
+        inds = _np.flatnonzero( (T >= (T[0] if start is None else start)) &
+            (T <= (T[-1] if stop is None else stop)) )
+        self.steps = inds[::self.stride] # timepoint indices to record
+        n = len(self.steps) if self.capacity is None else min(self.capacity, len(self.steps))
+
+        bounds = dict(zip(POPULATIONS, zip(_np.cumsum((0,) + tuple(sizes[:-1])),
+            _np.cumsum(sizes))))
+        if self.directory is not None:
+            _os.makedirs(self.directory, exist_ok=True)
+        def buffer(name, shape, dtype):
+            if self.directory is None:
+                return _np.zeros(shape, dtype=dtype)
+            return _np.lib.format.open_memmap(_os.path.join(self.directory, name + '.npy'),
+                mode='w+', dtype=dtype, shape=shape)
+
+        self._select = []
+        self._chunks = []
+        self.buffers = {}
+        chunk = min(self.chunk_steps, n)
+        for pop in self.populations:
+            a, b = bounds[pop]
+            cols = _np.arange(a, b)
+            if pop in self.neurons:
+                cols = cols[_np.asarray(self.neurons[pop], dtype=int)]
+            self.buffers[pop] = buffer(pop, (n, len(cols)), dtype) # time-major
+            # samples are written straight into RAM buffers, or into a chunk
+            dest = self.buffers[pop]
+            if self.directory is not None:
+                dest = _np.zeros((chunk, len(cols)), dtype=dtype)
+                self._chunks.append( (dest, self.buffers[pop]) )
+            # contiguous populations are copied as slices, subsets by index
+            whole = len(cols) == b - a
+            self._select.append( (dest, slice(a, b) if whole else cols) )
+        self.times = buffer('T', (n,), _np.float64)
+        if self.directory is not None:
+            self._chunks.append( (_np.zeros(chunk), self.times) )
+        self.count = 0 # samples recorded so far
+        self.flushed = 0 # samples written out to the files so far
+        self.pos = 0 # index into self.steps of the next timepoint to record
+        self._T = T
+
+    def record(self, n, y):
+        """
+
+        Record the state y if timepoint n is one of the recorded ones. Called \
+        by the simulation after each step.
+
+        Args:
+            n (int): index of the timepoint.
+            y (numpy array): flat FRs of all neurons, ordered [ P, PI, L, R, K, E ].
+
+        """
+        if self.pos == len(self.steps) or self.steps[self.pos] != n:
+            return
+        if self._chunks:
+            row = self.count - self.flushed
+            times = self._chunks[-1][0]
+        else:
+            row = self.count % len(self.times)
+            times = self.times
+        for buf, cols in self._select:
+            if isinstance(cols, slice):
+                buf[row] = y[cols]
+            else:
+                _np.take(y, cols, out=buf[row])
+        times[row] = self._T[n]
+        self.count += 1
+        self.pos += 1
+        if self._chunks and self.count - self.flushed == len(times):
+            self.flush()
+
+    def flush(self):
+        """
+        Write the samples gathered in the current chunk out to the files.
+        """
+        m = self.count - self.flushed
+        if not self._chunks or m == 0:
+            return
+        rows = _np.arange(self.flushed, self.count) % len(self.times)
+        for chunk, buf in self._chunks:
+            if rows[0] < rows[-1]:
+                buf[rows[0]:rows[-1]+1] = chunk[:m]
+            else: # the ring wraps around
+                buf[rows] = chunk[:m]
+        self.flushed = self.count
+
+    def results(self):
+        """
+
+        The recordings, in time order. These are views of the buffers (eg of \
+        the memory-mapped files), unless a ring buffer has wrapped around.
+
+        Returns
+        -------
+            recordings (dict)
+                T (numpy array)
+                    [samples] recorded timepoints
+                P, PI, L, R, K, E (numpy array)
+                    [samples x neurons] FRs, for each recorded population
+
+        >>> K = recorder.results()['K']
+
+        """
+        self.flush()
+        n = len(self.times)
+        if self.count <= n:
+            order = slice(0, self.count)
+        else:
+            order = _np.arange(self.count - n, self.count) % n
+        recordings = { pop : buf[order] for pop, buf in self.buffers.items() }
+        recordings['T'] = self.times[order]
+        return recordings
+
+class StackedView:
+    """
+
+    Read-only view of several [timepoints x neurons] arrays (eg memory-mapped \
+    recordings) side by side, as one [timepoints x all neurons] array, without \
+    copying them. Indexing reads only the requested rows.
+
+    """
+    def __init__(self, arrays):
+        """
+
+        Args:
+            arrays (list): arrays with the same number of rows.
+
+        >>> Y = StackedView([ recordings[pop] for pop in ('P', 'L', 'K') ])
+
+        """
+        self.arrays = list(arrays)
+        self.dtype = _np.result_type(*self.arrays)
+        self.shape = (len(self.arrays[0]), sum(a.shape[1] for a in self.arrays))
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        # read the rows of each array, then pick the columns of the stack
+        return _np.concatenate([ a[rows] for a in self.arrays ], axis=-1)[..., cols]
+
+    def __array__(self, dtype=None, copy=None):
+        out = _np.hstack(self.arrays)
+        return out if dtype is None else out.astype(dtype)
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: rng
+   :platform: Unix
+   :synopsis: Explicit random number generators and block-drawn Wiener noise.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+
+BIT_GENERATORS = {
+    'pcg64' : _np.random.PCG64,
+    'philox' : _np.random.Philox, # counter-based
+    }
+
+def make_rng( seed=None, bit_generator='pcg64' ):
+    """
+    Build a numpy random Generator. Generators are passed explicitly (to \
+    :class:`ModelParams`, :class:`ExpParams`, :func:`sde_wrap`, etc) instead of \
+    seeding the global numpy state.
+
+    Args:
+        seed (int, Generator or None): [optional] seed. An existing Generator is \
+        returned unchanged; None draws fresh entropy from the OS.
+        bit_generator (str): [optional] 'pcg64' (default) or 'philox'.
+
+    Returns
+    -------
+        rng (numpy Generator)
+            random number generator
+
+    >>> rng = make_rng(12345)
+
+    """
+    if isinstance(seed, _np.random.Generator):
+        return seed
+    if bit_generator not in BIT_GENERATORS:
+        raise ValueError('unknown bit_generator {!r}: expected one of {}'.format(
+            bit_generator, tuple(BIT_GENERATORS)))
+    return _np.random.Generator(BIT_GENERATORS[bit_generator](seed))
+
+def spawn( rng, n ):
+    """
+    Independent child generators, eg one per parallel worker or per moth. The \
+    children are reproducible given the parent's seed, and share no state.
+
+    Args:
+        rng (numpy Generator): parent generator.
+        n (int): number of children.
+
+    Returns
+    -------
+        children (list)
+            n numpy Generators
+
+    >>> worker_rngs = spawn(make_rng(12345), 8)
+
+    """
+    return rng.spawn(n)
+
+class NoiseBlock:
+    """
+
+    Standard normal draws for the Wiener noise, pre-drawn for many time steps \
+    and all populations at once into one contiguous [steps x neurons] buffer, \
+    and consumed by slicing. The buffer is refilled in place when it runs out, \
+    so the per-step cost is a slice rather than a call to the generator.
+
+    Draws are always made in float64 (and cast for float32 simulations), so a \
+    given generator yields the same noise whatever the simulation precision.
+
+    """
+    def __init__(self, rng, shapes, block_steps=1000, dtype=_np.float64):
+        """
+
+        Args:
+            rng (numpy Generator): source of the draws.
+            shapes (list): shape (or size) of the draw of each population at \
+            each step, eg [nP, nPI, nL, nR, nK].
+            block_steps (int): [optional] number of time steps drawn at once.
+            dtype (numpy dtype): [optional] float64 or float32.
+
+        >>> noise = NoiseBlock( rng, (nP, nPI, nL, nR, nK) )
+
+        """
+        self.rng = rng
+        self.shapes = [ (s,) if _np.isscalar(s) else tuple(s) for s in shapes ]
+        sizes = [ int(_np.prod(s)) for s in self.shapes ]
+        self.bounds = _np.cumsum([0] + sizes)
+        self.block = _np.empty((block_steps, self.bounds[-1]), dtype=dtype)
+        if self.block.dtype == _np.float64:
+            self.draws = self.block
+        else:
+            self.draws = _np.empty(self.block.shape)
+        self.pos = block_steps # forces a draw on first use
+        # generator state before the current block was drawn (see state)
+        self.block_state = None
+
+    def rows(self, n):
+        """
+
+        Consume up to n steps of noise (fewer if the current block runs out).
+
+        Args:
+            n (int): number of steps wanted.
+
+        Returns
+        -------
+            rows (numpy array)
+                [steps x neurons] view of the block, one row per step
+
+        """
+        if self.pos == len(self.block):
+            self.block_state = self.rng.bit_generator.state
+            self.rng.standard_normal(out=self.draws)
+            if self.draws is not self.block:
+                self.block[...] = self.draws
+            self.pos = 0
+        rows = self.block[self.pos:self.pos+n]
+        self.pos += len(rows)
+        return rows
+
+    def next(self):
+        """
+
+        Consume one step of noise.
+
+        Returns
+        -------
+            noise (list)
+                one view of standard normal draws per population
+
+        """
+        row = self.rows(1)[0]
+        return [ row[a:b].reshape(s) for a, b, s in
+            zip(self.bounds[:-1], self.bounds[1:], self.shapes) ]
+
+    def state(self):
+        """
+
+        Compact state of the noise stream, eg for checkpoints: the generator \
+        state before the current block was drawn, and the position in the block \
+        (the block itself is redrawn by :meth:`restore`).
+
+        Returns
+        -------
+            state (dict)
+                'rng' (bit generator state) and 'pos' (int)
+
+        """
+        if self.pos == len(self.block) or self.block_state is None:
+            return {'rng' : self.rng.bit_generator.state, 'pos' : len(self.block)}
+        return {'rng' : self.block_state, 'pos' : self.pos}
+
+    def restore(self, state):
+        """
+
+        Restore a :meth:`state`: the following draws, and the state of the \
+        generator after the next refill, are those of the original stream.
+
+        Args:
+            state (dict): as returned by :meth:`state` (with the same block size)
+
+        """
+        self.rng.bit_generator.state = state['rng']
+        self.pos = len(self.block)
+        if state['pos'] < len(self.block):
+            self.rows(0) # redraw the current block
+            self.pos = int(state['pos'])
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
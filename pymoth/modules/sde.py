@@ -11,11 +11,25 @@
 """
 import os as _os
 import numpy as _np
-from scipy.special import erfinv
 import matplotlib.pyplot as _plt
 from ..modules.show_figs import show_acc, show_timecourse
-
-def sde_wrap( model_params, exp_params, feature_array ):
+from ..modules.kernel import StepKernel
+from ..modules.jit import resolve_backend, sde_evo_jit
+from ..modules.rng import make_rng, NoiseBlock
+from ..modules.stream import WindowStream, consume
+from ..modules.enstats import class_stats
+from ..modules.progress import make_progress
+from ..modules.record import Recorder, StackedView
+from ..modules.compiler import compile_model
+from ..modules.timeline import StimTimeline, time_vector
+from ..modules.checkpoint import save_checkpoint, load_checkpoint, check_checkpoint, \
+    rng_state_to_array, rng_state_from_array, spont_key
+
+def sde_wrap( model_params, exp_params, feature_array, backend='numpy', rng=None,
+    time_step=2*0.01, integrator='euler', coarse_step=None, deterministic=None,
+    on_window=None, keep_E=True, recorder=None, prune=False, checkpoint=None,
+    checkpoint_every=5000, resume=None, spont_cache=None, branch_at=None,
+    calibration=None, en_stats=None, progress=None ):
     """
     Runs the SDE time-stepped evolution of neural firing rates.
 
@@ -29,32 +43,325 @@ def sde_wrap( model_params, exp_params, feature_array ):
         model_params (class): object with connection matrices, etc.
         exp_params (class): object with timing info about experiment, eg when stimuli are given.
         feature_array (numpy array): stimuli (numFeatures x numStimsPerClass x numClasses).
+        backend (str): [optional] 'numpy' (reference) or 'numba' (compiled, see \
+        :func:`sde_evo_jit`). Falls back to 'numpy' if numba is not installed.
+        rng (Generator or int): [optional] random number generator (or seed) for \
+        the neural noise. Defaults to exp_params.rng.
+        time_step (float): [optional] simulation time step (seconds).
+        integrator (str): [optional] 'euler' (Euler-Maruyama, default), 'heun' or \
+        'exponential' (see :class:`StepKernel`). The latter two stay accurate at \
+        larger time steps; check with :func:`step_size_convergence`. They sample \
+        the stimulus, octopamine and Hebbian time courses exactly at the \
+        timepoints, rather than on the grid (see :class:`StimTimeline`). Only \
+        'euler' is compiled, so other integrators use the numpy backend.
+        coarse_step (float): [optional] time step (seconds) in quiescent periods, \
+        ie away from stimuli, octopamine and Hebbian learning (see \
+        :func:`step_schedule`). Rounded to a multiple of time_step. None \
+        (default) uses time_step throughout. Uses the numpy backend. Euler and \
+        Heun need coarse_step < 2/tau; the exponential integrator is stable \
+        (and keeps the exact noise variance) at any step.
+        deterministic (bool): [optional] noise-free fast path (see \
+        :func:`sde_evo_mnist`). None (default) uses it for noise-free moths \
+        (eg model_params.noise = 0) on the numpy backend; False always time \
+        steps.
+        on_window (function): [optional] called with the EN response window of \
+        each stimulus (see :func:`sde_stream`) as soon as it is complete.
+        keep_E (bool): [optional] keep the full EN timecourses. If False, \
+        sim_results['E'] is None and ENs are only kept for as long as the \
+        response windows need them.
+        recorder (class): [optional] :class:`Recorder` of the neural timecourses \
+        to keep (populations, neurons, stride, time window). Uses the numpy backend.
+        prune (bool): [optional] compile the moth first (see :func:`compile_model`), \
+        skipping dead populations, zero-weight pathways and zero-noise draws, \
+        and print what was pruned. Uses the numpy backend.
+        checkpoint (str): [optional] .npz file to write a checkpoint to every \
+        checkpoint_every steps (see :func:`sde_evo_mnist`). Uses the numpy backend.
+        checkpoint_every (int): [optional] steps between checkpoints.
+        resume (str or dict): [optional] checkpoint to resume from: the run continues \
+        from the saved step, with the same results as an uninterrupted run \
+        (given the same arguments). Also takes the sim_results['branch'] of \
+        another experiment with the same start (see :func:`sde_sweep`). Uses \
+        the numpy backend.
+        spont_cache (str): [optional] directory of cached spontaneous steady \
+        states (see :func:`sde_evo_mnist`). Uses the numpy backend.
+        branch_at (float): [optional] time (seconds) at which to snapshot the \
+        whole state into sim_results['branch'], for experiments that continue \
+        from there (see :func:`sde_sweep`). Uses the numpy backend.
+        calibration (class): [optional] adaptive noise calibration (see \
+        :class:`Calibration`): each calibration stage ends once the spontaneous \
+        FRs have converged, and the rest of the experiment is moved earlier. \
+        sim_results['exp_params'] is then the shortened experiment, and \
+        sim_results['calibration'] reports the settling times. Time steps \
+        the moth (no coarse_step or deterministic fast path), with the numpy \
+        backend.
+        en_stats (class): [optional] :class:`ENStats` to accumulate the EN \
+        response stats of :func:`collect_stats` during the run (so that they \
+        need not keep_E): sim_results['en_stats'] is then its results.
+        progress (function): [optional] progress reports (see \
+        :func:`make_progress`): None (default) for a progress line on the \
+        terminal (if stdout is one), False for none, or a function that is \
+        sent a dict of the step, steps/sec, ETA and phase every half second \
+        (or a :class:`Progress`, for another interval).
 
     Returns:
         sim_results (dict): EN timecourses and final P2K and K2E connection matrices.
 
+    """
+    return consume( sde_stream(model_params, exp_params, feature_array, backend, rng,
+        time_step, integrator, coarse_step, deterministic, keep_E, recorder, prune,
+        checkpoint, checkpoint_every, resume, spont_cache, branch_at, calibration,
+        en_stats, progress), on_window )
+
+def sde_stream( model_params, exp_params, feature_array, backend='numpy', rng=None,
+    time_step=2*0.01, integrator='euler', coarse_step=None, deterministic=None,
+    keep_E=True, recorder=None, prune=False, checkpoint=None, checkpoint_every=5000,
+    resume=None, spont_cache=None, branch_at=None, calibration=None, en_stats=None,
+    progress=None ):
+    """
+    Generator version of :func:`sde_wrap` (same arguments): yields the EN \
+    response of each stimulus as soon as its window (+/- 1 sec around the \
+    stimulus start, as in :func:`collect_stats`) has been simulated, so that \
+    consumers (eg live classification, or early stopping) need not wait for \
+    the whole run. With the numba backend, the windows are only yielded once \
+    the run is over. When resuming, the windows completed before the \
+    checkpoint are not yielded again.
+
+    Yields
+    ------
+        window (dict)
+            index, class, phase ('baseline', 'train' or 'val'), onset, start, \
+            stop, T and E ([timepoints x nE]), see :class:`WindowStream`
+
+    Returns
+    -------
+        sim_results (dict)
+            as :func:`sde_wrap`, as the value of the final StopIteration
+
+    >>> for window in sde_stream(model_params, exp_params, feature_array):
+    ...     print(window['phase'], window['class'], window['E'].max())
+
     """
 
     ## 1. initialize states of various components:
 
     # unpack a few variables that are needed before the evolution stage:
-    nP = model_params.nP # = nG
-    nG = model_params.nG
-    nPI = model_params.nPI
-    nK = model_params.nK
-    nR = model_params.nR # = nG
     nE = model_params.nE
-    F2R = model_params.F2R
-
-    ##  2b. Define Stimuli and Octopamine time courses:
-
-    # set time span and events:
+    rng = exp_params.rng if rng is None else make_rng(rng)
+    progress = make_progress(progress)
+
+    # adaptive noise calibration: the experiment is shortened to match, and
+    # the simulation resumes where the calibration ended
+    calibrated = None
+    if calibration is not None:
+        if resume or spont_cache or coarse_step or deterministic or recorder is not None:
+            raise ValueError('the adaptive calibration does not combine with resume, ' +
+                'spont_cache, coarse_step, deterministic or a recorder')
+        exp_params, resume, calibrated = calibration.run(model_params, exp_params,
+            rng, time_step, integrator, prune)
+        deterministic = False
+
+    ##  2b. Define Stimuli and Octopamine time courses, as a timeline of events:
+    # (sampled exactly for the higher order integrators, see StimTimeline)
+    time = time_vector(exp_params, time_step)
+    timeline = StimTimeline(exp_params, time, exact=integrator != 'euler')
     sim_start = exp_params.sim_start
     sim_stop =  exp_params.sim_stop
-    time_step = 2*0.01
 
-    total_steps = (sim_stop - sim_start)/time_step
-    time = _np.linspace(sim_start, sim_stop-time_step, total_steps)
+    ## do SDE time-step evolution:
+
+    # Use euler-maruyama SDE method, milstein's version.
+    #  Y (the vector of all neural firing rates) is structured as a row vector as follows: [ P, PI, L, K, E ]
+    init_cond = initial_conditions(model_params) # initial conditions for Y
+
+    tspan = ( sim_start, sim_stop )
+
+    # run the SDE evolution:
+    backend = resolve_backend(backend)
+    if backend == 'numba' and (integrator != 'euler' or coarse_step or deterministic or recorder
+        or prune or checkpoint or resume or spont_cache or branch_at is not None):
+        print('the numba backend only supports fixed step euler integration: using numpy')
+        backend = 'numpy'
+    if backend == 'numba':
+        # the compiled loop takes dense time courses
+        class_mag_mat, octo_hits = timeline.dense()
+        this_run = sde_evo_jit(tspan, init_cond, time, class_mag_mat, feature_array,
+            octo_hits, model_params, exp_params, rng, progress )
+        yield from WindowStream(exp_params, this_run['T']).ready(
+            len(this_run['T'])-1, this_run['E'].T)
+        if en_stats is not None:
+            en_stats.bind(exp_params, this_run['T'], octo_hits, nE)
+            en_stats.replay(0, this_run['E'].T)
+        if not keep_E:
+            this_run['E'] = None
+    else:
+        this_run = yield from _sde_evo_mnist(tspan, init_cond, time, timeline,
+            feature_array, model_params, exp_params, rng, integrator,
+            coarse_step, deterministic, keep_E, recorder, prune, checkpoint,
+            checkpoint_every, resume, spont_cache, branch_at, en_stats, progress)
+        # timepoints actually stepped through (all of them, unless coarse_step)
+        octo_hits = timeline.octo_course(this_run['steps'])
+    # time stepping done
+
+    ## Unpack Y and save results:
+    # Y is a matrix numTimePoints x nG
+    # Each col is a PN, each row holds values for a single timestep
+    # Y = this_run['Y']
+
+    # save some inputs and outputs to a struct for argout:
+    sim_results = {
+                    'T' : this_run['T'], # timing information
+                    'E' : this_run['E'],
+                    'octo_hits' : octo_hits,
+                    'K2Efinal' : this_run['K2Efinal'],
+                    'P2Kfinal' : this_run['P2Kfinal'],
+                    'nE' : nE
+                }
+    if branch_at is not None:
+        sim_results['branch'] = this_run['branch']
+    if calibrated is not None:
+        sim_results['exp_params'] = exp_params
+        sim_results['calibration'] = calibrated
+    if en_stats is not None:
+        sim_results['en_stats'] = en_stats.results()
+
+    return sim_results
+
+def branch_time( exp_params_list, margin=5 ):
+    """
+    Time until which several experiments are the same: the same start and \
+    noise calibration windows, and the same stimuli, octopamine and Hebbian \
+    learning, eg the spontaneous period and baseline puffs of experiments \
+    that only differ in their training (TR_PER_CLASS, NUM_SNIFFS or the \
+    order of the training classes).
+
+    Args:
+        exp_params_list (list): objects with timing info about experiments.
+        margin (float): [optional] seconds to stay away from the first event \
+        that differs (the stimuli are low-pass filtered, and the FRs settle).
+
+    Returns
+    -------
+        t (float)
+            branch time (seconds), margin before the first difference (or the \
+            end of the shortest experiment)
+
+    >>> t = branch_time([ exp_params_1, exp_params_20 ])
+
+    """
+    first = exp_params_list[0]
+    shared = ('sim_start', 'startPreNoiseSpontMean1', 'stopPreNoiseSpontMean1',
+        'startSpontMean2', 'stopSpontMean2', 'startSpontMean3', 'stopSpontMean3',
+        'lpParam', 'octoMag', 'durationOcto')
+    for exP in exp_params_list[1:]:
+        for name in shared:
+            if getattr(exP, name) != getattr(first, name):
+                raise ValueError('the experiments differ in {}'.format(name))
+        if not _np.array_equal(exP.class_labels, first.class_labels):
+            raise ValueError('the experiments differ in class_labels')
+
+    def events(exP):
+        # (time, description) of each event, in time order
+        stims = sorted(zip(exP.stimStarts, exP.whichClass, exP.durations, exP.classMags))
+        hebs = sorted(zip(exP.hebStarts, exP.hebDurations))
+        octos = sorted(_np.asarray(exP.octoStart, dtype=float).reshape(-1))
+        return [ [ (e[0], e) for e in stims ], [ (t, t) for t in octos ],
+            [ (e[0], e) for e in hebs ] ]
+
+    t = min( exP.sim_stop for exP in exp_params_list )
+    tracks = [ events(exP) for exP in exp_params_list ]
+    for k in range(3):
+        ref = tracks[0][k]
+        for other in tracks[1:]:
+            track = other[k]
+            same = 0
+            while same < min(len(ref), len(track)) and ref[same][1] == track[same][1]:
+                same += 1
+            if same < max(len(ref), len(track)):
+                t = min([t] + [ x[same][0] for x in (ref, track) if same < len(x) ])
+    return float(t - margin)
+
+def sde_sweep( model_params, exp_params_list, feature_array, rng=None,
+    time_step=2*0.01, integrator='euler', coarse_step=None, deterministic=None,
+    keep_E=True, prune=False ):
+    """
+    Runs several experiments on the same moth that share their start, eg a \
+    learning curve over TR_PER_CLASS: the spontaneous period and the baseline \
+    puffs (see :func:`branch_time`) are simulated once, with the first \
+    experiment, and the other experiments continue from a snapshot of the \
+    state there (FRs, plastic weights, noise calibration and noise stream). \
+    Each result is the same as that of a separate :func:`sde_wrap` run with \
+    the same arguments.
+
+    Args:
+        model_params (class): object with connection matrices, etc.
+        exp_params_list (list): objects with timing info about experiments.
+        feature_array (numpy array or list): stimuli (numFeatures x \
+        numStimsPerClass x numClasses), or one for each experiment (the \
+        stimuli before the branch point must be the same).
+        rng (Generator or int): [optional] random number generator (or seed) for \
+        the neural noise. Defaults to the rng of the first experiment.
+        time_step, integrator, coarse_step, deterministic, keep_E, prune: \
+        [optional] as in :func:`sde_wrap`.
+
+    Returns
+    -------
+        sim_results_list (list)
+            sim_results (see :func:`sde_wrap`) of each experiment
+
+    >>> results = sde_sweep(model_params, [ exp_params_1, exp_params_20 ], feature_array)
+
+    """
+    exps = list(exp_params_list)
+    features = feature_array if isinstance(feature_array, (list, tuple)) \
+        else [feature_array]*len(exps)
+    if len(features) != len(exps):
+        raise ValueError('expected one feature array per experiment')
+    rng = exps[0].rng if rng is None else make_rng(rng)
+    t = branch_time(exps)
+
+    # the images presented before the branch point (the first few of each class)
+    for exP, F in zip(exps[1:], features[1:]):
+        for c, cl in enumerate(exps[0].class_labels):
+            n = int(_np.sum((_np.asarray(exP.stimStarts) < t) & (exP.whichClass == cl)))
+            if not _np.array_equal(F[:, :n, c], features[0][:, :n, c]):
+                raise ValueError('the stimuli before the branch point differ')
+
+    options = dict(rng=rng, time_step=time_step, integrator=integrator,
+        coarse_step=coarse_step, deterministic=deterministic, keep_E=keep_E,
+        prune=prune)
+    first = sde_wrap(model_params, exps[0], features[0], branch_at=t, **options)
+    branch = first.pop('branch')
+    if branch is None:
+        raise ValueError('the first experiment ends before the branch point ({} sec)'.format(t))
+    print('shared start simulated until {} sec'.format(t))
+    return [first] + [ sde_wrap(model_params, exP, F, resume=branch, **options)
+        for exP, F in zip(exps[1:], features[1:]) ]
+
+def stim_courses( exp_params, time_step=2*0.01 ):
+    """
+    Builds the time vector and the dense stimulus and octopamine time courses \
+    of an experiment. The simulation itself uses the compact :class:`StimTimeline`.
+
+    Args:
+        exp_params (class): object with timing info about experiment, eg when stimuli are given.
+        time_step (float): [optional] simulation time step (seconds).
+
+    Returns
+    -------
+        time (numpy array)
+            [start:step:stop] vector of timepoints
+        class_mag_mat (numpy array)
+            [# of different classes X vector of time points] each entry is the \
+            strength of a digit presentation
+        octo_hits (numpy array)
+            [1 x length(time)] octopamine strengths at each timepoint
+
+    >>> time, class_mag_mat, octo_hits = stim_courses(exp_params)
+
+    """
+
+    # set time span and events:
+    time = time_vector(exp_params, time_step)
 
     class_labels = exp_params.class_labels
     # classMags = exp_params.classMags
@@ -92,46 +399,69 @@ def sde_wrap( model_params, exp_params, feature_array ):
         octo_hits[ hits ] = exp_params.octoMag
     octo_hits = _np.convolve(octo_hits, lpWindow, 'same') # the low pass filter
 
-    ## do SDE time-step evolution:
+    return time, class_mag_mat, octo_hits
 
-    # Use euler-maruyama SDE method, milstein's version.
-    #  Y (the vector of all neural firing rates) is structured as a row vector as follows: [ P, PI, L, K, E ]
-    Po = _np.ones(nP) # P are the normalized FRs of the excitatory PNs
-    PIo = _np.ones(nPI) # PI are the normed FRs of the inhib PNs
-    Lo = _np.ones(nG)
-    Ro = model_params.Rspont
-    Ko = _np.ones(model_params.nK) # K are the normalized firing rates of the Kenyon cells
-    Eo = _np.zeros(model_params.nE) # start at zeros
-    init_cond = _np.concatenate((Po, PIo, Lo, Ro, Ko, Eo) , axis=None) # initial conditions for Y
+def step_schedule( active, coarse_factor ):
+    """
+    Adaptive step schedule on a fine time grid: fine steps wherever the model \
+    is active, and steps of coarse_factor fine steps in the quiescent runs in \
+    between. A coarse step never crosses an active timepoint.
 
-    tspan = ( sim_start, sim_stop )
-    seed_val = 0 # to free up or fix randn
-    # If = 0, a random seed value will be chosen. If > 0, the seed will be defined.
+    Args:
+        active (numpy array): [bool x length(time)] timepoints that need the \
+        fine step, eg with a stimulus, octopamine or Hebbian learning (plus \
+        some settling time).
+        coarse_factor (int): number of fine steps per coarse step. None makes \
+        each quiescent run a single step.
 
-    # run the SDE evolution:
-    this_run = sde_evo_mnist(tspan, init_cond, time, class_mag_mat, feature_array,
-        octo_hits, model_params, exp_params, seed_val )
-    # time stepping done
+    Returns
+    -------
+        steps (numpy array)
+            increasing indices into the fine grid of the timepoints stepped \
+            through, starting at 0 and ending at length(time)-1
 
-    ## Unpack Y and save results:
-    # Y is a matrix numTimePoints x nG
-    # Each col is a PN, each row holds values for a single timestep
-    # Y = this_run['Y']
+    >>> steps = step_schedule( timeline.active(), 5 )
 
-    # save some inputs and outputs to a struct for argout:
-    sim_results = {
-                    'T' : this_run['T'], # timing information
-                    'E' : this_run['E'],
-                    'octo_hits' : octo_hits,
-                    'K2Efinal' : this_run['K2Efinal'],
-                    'P2Kfinal' : this_run['P2Kfinal'],
-                    'nE' : nE
-                }
+    """
+    # fine step i goes from timepoint i to i+1, and is quiet if timepoint i is
+    quiet = ~_np.asarray(active, dtype=bool)[:-1]
+    edges = _np.flatnonzero(_np.diff(_np.concatenate(( [0], quiet.astype(int), [0] ))))
+    skipped = _np.zeros(len(active), dtype=bool) # timepoints inside a coarse step
+    for a, b in zip(edges[::2], edges[1::2]):
+        # quiet run of fine steps a ... b-1
+        # (the last coarse step of the run may be shorter)
+        skipped[a+1:b] = True
+        skipped[a:b:(b - a if coarse_factor is None else coarse_factor)] = False
+    return _np.flatnonzero(~skipped)
+
+def initial_conditions( model_params ):
+    """
+    Initial firing rates for all neurons, ordered as [ P, PI, L, R, K, E ].
 
-    return sim_results
+    Args:
+        model_params (class): object with connection matrices, etc.
+
+    Returns
+    -------
+        init_cond (numpy array)
+            [n x 1] starting FRs for all neurons, order-specific
+
+    >>> init_cond = initial_conditions(model_params)
 
-def sde_evo_mnist(tspan, init_cond, time, class_mag_mat, feature_array,
-    octo_hits, mP, exP, seed_val):
+    """
+    Po = _np.ones(model_params.nP) # P are the normalized FRs of the excitatory PNs
+    PIo = _np.ones(model_params.nPI) # PI are the normed FRs of the inhib PNs
+    Lo = _np.ones(model_params.nG)
+    Ro = model_params.Rspont
+    Ko = _np.ones(model_params.nK) # K are the normalized firing rates of the Kenyon cells
+    Eo = _np.zeros(model_params.nE) # start at zeros
+    return _np.concatenate((Po, PIo, Lo, Ro, Ko, Eo) , axis=None)
+
+def sde_evo_mnist(tspan, init_cond, time, timeline, feature_array,
+    mP, exP, rng, integrator='euler', coarse_step=None, deterministic=None,
+    keep_E=True, recorder=None, prune=False, on_window=None, checkpoint=None,
+    checkpoint_every=5000, resume=None, spont_cache=None, branch_at=None,
+    en_stats=None, progress=None):
     """
 
     To include neural noise, evolve the differential equations using Euler-Maruyama, \
@@ -169,124 +499,189 @@ def sde_evo_mnist(tspan, init_cond, time, class_mag_mat, feature_array,
         time (numpy array): [start:step:stop] vector of timepoints for stepping \
         through the evolution. Note we assume that noise and FRs have the same step \
         size (based on Milstein's method).
-        class_mag_mat (numpy array): [# of different classes X vector of time points] \
-        each entry is the strength of a digit presentation.
+        timeline (class): :class:`StimTimeline` of the digit presentations, \
+        octopamine and hebbian learning.
         feature_array (numpy array): [numFeatures x numStimsPerClass x numClasses]
-        octo_hits (numpy array): [1 x length(t)] octopamine strengths at each timepoint.
         mP (class): model_params, including connection matrices, learning rates, etc.
         exP (class): experiment parameters with some timing info.
-        seed_val (int): optional arg for random number generation.
+        rng (Generator): random number generator for the Wiener noise.
+        integrator (str): [optional] 'euler' (default), 'heun' or 'exponential' \
+        (see :class:`StepKernel`).
+        coarse_step (float): [optional] time step in quiescent periods, see \
+        :func:`sde_wrap`. The fine step is used during stimuli, octopamine \
+        and Hebbian learning, and for 1 sec after them while the FRs settle.
+        deterministic (bool): [optional] noise-free fast path: no noise draws \
+        or noise calibration, and the quiescent periods are replaced by jumps \
+        to the steady state (see :meth:`StepKernel.fixed_point`) every second \
+        (or coarse_step), so only stimuli, octopamine and Hebbian learning are \
+        time stepped. None (default) uses it whenever all the noise vectors of \
+        mP are zero.
+        keep_E (bool): [optional] keep the full EN timecourses (else E is None).
+        recorder (class): [optional] :class:`Recorder` of the neural timecourses \
+        to keep. If mP.saveAllNeuralTimecourses, defaults to recording everything \
+        (into memory-mapped files in mP.timecourse_dir, if set).
+        prune (bool): [optional] skip dead populations, zero-weight pathways \
+        and zero-noise draws (see :func:`compile_model`).
+        on_window (function): [optional] called with the EN response window of \
+        each stimulus as soon as it is complete (see :func:`sde_stream`).
+        checkpoint (str): [optional] .npz file to write a checkpoint to every \
+        checkpoint_every steps: the step index, the state of all neurons, the \
+        plastic weights, the noise calibration (flags, mean spont FRs, \
+        maxSpontP2KtimesPval, and the AL and MB history while it is still \
+        needed), the state of the noise stream and the EN timecourses so far. \
+        Not compatible with a recorder.
+        checkpoint_every (int): [optional] steps between checkpoints.
+        resume (str): [optional] checkpoint to continue from, written by a run \
+        with the same arguments.
+        spont_cache (str): [optional] directory of cached spontaneous steady \
+        states. The state at the end of the noise calibration (FRs, mean spont \
+        FRs, ssMeanSpontP, ssStdSpontP, maxSpontP2KtimesPval, the EN timecourses \
+        and the noise stream) only depends on the moth, the calibration windows, \
+        the time steps and the generator state, and is saved under a hash of \
+        them (see :func:`spont_key`). Later runs with the same key start there, \
+        with the same results. Not compatible with a recorder, and unused for \
+        deterministic moths or if an event comes before the calibration ends.
+        branch_at (float): [optional] time (seconds): the whole state at the \
+        first timepoint from there on (as in a checkpoint, plus the timepoints \
+        stepped through so far) is kept in this_run['branch']. Runs of other \
+        experiments that step through the same timepoints until then can \
+        resume from it.
+        en_stats (class): [optional] :class:`ENStats`, updated with the EN FRs \
+        of each timepoint (and saved in checkpoints and cached states).
+        progress (function): [optional] progress reports, see :func:`make_progress`.
 
     Returns:
         this_run (dict):
             - T: [m x 1] timepoints used in evolution (timepoints used in evolution)
+            - steps: [m x 1] indices of T in the (fine) time vector
             - Y: [m x K] where K contains all FRs for P, L, PI, KC, etc; and each \
-            row is the FR at a given timepoint
+            row is the FR at a given timepoint. A :class:`StackedView` of the \
+            recordings (index it, or np.asarray it for a copy)
             - P2K: connection matrix
             - K2E: connection matrix
 
     """
-
-    def piecewise_lin_pseudo_sig(x, span, slope):
-        """
-        Piecewise linear 'sigmoid' used for speed when squashing neural inputs in difference eqns.
-        """
-        y = x*slope
-        y = _np.maximum(y, -span/2) # replace values below -span/2
-        y = _np.minimum(y, span/2) # replace values above span/2
-        return y
-
-    def wiener(w_sig, mean_spont_, old_, tau_, inputs_):
-        """
-        Calculate wiener noise.
-        """
-        d_ = dt*(-old_*tau_ + inputs_)
-        # Wiener noise:
-        dW_ = _np.sqrt(dt)*w_sig*mean_spont_*_np.random.normal(0,1,(d_.shape))
-        # combine them:
-        return old_ + d_ + dW_
-
-    # if argin seed_val is nonzero, fix the rand seed for reproducible results
-    if seed_val:
-        _np.random.seed(seed_val)  # Reset random state
-
-    spin = '/-\|' # create spinner for progress bar
+    return consume( _sde_evo_mnist(tspan, init_cond, time, timeline, feature_array,
+        mP, exP, rng, integrator, coarse_step, deterministic, keep_E, recorder,
+        prune, checkpoint, checkpoint_every, resume, spont_cache, branch_at,
+        en_stats, progress), on_window )
+
+def _sde_evo_mnist(tspan, init_cond, time, timeline, feature_array,
+    mP, exP, rng, integrator, coarse_step, deterministic, keep_E, recorder,
+    prune, checkpoint=None, checkpoint_every=5000, resume=None, spont_cache=None,
+    branch_at=None, en_stats=None, progress=None):
+    """
+    Generator form of :func:`sde_evo_mnist`: yields each stimulus response \
+    window as soon as it is complete, and returns this_run.
+    """
 
     # numbers of objects
-    (nC,_) = class_mag_mat.shape
+    nC = timeline.nC
     nP = mP.nG
     nL = mP.nG
     nR = mP.nG
-
-    ## noise in individual neuron FRs
-    # These are vectors, one vector for each type:
-    wPsig = mP.noisePvec.squeeze()
-    wPIsig = mP.noisePIvec.squeeze() # no PIs for mnist
-    wLsig = mP.noiseLvec.squeeze()
-    wRsig = mP.noiseRvec.squeeze()
-    wKsig = mP.noiseKvec.squeeze()
-    wEsig = mP.noiseEvec.squeeze()
-
-    # steady-state RN FR, base + noise:
-    RspontRatios = mP.Rspont/mP.Rspont.mean() # used to scale stim inputs
-
-    ## param for sigmoid that squashes inputs to neurons:
-    # the slope at x = 0 = mP.slope_param*span/4
-    pSlope = mP.slope_param*mP.cP/4
-    piSlope = mP.slope_param*mP.cPI/4 # no PIs for mnist
-    lSlope = mP.slope_param*mP.cL/4
-    rSlope = mP.slope_param*mP.cR/4
-    kSlope = mP.slope_param*mP.cK/4
+    pop_sizes = (nP, mP.nPI, nL, nR, mP.nK)
 
 #-------------------------------------------------------------------------------
 
-    dt = round(time[1] - time[0], 2) # this is determined by start, stop and step in calling function
-    N = int( (tspan[1] - tspan[0]) / dt ) # number of steps in noise evolution
+    dt = round(time[1] - time[0], 10) # this is determined by start, stop and step in calling function
+    N = int(round( (tspan[1] - tspan[0]) / dt )) # number of steps in noise evolution
     T = _np.linspace(tspan[0], tspan[1]-dt, N) # the time vector
 
+    # a noise-free moth is a deterministic ODE
+    if deterministic is None:
+        deterministic = not any( _np.any(v) for v in (mP.noisePvec, mP.noisePIvec,
+            mP.noiseLvec, mP.noiseRvec, mP.noiseKvec) )
+
+    # timepoints to step through: all of them, or (with coarse_step, or for
+    # deterministic moths) fine steps only during and shortly after stimuli,
+    # octopamine and hebbian learning
+    settle_time = 1 # seconds, ie ~7 time constants
+    active = timeline.active(extend=int(round(settle_time/dt)))
+    if deterministic:
+        # jumps to the steady state in quiescent periods, one per second
+        # (or coarse_step) so that FR statistics can still be sampled there
+        steps = step_schedule(active, int(round((coarse_step or 1)/dt)))
+    elif coarse_step:
+        max_tau = max(mP.tau_P, mP.tau_PI, mP.tau_L, mP.tau_R, mP.tau_K, mP.tau_E)
+        if integrator != 'exponential' and max_tau*coarse_step >= 2:
+            raise ValueError('coarse_step {} is unstable with the {} integrator '.format(
+                coarse_step, integrator) + '(tau*dt >= 2): use the exponential integrator')
+        steps = step_schedule(active, max(int(round(coarse_step/dt)), 1))
+    else:
+        steps = _np.arange(N)
+    T = T[steps]
+    N = len(steps)
+
 #-------------------------------------------------------------------------------
 
-    P = _np.zeros((nP, N))
-    PI = _np.zeros((mP.nPI, N)) # no PIs for mnist
-    L = _np.zeros((nL, N))
-    R = _np.zeros((nR, N))
-    K = _np.zeros((mP.nK, N))
-    E = _np.zeros((mP.nE, N))
+    # recorded timecourses (the entire evo, if mP.saveAllNeuralTimecourses)
+    if recorder is None and mP.saveAllNeuralTimecourses:
+        recorder = Recorder(directory=getattr(mP, 'timecourse_dir', None))
+    if recorder is not None and (checkpoint or resume or spont_cache):
+        raise ValueError('checkpoints do not include recorded timecourses: ' +
+            'use checkpoint, resume and spont_cache without a recorder')
+
+    # what to compute: everything, or only the live parts of the moth
+    plan = None
+    if prune:
+        plan = compile_model(mP, keep=recorder.populations if recorder is not None else ())
+        plan.report()
+
+    # the step kernel holds the double-buffered state, the plastic weights
+    # and all loop invariants
+    kernel = StepKernel(mP, dt, init_cond, integrator, plan)
+
+    # standard normal draws for the Wiener noise, drawn in blocks of steps
+    noise_block = None
+    if deterministic:
+        no_noise = [ _np.zeros(n, dtype=mP.dtype) for n in pop_sizes ]
+        next_noise = lambda: no_noise
+    elif plan is not None:
+        # no draws for noise-free populations
+        noisy = plan.noisy
+        noise_block = NoiseBlock(rng, [ n for n, z in zip(pop_sizes, noisy) if z ],
+            dtype=mP.dtype)
+        def next_noise():
+            draws = iter(noise_block.next())
+            return [ next(draws) if z else None for z in noisy ]
+    else:
+        noise_block = NoiseBlock(rng, pop_sizes, dtype=mP.dtype)
+        next_noise = noise_block.next
+
+    # AL and MB timecourses are only kept until the noise calibration is done,
+    # to save on memory (the recorder keeps any others we want)
+    Nsave = min(N, int(_np.searchsorted(T, exP.stopSpontMean3 + 5)) + 1)
+    P = _np.zeros((nP, Nsave), dtype=mP.dtype)
+    PI = _np.zeros((mP.nPI, Nsave), dtype=mP.dtype) # no PIs for mnist
+    L = _np.zeros((nL, Nsave), dtype=mP.dtype)
+    R = _np.zeros((nR, Nsave), dtype=mP.dtype)
+    K = _np.zeros((mP.nK, Nsave), dtype=mP.dtype)
+    # EN timecourses, or (if not keep_E) a ring buffer of the latest EN FRs,
+    # long enough for the stimulus response windows
+    windows = WindowStream(exP, T)
+    if keep_E:
+        E = _np.zeros((mP.nE, N), dtype=mP.dtype)
+    else:
+        E = _np.zeros((mP.nE, min(N, windows.max_steps + 1)), dtype=mP.dtype)
 
     # initialize the FR matrices with initial conditions
-    P[:,0] = init_cond[ : nP ] # col vector
-    PI[:,0] = init_cond[ nP : nP + mP.nPI ] # no PIs for mnist
-    L[:,0] = init_cond[ nP + mP.nPI : nP + mP.nPI + nL ]
-    R[:,0] = init_cond[ nP + mP.nPI + nL : nP + mP.nPI + nL + nR ]
-    K[:,0] = init_cond[ nP + mP.nPI + nL + nR : nP + mP.nPI + nL + nR + mP.nK ]
-    E[:,0] = init_cond[ -mP.nE : ]
-    # P2Kheb = mP.P2K # '-heb' suffix is used to show that it will vary with time
-    # PI2Kheb = mP.PI2K # no PIs for mnist
-    # K2Eheb = mP.K2E
-
-    P2Kmask = mP.P2K > 0
-    PI2Kmask = mP.PI2K > 0 # no PIs for mnist
-    K2Emask = mP.K2E > 0
-    newP2K = mP.P2K.copy() # initialize
-    newPI2K = mP.PI2K.copy() # no PIs for mnist
-    newK2E = mP.K2E.copy()
-
-    # initialize the counters for the various classes
-    class_counter = _np.zeros(nC)
+    old = kernel.old
+    P[:,0], PI[:,0], L[:,0], R[:,0], K[:,0] = old.P, old.PI, old.L, old.R, old.K
+    E[:,0] = old.E
 
-    # make a list of Ts for which heb is active
-    hebRegion = _np.zeros(T.shape)
-    for i in range(len(exP.hebStarts)):
-        inds = _np.bitwise_and(T >= exP.hebStarts[i], T <= (exP.hebStarts[i] + exP.hebDurations[i]))
-        hebRegion[inds] = 1
+    # online EN stats (the octopamine timepoints are known in advance)
+    if en_stats is not None:
+        en_stats.bind(exP, T, timeline.octo_course(steps), mP.nE)
+        en_stats.update(0, old.E)
 
-    ## DEBUG STEP:
-    # import matplotlib.pyplot as _plt
-    # fig, ax = _plt.subplots()
-    # ax.plot(T, hebRegion)
-    # ax.set(title='hebRegion vs T')
-    # ax.grid() # fig.savefig("test.png")
-    # _plt.show()
+    if recorder is not None:
+        recorder.allocate(T, kernel.sizes, mP.dtype)
+        recorder.record(0, old.y)
+
+    # stimulus magnitude and number of presentations so far of each class
+    class_mag = _np.zeros(nC)
+    class_counter = _np.zeros(nC)
 
 #-------------------------------------------------------------------------------
 
@@ -294,47 +689,143 @@ def sde_evo_mnist(tspan, init_cond, time, class_mag_mat, feature_array,
     meanCalc2Done = False
     meanCalc3Done = False
 
-    mean_spont_P = _np.zeros(nP)
-    mean_spont_PI = _np.zeros(mP.nPI) # no PIs for mnist
-    mean_spont_L = _np.zeros(nL)
-    mean_spont_R = _np.zeros(nR)
-    mean_spont_K = _np.zeros(mP.nK)
-    # mean_spont_E = _np.zeros(mP.nE)
-    # ssMeanSpontP = _np.zeros(nP)
-    # ssStdSpontP = _np.ones(nP)
-
     # placeholder until we have an estimate based on spontaneous PN firing rates
     maxSpontP2KtimesPval = 10
 
+    if deterministic:
+        # no noise to calibrate: the spontaneous PN FRs are the steady state
+        # without stimulus (which does not depend on the MB)
+        meanCalc1Done = meanCalc2Done = meanCalc3Done = True
+        kernel.fixed_point(False, maxSpontP2KtimesPval)
+        temp = _np.sort(mP.P2K.dot(kernel.new.P))
+        maxSpontP2KtimesPval = temp[:-1].max() # ignore the top outlier K input
+
+    thisStimClassInd = []
+    ssMeanSpontP = ssStdSpontP = _np.zeros(0)
+
+    def inputs_at(i, this_stim_class_ind):
+        # stimulus drive and octopamine at time index i, into the kernel
+        this_stim_class_ind.clear()
+        timeline.stim(i, class_mag, class_counter)
+        stim_on = kernel.set_input(class_mag, class_counter, feature_array,
+            this_stim_class_ind)
+        kernel.set_octo(timeline.octo(i))
+        return stim_on
+
+    # Heun's corrector uses the inputs at the end of the step (the classes
+    # presented then go to a separate list, as the Hebbian updates use those
+    # of the start):
+    next_inputs = None
+    if kernel.integrator == 'heun':
+        nextStimClassInd = []
+        next_inputs = lambda: inputs_at(steps[n+1], nextStimClassInd)
+
+    def snapshot(m):
+        # everything needed to continue from timepoint m: the EN timecourses
+        # are saved from column E_first (the whole ring buffer, if not keep_E)
+        E_first = 0 if keep_E else max(0, m+1-E.shape[1])
+        state = { 'n' : m, 'N' : N, 'dt' : dt, 'tspan' : tspan,
+            'y_old' : kernel.old.y, 'y_new' : kernel.new.y,
+            'meanCalcDone' : [ bool(meanCalc1Done), bool(meanCalc2Done), bool(meanCalc3Done) ],
+            'ssMeanSpontP' : ssMeanSpontP, 'ssStdSpontP' : ssStdSpontP,
+            'maxSpontP2KtimesPval' : maxSpontP2KtimesPval,
+            'E' : E[:, _np.arange(E_first, m+1) % E.shape[1]], 'E_first' : E_first }
+        for name, mean in zip(('P', 'PI', 'L', 'R', 'K'), kernel.mean_spont):
+            state['mean_spont_' + name] = mean
+        if not meanCalc3Done:
+            # the calibration windows still need the AL and MB history
+            for name, X in zip(('P', 'PI', 'L', 'R', 'K'), (P, PI, L, R, K)):
+                state['hist_' + name] = X[:, :min(m+1, Nsave)]
+        if noise_block is not None:
+            noise = noise_block.state()
+            state['noise_rng'] = rng_state_to_array(noise['rng'])
+            state['noise_pos'] = noise['pos']
+        if en_stats is not None:
+            state.update(en_stats.state())
+        return state
+
+    def restore(saved):
+        # continue from a snapshot (the plastic weights are optional)
+        nonlocal meanCalc1Done, meanCalc2Done, meanCalc3Done, ssMeanSpontP, \
+            ssStdSpontP, maxSpontP2KtimesPval
+        m = int(saved['n'])
+        kernel.old.y[:] = saved['y_old']
+        kernel.new.y[:] = saved['y_new']
+        if 'K2E' in saved:
+            kernel.load_weights(saved)
+        meanCalc1Done, meanCalc2Done, meanCalc3Done = [ bool(f) for f in saved['meanCalcDone'] ]
+        ssMeanSpontP, ssStdSpontP = saved['ssMeanSpontP'], saved['ssStdSpontP']
+        maxSpontP2KtimesPval = float(saved['maxSpontP2KtimesPval'])
+        kernel.set_noise([ saved['mean_spont_' + name].astype(mP.dtype)
+            for name in ('P', 'PI', 'L', 'R', 'K') ])
+        if not meanCalc3Done:
+            for name, X in zip(('P', 'PI', 'L', 'R', 'K'), (P, PI, L, R, K)):
+                X[:, :saved['hist_' + name].shape[1]] = saved['hist_' + name]
+        cols = int(saved['E_first']) + _np.arange(saved['E'].shape[1])
+        fits = cols > m - E.shape[1]
+        E[:, cols[fits] % E.shape[1]] = saved['E'][:, fits]
+        if noise_block is not None:
+            noise_block.restore({'rng' : rng_state_from_array(saved['noise_rng']),
+                'pos' : int(saved['noise_pos'])})
+        if en_stats is not None:
+            if 'en_stats_resp' in saved:
+                en_stats.restore(saved)
+            else:
+                # eg a calibrated state: the EN stats so far from its EN history
+                # (timepoint 0 has been added already)
+                if int(saved['E_first']) > 0:
+                    raise ValueError('cannot resume en_stats without the EN timecourses')
+                en_stats.replay(1, saved['E'][:, 1:m+1])
+        # the windows completed before timepoint m have been yielded already
+        windows.skip(m)
+        return m
+
+    # the calibrated spontaneous steady state, cached on disk: the state at
+    # the end of the noise calibration only depends on the moth, the
+    # calibration windows, the time steps up to there and the noise draws
+    cache_file = None
+    cache_step = int(_np.searchsorted(T, exP.stopSpontMean3, 'right')) + 1
+    if spont_cache and not deterministic and not resume and cache_step < N - 1 \
+        and not timeline.active()[steps[:cache_step]].any():
+        key = spont_key(mP, exP, rng, dt, steps[:cache_step+1], integrator, prune)
+        cache_file = _os.path.join(spont_cache, 'spont_{}.npz'.format(key))
+
+    # branch point for other experiments with the same start
+    branch = None
+    branch_step = None if branch_at is None else int(_np.searchsorted(T, branch_at))
+
+    start = 0
+    if resume:
+        saved = load_checkpoint(resume) if isinstance(resume, str) else resume
+        if 'steps' in saved:
+            # a branch point: only the start of the run has to match
+            check_checkpoint(saved, dt=dt, sim_start=tspan[0],
+                steps=steps[:len(saved['steps'])])
+        else:
+            check_checkpoint(saved, N=N, dt=dt, tspan=tspan)
+        start = restore(saved)
+    elif cache_file is not None and _os.path.exists(cache_file):
+        saved = load_checkpoint(cache_file)
+        # with keep_E, only entries with the whole EN prefix will do (and with
+        # en_stats, only entries with the EN stats so far, or that prefix)
+        whole = int(saved['E_first']) == 0
+        if (whole or not keep_E) and (whole or en_stats is None or 'en_stats_resp' in saved):
+            start = restore(saved)
+            print('calibrated spontaneous state loaded from ' + cache_file)
+            cache_file = None
+
+    # progress reports, at most every progress.interval seconds
+    progress = make_progress(progress)
+    progress.start(N-1, 'SDE evolution', exP, start)
+
     ## Main evolution loop:
     # iterate through time steps to get the full evolution:
-    for i in range(N-1): # i = index of the time point
-        prog = int(15*(i/N))
-        remain = 15-prog-1
-        mult = 50 # multiplier (spinner speed control)
-        print(f"{spin[int((i%(len(spin)*mult))/mult)]} SDE evolution:[{prog*'*'}{remain*' '}]", end='\r')
-
-        # step = _np.round(time[1] - time[0], 4)
-
-        # if sufficiently early, or we want the entire evo
-        if T[i]<(exP.stopSpontMean3 + 5) or mP.saveAllNeuralTimecourses:
-            oldP = P[:,i]
-            oldPI = PI[:,i] # no PIs for mnist
-            oldL = L[:,i]
-            oldR = R[:,i]
-            oldK = K[:,i]
-        else: # version to save memory:
-            oldP = P.reshape(P.shape[0], -1)[:,-1]
-            oldPI = PI.reshape(PI.shape[0], -1)[:,-1]
-            oldL = L.reshape(L.shape[0], -1)[:,-1]
-            oldR = R.reshape(R.shape[0], -1)[:,-1]
-            oldK = K.reshape(K.shape[0], -1)[:,-1]
-        oldE = E[:,i]
-        oldT = T[i]
-
-        oldP2K = newP2K.copy() # these are inherited from the previous iteration
-        oldPI2K = newPI2K.copy() # no PIs for mnist
-        oldK2E = newK2E.copy()
+    for n in range(start, N-1): # n = index of the step, i = index of the time point
+        progress.update(n, T[n])
+
+        i = steps[n]
+        oldT = T[n]
+        kernel.set_dt(dt*(steps[n+1] - i))
 
 #-------------------------------------------------------------------------------
 
@@ -353,25 +844,14 @@ def sde_evo_mnist(tspan, init_cond, time, class_mag_mat, feature_array,
             # ie we have not yet calc'ed the noise weight vectors
             inds = _np.nonzero(_np.logical_and(T > exP.startPreNoiseSpontMean1,
                 T < exP.stopPreNoiseSpontMean1))[0]
-            mean_spont_P = P[:,inds].mean(axis=1)
-            mean_spont_PI = PI[:,inds].mean(axis=1)
-            mean_spont_L = L[:,inds].mean(axis=1)
-            mean_spont_R = R[:,inds].mean(axis=1)
-            mean_spont_K = K[:,inds].mean(axis=1)
-            # mean_spont_E = E[:,inds].mean(axis=1)
+            kernel.set_noise([ X[:,inds].mean(axis=1) for X in (P, PI, L, R, K) ])
             meanCalc1Done = 1 # so we don't calc this again
 
         if adjustNoiseFlag2 and not(meanCalc2Done):
             # ie we want to calc new noise weight vectors. This stage is surplus
             inds = _np.nonzero(_np.logical_and(T > exP.startSpontMean2,
                 T < exP.stopSpontMean2))[0]
-            mean_spont_P = P[:,inds].mean(axis=1)
-            mean_spont_PI = PI[:,inds].mean(axis=1)
-            mean_spont_L = L[:,inds].mean(axis=1)
-            mean_spont_R = R[:,inds].mean(axis=1)
-            mean_spont_K = K[:,inds].mean(axis=1)
-            # mean_spont_E = E[:,inds].mean(axis=1)
-            # stdSpontP = P[:,inds].std(axis=1) # for checking progress
+            kernel.set_noise([ X[:,inds].mean(axis=1) for X in (P, PI, L, R, K) ])
             meanCalc2Done = 1 # so we don't calc this again
 
         if adjustNoiseFlag3 and not(meanCalc3Done):
@@ -382,8 +862,6 @@ def sde_evo_mnist(tspan, init_cond, time, class_mag_mat, feature_array,
                 T < exP.stopSpontMean3))[0]
             ssMeanSpontP = P[:,inds].mean(axis=1) # 'ss' means steady state
             ssStdSpontP = P[:,inds].std(axis=1)
-            ssMeanSpontPI = PI[:,inds].mean(axis=1) # no PIs for mnist
-            ssStdSpontPI = PI[:,inds].std(axis=1) # no PIs for mnist
             meanCalc3Done = 1 # so we don't calc this again
 
             # set a minimum damping on KCs based on spontaneous PN activity,
@@ -392,133 +870,21 @@ def sde_evo_mnist(tspan, init_cond, time, class_mag_mat, feature_array,
             ignoreTopN = 1 # ie ignore this many of the highest vals
             temp = temp[:-ignoreTopN] # ignore the top few outlier K inputs
             maxSpontP2KtimesPval = temp.max() # The minimum global damping on the MB
-            meanCalc3Done = 1
-
-        # create class_counter - the counters for the various classes
-        if i: # if i is not zero
-            class_counter += _np.logical_and(class_mag_mat[:,i-1]==0, class_mag_mat[:,i]>0)
-
-        # get values of feature inputs at time index i, as a col vector.
-        # This allows for simultaneous inputs by different classes, but current
-        #   experiments apply only one class at a time.
-        thisInput = _np.zeros(mP.nF)
-        thisStimClassInd = []
-        for j in range(nC):
-            if class_mag_mat[j,i]: # if class_mag_mat[j,i] is not zero
-                # thisInput += class_mag_mat[j,i]*feature_array[:,int(class_counter[j]),j]
-                imNum = int(class_counter[j] - 1) # indexing: need the '-1' so we don't run out of images
-                thisInput += class_mag_mat[j,i]*feature_array[:,imNum,j]
-                thisStimClassInd.append(j)
-
-#-------------------------------------------------------------------------------
-
-        # get value at t for octopamine:
-        thisOctoHit = octo_hits[i]
-        # octo_hits is a vector with an octopamine magnitude for each time point
-
-#-------------------------------------------------------------------------------
-
-        # dP:
-        Pinputs = (1 - thisOctoHit*mP.octo2P*mP.octoNegDiscount).squeeze()
-        Pinputs = _np.maximum(Pinputs, 0) # pos. rectify
-        Pinputs *= -mP.L2P.dot(oldL)
-        Pinputs += (mP.R2P.squeeze()*oldR)*(1 + thisOctoHit*mP.octo2P).squeeze()
-        # ie octo increases responsivity to positive inputs and to spont firing, and
-        # decreases (to a lesser degree) responsivity to neg inputs.
-        Pinputs = piecewise_lin_pseudo_sig(Pinputs, mP.cP, pSlope)
-
-        # Wiener noise
-        newP = wiener(wPsig, mean_spont_P, oldP, mP.tau_P, Pinputs)
 
-#-------------------------------------------------------------------------------
-
-        # dPI: # no PIs for mnist
-        PIinputs = (1 - thisOctoHit*mP.octo2PI*mP.octoNegDiscount).squeeze()
-        PIinputs = _np.maximum(PIinputs, 0)  # pos. rectify
-        PIinputs *= -mP.L2PI.dot(oldL)
-        PIinputs += mP.R2PI.dot(oldR)*(1 + thisOctoHit*mP.octo2PI).squeeze()
-        # ie octo increases responsivity to positive inputs and to spont firing, and
-        # decreases (to a lesser degree) responsivity to neg inputs.
-        PIinputs = piecewise_lin_pseudo_sig(PIinputs, mP.cPI, piSlope)
-
-        # Wiener noise
-        newPI = wiener(wPIsig, mean_spont_PI, oldPI, mP.tau_PI, PIinputs)
-
-#-------------------------------------------------------------------------------
-
-        # dL:
-        Linputs = (1 - thisOctoHit*mP.octo2L*mP.octoNegDiscount).squeeze()
-        Linputs = _np.maximum(Linputs, 0) # pos. rectify
-        Linputs *= -mP.L2L.dot(oldL)
-        Linputs += (mP.R2L.squeeze()*oldR)*(1 + thisOctoHit*mP.octo2L).squeeze()
-        Linputs = piecewise_lin_pseudo_sig(Linputs, mP.cL, lSlope)
-
-        # Wiener noise
-        newL = wiener(wLsig, mean_spont_L, oldL, mP.tau_L, Linputs)
-
-#-------------------------------------------------------------------------------
-
-        # dR:
-        # inputs: S = stim,  L = lateral neurons, mP.Rspont = spontaneous FR
-        # NOTE: octo does not affect mP.Rspont. It affects R's response to input odors.
-        Rinputs = (1 - thisOctoHit*mP.octo2R*mP.octoNegDiscount).squeeze()
-        Rinputs = _np.maximum(Rinputs, 0) # pos. rectify Rinputs
-        Rinputs *= -mP.L2R.dot(oldL)
-        neur_act = mP.F2R.dot(thisInput)*RspontRatios.squeeze()
-        neur_act *= (1 + thisOctoHit*mP.octo2R).squeeze()
-        Rinputs += neur_act + mP.Rspont.squeeze()
-        Rinputs = piecewise_lin_pseudo_sig(Rinputs, mP.cR, rSlope)
-
-        # Wiener noise
-        newR = wiener(wRsig, mean_spont_R, oldR, mP.tau_R, Rinputs)
+        # get the stimulus magnitudes and presentation counters of each class,
+        # the (cached, see StepKernel.set_input) RN drive and octopamine at
+        # time index i
+        stim_on = inputs_at(i, thisStimClassInd)
 
 #-------------------------------------------------------------------------------
 
-        # Enforce sparsity on the KCs:
-        # Global damping on KCs is controlled by mP.sparsityTarget
-        # (during octopamine, by octSparsityTarget).
-        # Assume that inputs to KCs form a gaussian, and use a threshold
-        # calculated via std devs to enforce the correct sparsity.
-
-        # Delays from AL -> MB and AL -> LH -> MB (~30 mSec) are ignored.
-
-        # the # st devs to give the correct sparsity
-        numNoOctoStds = _np.sqrt(2)*erfinv(1 - 2*mP.sparsityTarget)
-        numOctoStds = _np.sqrt(2)*erfinv(1 - 2*mP.octoSparsityTarget)
-        # select for either octo or no-octo
-        numStds = (1-thisOctoHit)*numNoOctoStds + thisOctoHit*numOctoStds
-        # set a minimum damping based on spontaneous PN activity, so that
-        # the MB is silent absent odor
-        minDamperVal = 1.2*maxSpontP2KtimesPval
-        thisKinput = oldP2K.dot(oldP) - oldPI2K.dot(oldPI) # (no PIs for mnist, only Ps)
-
-        damper = thisKinput.mean() + numStds*thisKinput.std()
-        damper = max(damper, minDamperVal)
-
-        dampening = (damper*mP.kGlobalDampVec).squeeze() + oldPI2K.dot(oldPI)
-        pos_octo = _np.maximum(1 - mP.octo2K*thisOctoHit, 0).squeeze()
-
-        Kinputs = oldP2K.dot(oldP)*(1 + thisOctoHit*mP.octo2K).squeeze() # but note that mP.octo2K == 0
-        Kinputs -= dampening*pos_octo # but no PIs for mnist
-        Kinputs = piecewise_lin_pseudo_sig(Kinputs, mP.cK, kSlope)
-
-        # Wiener noise
-        newK = wiener(wKsig, mean_spont_K, oldK, mP.tau_K, Kinputs)
-
-#-------------------------------------------------------------------------------
-
-        # Readout neurons E (EN = 'extrinsic neurons'):
-        # These are readouts, so there is no sigmoid.
-        # mP.octo2E == 0, since we are not stimulating ENs with octo.
-        # dWE == 0 since we assume no noise in ENs.
-        Einputs = oldK2E.dot(oldK)
-        # oldK2E.dot(oldK)*(1 + thisOctoHit*mP.octo2E) # mP.octo2E == 0
-        dE = dt*( -oldE*mP.tau_E + Einputs )
-
-        # Wiener noise
-        dWE = 0 # noise = 0 => dWE == 0
-        # combine them
-        newE = oldE + dE + dWE # always non-neg
+        if deterministic and not active[i]:
+            # quiescent period: jump to the steady state
+            kernel.fixed_point(stim_on, maxSpontP2KtimesPval)
+        else:
+            # inputs to P, PI, L, R, K and E (see StepKernel.drift), and
+            # integrator step (eg Euler-Maruyama), with Wiener noise
+            kernel.step(next_noise(), stim_on, maxSpontP2KtimesPval, next_inputs)
 
 #-------------------------------------------------------------------------------
 
@@ -530,109 +896,63 @@ def sde_evo_mnist(tspan, init_cond, time, class_mag_mat, feature_array,
         # training stimulus.
 
         # Hebbian updates are active for about half the duration of each stimulus
-        if hebRegion[i]:
-            # the PN contribution to hebbian is based on raw FR
-            #tempP = oldP.copy()
-            #tempPI = oldPI.copy() # no PIs for mnist
-            nonNegNewK = _np.maximum(newK, 0) # since newK has not yet been made non-neg
-
-            ## dP2K:
-            dp2k = (1/mP.heb_tau_PK) * nonNegNewK.reshape(-1, 1).dot(oldP.reshape(-1, 1).T)
-            dp2k *= P2Kmask #  if original synapse does not exist, it will never grow
-
-            # decay some P2K connections if wished: (not used for mnist experiments)
-            if mP.die_back_tau_PK > 0:
-                oldP2K *= -(1/mP.die_back_tau_PK)*dt
-
-            newP2K = _np.maximum(oldP2K + dp2k, 0)
-            newP2K = _np.minimum(newP2K, mP.hebMaxPK)
-
-#-------------------------------------------------------------------------------
-
-            ## dPI2K: # no PIs for mnist
-            dpi2k = (1/mP.heb_tau_PIK) * nonNegNewK.reshape(-1, 1).dot(oldPI.reshape(-1, 1).T)
-            dpi2k *= PI2Kmask # if original synapse does not exist, it will never grow
-
-            # kill small increases:
-            temp = oldPI2K.copy() # this detour prevents dividing by zero
-            temp[temp == 0] = 1
-            keepMask = dpi2k/temp
-            keepMask = keepMask.reshape(dpi2k.shape)
-            dpi2k *= keepMask
-            if mP.die_back_tau_PIK > 0:
-                oldPI2K -= oldPI2K*(1/die_back_tau_PIK)*dt
-            newPI2K = _np.maximum(oldPI2K + dpi2k, 0)
-            newPI2K = _np.minimum(newPI2K, mP.hebMaxPIK)
-
-#-------------------------------------------------------------------------------
-
-            ## dK2E:
-            #tempK = oldK
-            # oldK is already nonNeg
-            dk2e = (1/mP.heb_tau_KE) * newE.reshape(-1, 1).dot(oldK.reshape(-1, 1).T)
-            dk2e *= K2Emask
-
-            # restrict changes to just the i'th row of mP.K2E, where i = ind of training stim
-            restrictK2Emask = _np.zeros(mP.K2E.shape)
-            restrictK2Emask[thisStimClassInd,:] = 1
-            dk2e *= restrictK2Emask
-
-#-------------------------------------------------------------------------------
-
-            # inactive connections for this EN die back:
-            if mP.die_back_tau_KE:
-                # restrict dieBacks to only the trained EN
-                targetMask = _np.zeros(dk2e.shape)
-                targetMask[ dk2e == 0 ] = 1
-                targetMask *= restrictK2Emask
-                dieBack = (oldK2E + 2)*(1/mP.die_back_tau_KE)*dt
-                # the '+1' allows weights to die to absolute 0
-                oldK2E -= targetMask*dieBack
-
-            newK2E = oldK2E + dk2e
-            newK2E = _np.maximum(newK2E, 0)
-            newK2E = _np.minimum(newK2E, mP.hebMaxKE)
-
-        else: # case: no heb or no octo
-            newP2K = oldP2K.copy()
-            newPI2K = oldPI2K.copy() # no PIs for mnist
-            newK2E = oldK2E.copy()
+        # (for an exact timeline, weighted by the fraction of the step inside)
+        heb = timeline.heb(i)
+        if heb:
+            kernel.set_heb_weight(heb)
+            kernel.hebbian(thisStimClassInd)
 
 #-------------------------------------------------------------------------------
 
-        # update the evolution matrices, disallowing negative FRs.
-        if T[i]<(exP.stopSpontMean3 + 5) or mP.saveAllNeuralTimecourses:
-            # case: do not save AL and MB neural timecourses after the noise
-            #   calibration is done, to save on memory
-            P[:,i+1] = _np.maximum(newP, 0)
-            PI[:,i+1] = _np.maximum(newPI, 0) # no PIs for mnist
-            L[:,i+1] = _np.maximum(newL, 0)
-            R[:,i+1] = _np.maximum(newR, 0)
-            K[:,i+1] = _np.maximum(newK, 0)
-        else:
-            P = _np.maximum(newP, 0)
-            PI = _np.maximum(newPI, 0) # no PIs for mnist
-            L = _np.maximum(newL, 0)
-            R = _np.maximum(newR, 0)
-            K = _np.maximum(newK, 0)
-
-        E[:,i+1] = newE # always save full EN timecourses
-
-    print('\r')
+        # update the evolution matrices (negative FRs are already disallowed)
+        kernel.swap()
+        new = kernel.old
+        if n+1 < Nsave:
+            P[:,n+1] = new.P
+            PI[:,n+1] = new.PI # no PIs for mnist
+            L[:,n+1] = new.L
+            R[:,n+1] = new.R
+            K[:,n+1] = new.K
+
+        E[:,(n+1) % E.shape[1]] = new.E
+        if en_stats is not None:
+            en_stats.update(n+1, new.E)
+        if recorder is not None:
+            recorder.record(n+1, new.y)
+        yield from windows.ready(n+1, E)
+
+        if checkpoint and (n+1) % checkpoint_every == 0:
+            state = snapshot(n+1)
+            state.update(kernel.weights())
+            save_checkpoint(checkpoint, state)
+        if cache_file is not None and n+1 == cache_step:
+            _os.makedirs(spont_cache, exist_ok=True)
+            save_checkpoint(cache_file, snapshot(n+1))
+        if n+1 == branch_step:
+            # kept in memory, so everything is copied
+            branch = { key : _np.copy(value) for key, value in snapshot(n+1).items()
+                if key not in ('N', 'tspan') }
+            branch.update(kernel.weights())
+            branch['steps'] = steps[:n+2].copy()
+            branch['sim_start'] = tspan[0]
+
+    progress.finish()
     # Time-step simulation is now over.
 
     this_run = dict() # pre-allocate
-    # combine so that each row of fn output Y is a col of [P; PI; L; R; K]
+    # each row of fn output Y is [P, PI, L, R, K, E] at one timepoint: a lazy
+    # view of the recordings (which may be memory-mapped), not a stacked copy
     if mP.saveAllNeuralTimecourses:
-        Y = _np.vstack((P, PI, L, R, K, E))
-        this_run['Y'] = Y.T
+        recordings = recorder.results()
+        this_run['Y'] = StackedView([ recordings[pop] for pop in recorder.populations ])
     else:
         this_run['Y'] = []
 
     this_run['T'] = T.T # store T as a col
-    this_run['E'] = E.T # length(T) x mP.nE matrix
-    this_run['P2Kfinal'] = oldP2K
-    this_run['K2Efinal'] = oldK2E
+    this_run['steps'] = steps # indices of T in the fine time vector
+    this_run['E'] = E.T if E.shape[1] == N else None # length(T) x mP.nE matrix
+    this_run['P2Kfinal'], this_run['K2Efinal'] = kernel.final_weights()
+    this_run['branch'] = branch
 
     return this_run
 
@@ -641,13 +961,16 @@ def collect_stats(self, sim_results, exp_params, class_labels, show_time_plots,
     """
     *Collect stats on readout neurons (EN).*
     Collect stats (median, mean, and std of FR) for each digit, pre- and post-training. \
-    Digits are referred to as odors, or as odor puffs.
+    Digits are referred to as odors, or as odor puffs. If the EN timecourses \
+    were not kept, uses the stats accumulated during the simulation \
+    (sim_results['en_stats'], see :class:`ENStats`), and raises a ValueError \
+    without them.
 
     Args:
         sim_results (dict): simulation results (output from :func:`sde_wrap`)
         exp_params (class): timing info about experiment, eg when stimuli are given
         class_labels (numpy array): labels, eg 0:9 for MNIST
-        show_time_plots (bool): show EN timecourses
+        show_time_plots (bool): show EN timecourses (needs sim_results['E'])
         show_acc_plots (bool): show changes in accuracy
         images_filename (str): [optional] to generate image filenames when saving
         images_folder (str): [optional] directory to save results
@@ -684,16 +1007,26 @@ def collect_stats(self, sim_results, exp_params, class_labels, show_time_plots,
     else:
         octo_times = []
 
+    # stats accumulated during the simulation (see ENStats), if E was not kept
+    online = sim_results.get('en_stats') if sim_results['E'] is None else None
+    if sim_results['E'] is None and online is None:
+        raise ValueError('collect_stats needs the EN timecourses or the online EN stats: ' +
+            'pass en_stats=ENStats() or keep_E=True to sde_wrap')
+
     # calc spont stats
-    pre_spont = sim_results['E'][ _np.logical_and(exp_params.preHebSpontStart < sim_results['T'],
-                                    sim_results['T'] < exp_params.preHebSpontStop) ]
-    post_spont = sim_results['E'][ _np.logical_and(exp_params.postHebSpontStart < sim_results['T'],
-                                    sim_results['T'] < exp_params.postHebSpontStop) ]
+    if online is not None:
+        pre_heb_mean, pre_heb_std = online[0]['pre_spont_mean'], online[0]['pre_spont_std']
+        post_heb_mean, post_heb_std = online[0]['post_spont_mean'], online[0]['post_spont_std']
+    else:
+        pre_spont = sim_results['E'][ _np.logical_and(exp_params.preHebSpontStart < sim_results['T'],
+                                        sim_results['T'] < exp_params.preHebSpontStop) ]
+        post_spont = sim_results['E'][ _np.logical_and(exp_params.postHebSpontStart < sim_results['T'],
+                                        sim_results['T'] < exp_params.postHebSpontStop) ]
 
-    pre_heb_mean = pre_spont.mean()
-    pre_heb_std = pre_spont.std()
-    post_heb_mean = post_spont.mean()
-    post_heb_std = post_spont.std()
+        pre_heb_mean = pre_spont.mean()
+        pre_heb_std = pre_spont.std()
+        post_heb_mean = post_spont.mean()
+        post_heb_std = post_spont.std()
 
     ## Set regions to examine:
     # 1. data from exp_params
@@ -708,69 +1041,45 @@ def collect_stats(self, sim_results, exp_params, class_labels, show_time_plots,
     # make one stats plot per EN. Loop through ENs:
     for en_ind in range(sim_results['nE']):
 
-        en_resp = sim_results['E'][:, en_ind]
-
         ## calculate pre- and post-train odor response stats
         # assumes that there is at least 1 sec on either side of an odor without octo
 
-        # pre-allocate for loop
-        pre_train_resp = _np.full(len(stim_starts), _np.nan)
-        post_train_resp = _np.full(len(stim_starts), _np.nan)
-
-        for i, t in enumerate(stim_starts):
-            # Note: to find no-octo stim_starts, there is a certain amount of machinery
-            # in order to mesh with the timing data from the experiment.
-            # For some reason octo_times are not recorded exactly as listed in format
-            # short mode. So we need to use abs difference > small thresh, rather
-            # than ~ismember(t, octo_times):
-            small = 1e-8 # .00000001
-            # assign no-octo, PRE-train response val (or -1)
-            pre_train_resp[i] = -1 # as flag
-            if (len(octo_times)==0) or ((abs(octo_times - t).min() > small) and (t < exp_params.startTrain)):
-                resp_ind = _np.logical_and(t-1 < sim_results['T'], sim_results['T'] < t+1)
-                pre_train_resp[i] = en_resp[resp_ind].max()
-
-            # assign no-octo, POST-train response val (or -1)
-            post_train_resp[i] = -1
-            if len(octo_times)!=0:
-                if (abs(octo_times - t).min() > small) and (t > exp_params.endTrain):
+        if online is not None:
+            pre_train_resp = online[en_ind]['pre_train_resp']
+            post_train_resp = online[en_ind]['post_train_resp']
+        else:
+            en_resp = sim_results['E'][:, en_ind]
+
+            # pre-allocate for loop
+            pre_train_resp = _np.full(len(stim_starts), _np.nan)
+            post_train_resp = _np.full(len(stim_starts), _np.nan)
+
+            for i, t in enumerate(stim_starts):
+                # Note: to find no-octo stim_starts, there is a certain amount of machinery
+                # in order to mesh with the timing data from the experiment.
+                # For some reason octo_times are not recorded exactly as listed in format
+                # short mode. So we need to use abs difference > small thresh, rather
+                # than ~ismember(t, octo_times):
+                small = 1e-8 # .00000001
+                # assign no-octo, PRE-train response val (or -1)
+                pre_train_resp[i] = -1 # as flag
+                if (len(octo_times)==0) or ((abs(octo_times - t).min() > small) and (t < exp_params.startTrain)):
                     resp_ind = _np.logical_and(t-1 < sim_results['T'], sim_results['T'] < t+1)
-                    post_train_resp[i] = en_resp[resp_ind].max()
-
-        # pre-allocate for loop
-        pre_mean_resp, pre_median_resp, pre_std_resp, pre_num_puffs, post_mean_resp, \
-            post_median_resp, post_std_resp, post_num_puffs = \
-            [_np.full(len(class_labels), _np.nan) for _ in range(8)]
-
-        # calc no-octo stats for each odor, pre and post train:
-        for k, cl in enumerate(class_labels):
-            current_class = which_class==cl
-            pre_SA = pre_train_resp[_np.logical_and(pre_train_resp>=0, current_class)]
-            post_SA = post_train_resp[_np.logical_and(post_train_resp>=0, current_class)]
-
-            ## calculate the averaged sniffs of each sample: SA means 'sniffsAveraged'
-            # this will contain the average responses over all sniffs for each sample
-            if len(pre_SA)==0:
-                pre_mean_resp[k] = -1
-                pre_median_resp[k] = -1
-                pre_std_resp[k] = -1
-                pre_num_puffs[k] = 0
-            else:
-                pre_mean_resp[k] = pre_SA.mean()
-                pre_median_resp[k] = _np.median(pre_SA)
-                pre_std_resp[k] = pre_SA.std()
-                pre_num_puffs[k] = len(pre_SA)
-
-            if len(post_SA)==0:
-                post_mean_resp[k] = -1
-                post_median_resp[k] = -1
-                post_std_resp[k] = -1
-                post_num_puffs[k] = 0
-            else:
-                post_mean_resp[k] = post_SA.mean()
-                post_median_resp[k] = _np.median(post_SA)
-                post_std_resp[k] = post_SA.std()
-                post_num_puffs[k] = len(post_SA)
+                    pre_train_resp[i] = en_resp[resp_ind].max()
+
+                # assign no-octo, POST-train response val (or -1)
+                post_train_resp[i] = -1
+                if len(octo_times)!=0:
+                    if (abs(octo_times - t).min() > small) and (t > exp_params.endTrain):
+                        resp_ind = _np.logical_and(t-1 < sim_results['T'], sim_results['T'] < t+1)
+                        post_train_resp[i] = en_resp[resp_ind].max()
+
+        # calc no-octo stats for each odor, pre and post train (averaged
+        # over the sniffs of each class, -1 without any):
+        pre_mean_resp, pre_median_resp, pre_std_resp, pre_num_puffs = \
+            class_stats(pre_train_resp, which_class, class_labels)
+        post_mean_resp, post_median_resp, post_std_resp, post_num_puffs = \
+            class_stats(post_train_resp, which_class, class_labels)
 
         # # to plot +/- 1 std of % change in mean_resp, we want the std of our
         # # estimate of the mean = std_resp/sqrt(numPuffs). Make this calc:
@@ -834,10 +1143,10 @@ def collect_stats(self, sim_results, exp_params, class_labels, show_time_plots,
         results[en_ind]['post_mean_resp'] = post_mean_resp
         results[en_ind]['post_std_resp'] = post_std_resp
         # spont responses, pre and post training
-        results[en_ind]['pre_spont_mean'] = pre_spont.mean()
-        results[en_ind]['pre_spont_std'] = pre_spont.std()
-        results[en_ind]['post_spont_mean'] = post_spont.mean()
-        results[en_ind]['post_spont_std'] = post_spont.std()
+        results[en_ind]['pre_spont_mean'] = pre_heb_mean
+        results[en_ind]['pre_spont_std'] = pre_heb_std
+        results[en_ind]['post_spont_mean'] = post_heb_mean
+        results[en_ind]['post_spont_std'] = post_heb_std
 
     ## Plot EN timecourses normalized by mean digit response
     if show_time_plots:
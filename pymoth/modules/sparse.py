@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: sparse
+   :platform: Unix
+   :synopsis: Sparse storage of plastic connection matrices.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+from scipy import sparse as _sparse
+
+class SparseSynapses:
+    """
+
+    Plastic connection matrix (eg P2K, PI2K or K2E) that stores only the synapses \
+    that exist, in CSR form.
+
+    The sparsity pattern is fixed when the object is created: as in the dense \
+    version, if an original synapse does not exist it will never grow, so the \
+    Hebbian masks (eg P2Kmask) are implicit in the pattern. Forward products and \
+    Hebbian increments then cost O(nnz) per step instead of O(rows x cols).
+
+    Structure (same as the dense matrices):
+        * rows give the 'to' of a synapse
+        * cols give the 'from'
+
+    """
+    def __init__(self, dense):
+        """
+
+        Args:
+            dense (numpy array): [n x m] connection matrix. Entries > 0 define \
+            the (fixed) synapses.
+
+        Returns
+        -------
+            synapses (class)
+                sparse connection matrix object
+
+        >>> P2K = SparseSynapses( model_params.P2K )
+
+        """
+        self.matrix = _sparse.csr_matrix(_np.where(dense > 0, dense, 0))
+        # 'from' and 'to' indices of each stored synapse, aligned with self.matrix.data
+        self.cols = self.matrix.indices
+        self.rows = _np.repeat(_np.arange(self.matrix.shape[0]), _np.diff(self.matrix.indptr))
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def data(self):
+        """
+        Synapse weights, one entry per stored synapse.
+        """
+        return self.matrix.data
+
+    @data.setter
+    def data(self, values):
+        self.matrix.data[:] = values
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    def dot(self, x):
+        """
+        Forward product: the input to each target neuron, given the source FRs x.
+        """
+        return self.matrix.dot(x)
+
+    def copy(self):
+        """
+        Copy the weights. The sparsity pattern is shared, since it never changes.
+        """
+        new = SparseSynapses.__new__(SparseSynapses)
+        new.matrix = _sparse.csr_matrix((self.matrix.data.copy(), self.matrix.indices,
+            self.matrix.indptr), shape=self.matrix.shape, copy=False)
+        new.cols = self.cols
+        new.rows = self.rows
+        new._scratch = None
+        return new
+
+    def row_slice(self, row):
+        """
+        Positions in self.data of the synapses onto target neuron 'row'.
+        """
+        return slice(self.matrix.indptr[row], self.matrix.indptr[row+1])
+
+    def outer(self, post, pre, rate, out=None):
+        """
+
+        Hebbian increment rate*post*pre' evaluated only on the existing synapses.
+
+        Args:
+            post (numpy array): FRs of the target neurons (rows)
+            pre (numpy array): FRs of the source neurons (cols)
+            rate (float): learning rate, ie 1/heb_tau
+            out (numpy array): [optional] preallocated [nnz x 1] result
+
+        Returns
+        -------
+            increment (numpy array)
+                one entry per stored synapse, aligned with self.data
+
+        """
+        if out is None:
+            out = _np.empty(self.nnz, dtype=self.data.dtype)
+        if getattr(self, '_scratch', None) is None:
+            self._scratch = _np.empty(self.nnz, dtype=self.data.dtype)
+        _np.take(post, self.rows, out=out)
+        _np.take(pre, self.cols, out=self._scratch)
+        out *= self._scratch
+        out *= rate
+        return out
+
+    def toarray(self):
+        """
+        Dense [n x m] version of the connection matrix.
+        """
+        return self.matrix.toarray()
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
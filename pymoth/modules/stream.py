@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: stream
+   :platform: Unix
+   :synopsis: Stream EN responses to each stimulus while the simulation runs.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+
+PHASES = ('baseline', 'train', 'val')
+
+def stim_windows( exp_params, half_width=1 ):
+    """
+    Response windows of the stimuli of an experiment: the EN responses within \
+    +/- half_width seconds of each stimulus start (the same windows as in \
+    :func:`collect_stats`). Only stimuli with nonzero magnitude are included.
+
+    Args:
+        exp_params (class): object with timing info about experiment, eg when stimuli are given.
+        half_width (float): [optional] seconds on either side of the stimulus start.
+
+    Returns
+    -------
+        windows (list)
+            one dict per stimulus, in order of stimulus start:
+                index (int)
+                    index of the stimulus in exp_params.stimStarts
+                class (float)
+                    class label of the stimulus
+                phase (str)
+                    'baseline', 'train' or 'val'
+                onset (float)
+                    stimulus start (seconds)
+                start, stop (float)
+                    window bounds (seconds), exclusive
+
+    >>> windows = stim_windows(exp_params)
+
+    """
+    # stims are ordered as [ baseline, train, val ]
+    n_baseline, n_train = exp_params.numBaseline, exp_params.numTrain
+    windows = []
+    for k, (t, cl, mag) in enumerate(zip(exp_params.stimStarts, exp_params.whichClass,
+        exp_params.classMags)):
+        if mag <= 0:
+            continue
+        phase = PHASES[ (k >= n_baseline) + (k >= n_baseline + n_train) ]
+        windows.append({ 'index' : k, 'class' : cl, 'phase' : phase, 'onset' : t,
+            'start' : t - half_width, 'stop' : t + half_width })
+    return sorted(windows, key=lambda w: w['onset'])
+
+class WindowStream:
+    """
+
+    Tracks the stimulus response windows during a simulation, and cuts out \
+    the EN trace of each one as soon as its last timepoint has been computed. \
+    The EN history can be a ring buffer: it only has to hold the longest window.
+
+    """
+    def __init__(self, exp_params, T, half_width=1):
+        """
+
+        Args:
+            exp_params (class): object with timing info about experiment.
+            T (numpy array): timepoints of the simulation.
+            half_width (float): [optional] seconds on either side of the stimulus start.
+
+        >>> stream = WindowStream( exp_params, T )
+
+        """
+        self.T = T
+        self.windows = stim_windows(exp_params, half_width)
+        # step indices [a, b) of each window, ie start < T < stop
+        self.bounds = [ (int(_np.searchsorted(T, w['start'], 'right')),
+            int(_np.searchsorted(T, w['stop'], 'left'))) for w in self.windows ]
+        self.pending = sorted(range(len(self.windows)), key=lambda k: self.bounds[k][1])
+        self.pos = 0
+
+    @property
+    def max_steps(self):
+        """
+        Number of timepoints in the longest window.
+        """
+        return max([ b - a for a, b in self.bounds ] + [0])
+
+    def ready(self, n, E):
+        """
+
+        Windows completed once timepoint n has been computed.
+
+        Args:
+            n (int): index of the latest computed timepoint.
+            E (numpy array): [nE x buffer length] EN history, where timepoint \
+            i is stored in column i % buffer length.
+
+        Returns
+        -------
+            windows (list)
+                one dict per completed window (see :func:`stim_windows`), with \
+                T (the window's timepoints) and E ([timepoints x nE] EN trace)
+
+        """
+        done = []
+        while self.pos < len(self.pending):
+            k = self.pending[self.pos]
+            a, b = self.bounds[k]
+            if b - 1 > n:
+                break
+            window = dict(self.windows[k])
+            window['T'] = self.T[a:b]
+            window['E'] = E[:, _np.arange(a, b) % E.shape[1]].T
+            done.append(window)
+            self.pos += 1
+        return done
+
+    def skip(self, n):
+        """
+        Pass over the windows completed once timepoint n has been computed, \
+        without cutting them out (eg when resuming from a checkpoint).
+        """
+        while self.pos < len(self.pending) and self.bounds[self.pending[self.pos]][1] - 1 <= n:
+            self.pos += 1
+
+def consume( stream, on_window=None ):
+    """
+    Run a simulation stream (eg :func:`sde_stream`) to the end, passing each \
+    window to a callback.
+
+    Args:
+        stream (generator): yields windows, and returns the simulation results.
+        on_window (function): [optional] called with each window dict.
+
+    Returns
+    -------
+        results
+            the return value of the stream
+
+    >>> sim_results = consume( sde_stream(model_params, exp_params, feature_array), print )
+
+    """
+    while True:
+        try:
+            window = next(stream)
+        except StopIteration as done:
+            return done.value
+        if on_window is not None:
+            on_window(window)
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
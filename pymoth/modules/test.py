@@ -1,5 +1,8 @@
 from ..MNIST_all import test_MNIST
-from . import test_classify, test_generate, test_params
+from . import test_classify, test_generate, test_params, test_sde, test_ensemble, \
+    test_sparse, test_kernel, test_jit, test_validate, \
+    test_rng, test_stream, test_record, test_compiler, test_timeline, test_lanes, \
+    test_checkpoint, test_calibrate, test_enstats, test_progress
 
 def main():
 
@@ -11,5 +14,37 @@ def main():
 
     test_params.main()
 
+    test_sde.main()
+
+    test_ensemble.main()
+
+    test_sparse.main()
+
+    test_kernel.main()
+
+    test_jit.main()
+
+    test_validate.main()
+
+    test_rng.main()
+
+    test_stream.main()
+
+    test_record.main()
+
+    test_compiler.main()
+
+    test_timeline.main()
+
+    test_lanes.main()
+
+    test_checkpoint.main()
+
+    test_calibrate.main()
+
+    test_enstats.main()
+
+    test_progress.main()
+
 if __name__ == '__main__':
     main()
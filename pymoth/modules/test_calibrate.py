@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .calibrate import RunningStats, Calibration, shift_schedule
+from .rng import make_rng
+from .sde import sde_wrap, collect_stats
+from .params import ModelParams, ExpParams
+
+def main():
+
+    print('Testing calibrate module:')
+
+    # test RunningStats against numpy, including merged blocks (of an
+    # autocorrelated, AR(1), series)
+    x = np.zeros( (400, 4) )
+    for t in range(1, len(x)):
+        x[t] = 0.9*x[t-1] + np.random.randn( 4 )
+    whole, a, b = RunningStats( 4 ), RunningStats( 4 ), RunningStats( 4 )
+    for row in x:
+        whole.add( row )
+    for row in x[:150]:
+        a.add( row )
+    for row in x[150:]:
+        b.add( row )
+    a.merge( b )
+    assert a.count == 400
+    assert np.allclose( a.mean, x.mean(axis=0) )
+    assert np.allclose( np.sqrt(a.var()), x.std(axis=0) )
+    assert np.allclose( a.lag, whole.lag ) and np.array_equal( a.prev, whole.prev )
+    assert np.allclose( a.sem(), whole.sem() )
+    print('\tRunningStats method test passed')
+
+    # test shift_schedule
+    dummy_exp_params = ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    shifted = shift_schedule( dummy_exp_params, 20 )
+    assert np.array_equal( shifted.stimStarts, dummy_exp_params.stimStarts - 20 )
+    assert shifted.sim_stop == dummy_exp_params.sim_stop - 20
+    assert shifted.stopSpontMean3 == dummy_exp_params.stopSpontMean3
+    print('\tshift_schedule method test passed')
+
+    # test sde_wrap with the adaptive calibration: it ends before the fixed
+    # windows, and the shortened experiment is simulated
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.create_connection_matrix()
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
+    sim_results = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        rng=make_rng(5), calibration=Calibration() )
+    report = sim_results['calibration']
+    exp_params = sim_results['exp_params']
+    assert len(report['stage_ends']) == 3
+    assert report['stage_ends'][-1] <= dummy_exp_params.stopSpontMean3 + 0.1
+    assert report['shift'] > 0
+    assert exp_params.sim_stop == dummy_exp_params.sim_stop - report['shift']
+    assert sim_results['T'][-1] < exp_params.sim_stop
+    collect_stats( None, sim_results, exp_params, exp_params.class_labels, False, False )
+    print('\tsde_wrap (calibration) method test passed')
+
+if __name__ == '__main__':
+    main()
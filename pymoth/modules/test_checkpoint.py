@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import os
+import tempfile
+import numpy as np
+from .checkpoint import save_checkpoint, load_checkpoint, check_checkpoint, \
+    rng_state_to_array, rng_state_from_array, fingerprint
+from .rng import make_rng
+from .sde import sde_wrap
+from .params import ModelParams, ExpParams
+
+class Interrupted(Exception):
+    pass
+
+def main():
+
+    print('Testing checkpoint module:')
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'run.npz')
+
+    # test save_checkpoint and load_checkpoint
+    save_checkpoint( path, {'n' : 7, 'y' : np.arange(3.)} )
+    state = load_checkpoint( path )
+    assert int(state['n']) == 7 and np.array_equal( state['y'], np.arange(3.) )
+    assert not os.path.exists( path + '.tmp' )
+    check_checkpoint( state, n=7 )
+    try:
+        check_checkpoint( state, n=8 )
+        raise AssertionError('mismatched checkpoint accepted')
+    except ValueError:
+        pass
+    print('\tsave_checkpoint and load_checkpoint methods test passed')
+
+    # test the rng state round trip (philox states hold arrays)
+    for bit_generator in ('pcg64', 'philox'):
+        rng = make_rng( 1, bit_generator )
+        rng.normal()
+        copy = make_rng( 2, bit_generator )
+        copy.bit_generator.state = rng_state_from_array( rng_state_to_array(
+            rng.bit_generator.state ) )
+        assert copy.normal() == rng.normal()
+    print('\trng_state_to_array method test passed')
+
+    # test fingerprint
+    assert fingerprint( np.arange(3), 'euler' ) == fingerprint( np.arange(3), 'euler' )
+    assert fingerprint( np.arange(3) ) != fingerprint( np.arange(3.) )
+    assert fingerprint( {'a' : 1, 'b' : [2]} ) == fingerprint( {'b' : [2], 'a' : 1} )
+    print('\tfingerprint method test passed')
+
+    # test resuming: a run interrupted after a checkpoint and resumed from it
+    # gives the same results as an uninterrupted run
+    model_params = ModelParams( 20, 10 )
+    model_params.create_connection_matrix()
+    exp_params = ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    feature_array = np.random.rand( 20, 3, 10 )
+    full = sde_wrap( model_params, exp_params, feature_array, rng=make_rng(5) )
+
+    for keep_E in (True, False):
+        seen = []
+        def on_window(window):
+            seen.append(window['index'])
+            if len(seen) == 4:
+                raise Interrupted()
+        try:
+            sde_wrap( model_params, exp_params, feature_array, rng=make_rng(5),
+                keep_E=keep_E, on_window=on_window, checkpoint=path, checkpoint_every=300 )
+            raise AssertionError('run was not interrupted')
+        except Interrupted:
+            pass
+        assert int(load_checkpoint( path )['n']) > 0
+        resumed_windows = []
+        resumed = sde_wrap( model_params, exp_params, feature_array, rng=make_rng(6),
+            keep_E=keep_E, on_window=lambda w: resumed_windows.append(w['index']),
+            resume=path )
+        assert np.array_equal( resumed['K2Efinal'], full['K2Efinal'] )
+        assert np.array_equal( resumed['P2Kfinal'], full['P2Kfinal'] )
+        if keep_E:
+            assert np.array_equal( resumed['E'], full['E'] )
+        # the remaining windows, and not those before the checkpoint
+        assert resumed_windows and resumed_windows[0] not in seen[:-1]
+    print('\tsde_wrap (resume) method test passed')
+
+    # test the spontaneous state cache: the first run fills it, the second
+    # starts from it, and both match an uncached run
+    cache = os.path.join(folder, 'spont')
+    for _ in range(2):
+        cached = sde_wrap( model_params, exp_params, feature_array, rng=make_rng(5),
+            spont_cache=cache )
+        assert len(os.listdir( cache )) == 1
+        assert np.array_equal( cached['E'], full['E'] )
+        assert np.array_equal( cached['K2Efinal'], full['K2Efinal'] )
+    # another noise seed is another entry
+    sde_wrap( model_params, exp_params, feature_array, rng=make_rng(6), spont_cache=cache )
+    assert len(os.listdir( cache )) == 2
+    print('\tsde_wrap (spont_cache) method test passed')
+
+if __name__ == '__main__':
+    main()
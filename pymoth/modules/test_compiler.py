@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .compiler import compile_model
+from .kernel import StepKernel
+from .params import ModelParams, ExpParams
+from .sde import initial_conditions, sde_wrap
+
+def main():
+
+    print('Testing compiler module:')
+
+    # create dummy data (noise-free, so that pruning cannot change the noise draws)
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.noise = 0
+    dummy_model_params.create_connection_matrix()
+    plan = compile_model( dummy_model_params )
+    assert not plan.live['PI'] and not plan.paths['PI2K'] and not plan.paths['octo2K']
+    assert not any(plan.noisy)
+    assert plan.flops[1] < plan.flops[0] and plan.draws[1] == 0
+    assert compile_model( dummy_model_params, keep=('PI',) ).live['PI']
+    print('\tcompile_model method test passed')
+
+    # test that a pruned step computes the same FRs
+    init_cond = initial_conditions( dummy_model_params )
+    kernels = [ StepKernel( dummy_model_params, 0.02, init_cond, plan=p ) for p in (None, plan) ]
+    for kernel in kernels:
+        kernel.step( [ np.zeros(n) for n in kernel.sizes[:5] ], False, 0 )
+    assert np.array_equal( kernels[0].new.E, kernels[1].new.E )
+    assert np.array_equal( kernels[1].new.PI, init_cond[kernels[1].sizes[0]:][:kernels[1].sizes[1]] )
+    print('\tStepKernel class (pruned) test passed')
+
+    # test a pruned simulation against the full one
+    dummy_exp_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
+    sim_results = [ sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        rng=1, deterministic=False, prune=p ) for p in (False, True) ]
+    assert np.array_equal( sim_results[0]['E'], sim_results[1]['E'] )
+    assert np.array_equal( sim_results[0]['K2Efinal'], sim_results[1]['K2Efinal'] )
+    print('\tsde_wrap (prune) method test passed')
+
+if __name__ == '__main__':
+    main()
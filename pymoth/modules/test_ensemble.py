@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import copy
+import numpy as np
+from .ensemble import sde_wrap_ensemble
+from .sde import sde_wrap, collect_stats
+from .params import ModelParams, ExpParams
+
+def main():
+
+    print('Testing ensemble module:')
+
+    # create dummy data: two moths with different learning rates
+    dummy_model_params = []
+    for goal in (5, 10):
+        model_params = ModelParams( 20, goal )
+        model_params.create_connection_matrix()
+        dummy_model_params.append( model_params )
+    dummy_exp_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
+
+    # test sde_wrap_ensemble
+    sim_results = sde_wrap_ensemble( dummy_model_params, dummy_exp_params, dummy_feature_array )
+    assert len(sim_results) == len(dummy_model_params)
+
+    # an ensemble of one moth reproduces sde_wrap, given the same rng
+    single = sde_wrap_ensemble( dummy_model_params[:1], dummy_exp_params,
+        dummy_feature_array, rng=3 )[0]
+    ref = sde_wrap( dummy_model_params[0], dummy_exp_params, dummy_feature_array, rng=3 )
+    for key in ('E', 'P2Kfinal', 'K2Efinal'):
+        assert np.allclose( single[key], ref[key] )
+
+    # also at another time step (with the hebbian increments scaled to match)
+    single = sde_wrap_ensemble( dummy_model_params[:1], dummy_exp_params,
+        dummy_feature_array, rng=3, time_step=0.04 )[0]
+    ref = sde_wrap( dummy_model_params[0], dummy_exp_params, dummy_feature_array, rng=3,
+        time_step=0.04 )
+    assert len(single['T']) == len(ref['T'])
+    for key in ('E', 'P2Kfinal', 'K2Efinal'):
+        assert np.allclose( single[key], ref[key] )
+    print('\tsde_wrap_ensemble method test passed')
+
+    # each moth's results can be passed to collect_stats
+    for moth_results in sim_results:
+        collect_stats( None, moth_results, dummy_exp_params, dummy_exp_params.class_labels,
+            False, False )
+    print('\tcollect_stats compatibility test passed')
+
+    # float32 moths are simulated in float32, and dtypes cannot be mixed
+    float32_model_params = [ copy.deepcopy(mP) for mP in dummy_model_params ]
+    for mP in float32_model_params:
+        mP.set_dtype( np.float32 )
+    float32_results = sde_wrap_ensemble( float32_model_params, dummy_exp_params,
+        dummy_feature_array, rng=1 )
+    for moth_results in float32_results:
+        assert moth_results['E'].dtype == np.float32
+        assert moth_results['K2Efinal'].dtype == np.float32
+        assert moth_results['P2Kfinal'].dtype == np.float32
+    try:
+        sde_wrap_ensemble( [ dummy_model_params[0], float32_model_params[1] ],
+            dummy_exp_params, dummy_feature_array )
+        assert False, 'mixed dtypes should raise'
+    except ValueError:
+        pass
+    print('\tsde_wrap_ensemble (float32) method test passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import os
+import tempfile
+import numpy as np
+from .enstats import ENStats, class_stats
+from .sde import sde_wrap, collect_stats
+from .params import ModelParams, ExpParams
+
+KEYS = ('pre_train_resp', 'post_train_resp', 'pre_mean_resp', 'pre_std_resp',
+    'post_mean_resp', 'post_std_resp', 'pre_spont_mean', 'pre_spont_std',
+    'post_spont_mean', 'post_spont_std')
+
+def same_stats( a, b ):
+    return all( np.allclose(x[k], y[k], rtol=1e-6) for x, y in zip(a, b) for k in KEYS )
+
+def main():
+
+    print('Testing enstats module:')
+
+    # test class_stats
+    resp = np.array([ 1., 3., -1., 2., -1. ])
+    mean_resp, median_resp, std_resp, num_puffs = class_stats( resp,
+        np.array([ 0, 0, 1, 1, 2 ]), np.array([ 0, 1, 2 ]) )
+    assert np.array_equal( mean_resp, [ 2, 2, -1 ] )
+    assert np.array_equal( num_puffs, [ 2, 1, 0 ] )
+    assert std_resp[0] == 1 and std_resp[2] == -1
+    print('\tclass_stats method test passed')
+
+    # create dummy data
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.create_connection_matrix()
+    dummy_exp_params = ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
+
+    # test sde_wrap with ENStats: the same stats as collect_stats of the full
+    # EN timecourses
+    en_stats = ENStats()
+    sim_results = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        rng=1, en_stats=en_stats )
+    ref = collect_stats( None, sim_results, dummy_exp_params,
+        dummy_exp_params.class_labels, False, False )
+    assert same_stats( sim_results['en_stats'], ref )
+    print('\tsde_wrap (en_stats) method test passed')
+
+    # without the EN timecourses, collect_stats uses the online stats
+    online_results = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        rng=1, keep_E=False, en_stats=ENStats() )
+    assert online_results['E'] is None
+    online = collect_stats( None, online_results, dummy_exp_params,
+        dummy_exp_params.class_labels, False, False )
+    assert same_stats( online, ref )
+    assert np.allclose( online[0]['percent_change_mean_resp'], ref[0]['percent_change_mean_resp'] )
+
+    # neither the EN timecourses nor the online stats: a clear error
+    try:
+        collect_stats( None, sde_wrap( dummy_model_params, dummy_exp_params,
+            dummy_feature_array, rng=1, keep_E=False ), dummy_exp_params,
+            dummy_exp_params.class_labels, False, False )
+        assert False, 'collect_stats without E or en_stats should raise'
+    except ValueError:
+        pass
+    print('\tcollect_stats (en_stats) method test passed')
+
+    # the stats are checkpointed: resuming gives the same results
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, 'run.npz')
+        sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array, rng=1,
+            keep_E=False, en_stats=ENStats(), checkpoint=checkpoint,
+            checkpoint_every=2000 )
+        resumed = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+            rng=1, keep_E=False, en_stats=ENStats(), resume=checkpoint )
+    assert same_stats( resumed['en_stats'], ref )
+    print('\tENStats (resume) method test passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .jit import resolve_backend
+from .sde import sde_wrap
+from .params import ModelParams, ExpParams
+
+def main():
+
+    print('Testing jit module:')
+
+    # test resolve_backend
+    backend = resolve_backend( 'numba' )
+    assert backend in ( 'numba', 'numpy' )
+    try:
+        resolve_backend( 'fortran' )
+        raise AssertionError('unknown backend accepted')
+    except ValueError:
+        pass
+    print('\tresolve_backend method test passed')
+    if backend == 'numpy':
+        print('\t(numba not installed, compiled backend not tested)')
+        return
+
+    # create dummy data: a noise-free moth, so that both backends are deterministic
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.create_connection_matrix()
+    for pop in ( 'P', 'PI', 'L', 'R', 'K' ):
+        noise_vec = getattr( dummy_model_params, 'noise{}vec'.format(pop) )
+        setattr( dummy_model_params, 'noise{}vec'.format(pop), 0*noise_vec )
+    dummy_exp_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
+
+    # test sde_evo_jit against the numpy reference
+    reference = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        deterministic=False )
+    compiled = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        backend='numba' )
+    assert np.allclose( compiled['E'], reference['E'], rtol=1e-6, atol=1e-8 )
+    assert np.allclose( compiled['K2Efinal'], reference['K2Efinal'], rtol=1e-6, atol=1e-8 )
+    print('\tsde_evo_jit method test passed')
+
+    # with noise: given the same generator, both backends consume the same noise draws
+    noisy_model_params = ModelParams( 20, 10 )
+    noisy_model_params.create_connection_matrix()
+    reference = sde_wrap( noisy_model_params, dummy_exp_params, dummy_feature_array, rng=1 )
+    compiled = sde_wrap( noisy_model_params, dummy_exp_params, dummy_feature_array,
+        backend='numba', rng=1 )
+    assert np.allclose( compiled['E'], reference['E'], rtol=1e-6, atol=1e-8 )
+    print('\tnoisy sde_evo_jit method test passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .kernel import StepKernel
+from .params import ModelParams
+from .sde import initial_conditions
+
+def main():
+
+    print('Testing kernel module:')
+
+    # create dummy data
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.create_connection_matrix()
+    init_cond = initial_conditions( dummy_model_params )
+    kernel = StepKernel( dummy_model_params, 0.02, init_cond )
+    assert np.allclose( kernel.old.y, init_cond )
+    print('\tStepKernel class test passed')
+
+    # test one noise-free Euler step against the explicit update
+    kernel.drift( kernel.old, False, 0 )
+    kernel.euler( [ np.zeros(n) for n in kernel.sizes[:5] ] )
+    expected = np.maximum( kernel.old.R + 0.02*(kernel.inputs.R - \
+        dummy_model_params.tau_R*kernel.old.R), 0 )
+    assert np.allclose( kernel.new.R, expected )
+    assert (kernel.new.y[:-dummy_model_params.nE] >= 0).all()
+    new_y = kernel.new.y
+    kernel.swap()
+    assert kernel.old.y is new_y
+    print('\tdrift, euler and swap methods test passed')
+
+    # test the stacked lateral inhibition against the separate products
+    L2Pdot, L2PIdot, L2Ldot, L2Rdot = kernel.Ldot
+    assert np.allclose( L2Pdot, dummy_model_params.L2P.dot(kernel.new.L) )
+    assert np.allclose( L2PIdot, dummy_model_params.L2PI.dot(kernel.new.L) )
+    assert np.allclose( L2Ldot, dummy_model_params.L2L.dot(kernel.new.L) )
+    assert np.allclose( L2Rdot, dummy_model_params.L2R.dot(kernel.new.L) )
+    print('\tstacked lateral inhibition test passed')
+
+    # test the other integrators on one noise-free step
+    zero_noise = [ np.zeros(n) for n in kernel.sizes[:5] ]
+    exp_kernel = StepKernel( dummy_model_params, 0.1, init_cond, integrator='exponential' )
+    exp_kernel.step( zero_noise, False, 0 )
+    decay = np.exp( -dummy_model_params.tau_R*0.1 )
+    expected = np.maximum( decay*exp_kernel.old.R + \
+        (1 - decay)/dummy_model_params.tau_R*exp_kernel.inputs.R, 0 )
+    assert np.allclose( exp_kernel.new.R, expected )
+    # heun approaches euler as dt -> 0
+    news = []
+    for integrator in ('euler', 'heun'):
+        k = StepKernel( dummy_model_params, 1e-5, init_cond, integrator=integrator )
+        k.step( zero_noise, False, 0 )
+        news.append( k.new.y - k.old.y )
+    assert np.allclose( news[0], news[1], rtol=1e-3, atol=1e-12 )
+    try:
+        StepKernel( dummy_model_params, 0.02, init_cond, integrator='rk4' )
+        assert False
+    except ValueError:
+        pass
+    print('\tstep method (heun, exponential integrators) test passed')
+
+    # test set_input: the cached, scaled stimulus drive matches the full product
+    features = np.random.rand( 20, 3, 10 )
+    stim_kernel = StepKernel( dummy_model_params, 0.02, init_cond )
+    assert stim_kernel.F2Rrows is not None # one RN per feature
+    classes = []
+    assert stim_kernel.set_input( np.eye(10)[2]*0.5, np.full(10, 2), features, classes )
+    assert classes == [2]
+    expected = dummy_model_params.F2R.dot( 0.5*features[:,1,2] )*stim_kernel.RspontRatios
+    assert np.allclose( stim_kernel.drive, expected )
+    print('\tset_input method test passed')
+
+    # test fixed_point: the result is a steady state of the noise-free step
+    fp_kernel = StepKernel( dummy_model_params, 0.02, init_cond )
+    fp_kernel.fixed_point( False, 0 )
+    fp_kernel.swap()
+    steady = fp_kernel.old.y.copy()
+    fp_kernel.step( zero_noise, False, 0 )
+    assert np.allclose( fp_kernel.new.y, steady, atol=1e-8 )
+    print('\tfixed_point method test passed')
+
+    # test hebbian: K2E only grows into the trained EN
+    K2E = kernel.K2E.copy()
+    kernel.old.K[:] = 1
+    kernel.new.E[:] = 1
+    kernel.hebbian( [3] )
+    changed = np.nonzero( (kernel.K2E != K2E).any(axis=1) )[0]
+    assert set(changed) <= {3}
+    print('\thebbian method test passed')
+
+    # test the active-set K2E hebbian updates against the full updates
+    kernels = []
+    for active_kc_max in (0, 0.25):
+        dummy_model_params.active_kc_max = active_kc_max
+        k = StepKernel( dummy_model_params, 0.02, init_cond )
+        k.old.K[:] = 0
+        k.old.K[::50] = 1 # 12 of 600 KCs active
+        k.drift( k.old, False, 0 )
+        k.new.E[:] = 1
+        k.hebbian( [3] )
+        kernels.append(k)
+    assert kernels[0].active_kcs( kernels[0].old.K ) is None
+    assert len( kernels[1].active_kcs( kernels[1].old.K ) ) == 12
+    assert np.allclose( kernels[0].inputs.E, kernels[1].inputs.E )
+    assert np.allclose( kernels[0].K2E, kernels[1].K2E )
+    print('\tactive_kcs method test passed')
+
+if __name__ == '__main__':
+    main()
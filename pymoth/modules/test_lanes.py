@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .lanes import calibrate_spont, sde_lanes
+from .sde import sde_wrap, collect_stats
+from .params import ModelParams, ExpParams
+
+def main():
+
+    print('Testing lanes module:')
+
+    # create dummy data (a noise free moth, so the lanes match the full run)
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.noise = 0
+    dummy_model_params.create_connection_matrix()
+    dummy_exp_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
+
+    # test calibrate_spont
+    spont = calibrate_spont( dummy_model_params, dummy_exp_params )
+    assert spont['T'] > dummy_exp_params.stopSpontMean3
+    assert len(spont['y']) == len(np.concatenate(spont['mean_spont'])) + dummy_model_params.nE
+    print('\tcalibrate_spont method test passed')
+
+    # test sde_lanes against the sequential simulation
+    sim_results = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        deterministic=False )
+    results = collect_stats( None, sim_results, dummy_exp_params,
+        dummy_exp_params.class_labels, False, False )
+    lane_results = sde_lanes( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        sim_results['P2Kfinal'], sim_results['K2Efinal'], spont=spont )
+    assert lane_results['peaks'].shape == (20, dummy_model_params.nE)
+    pre_train_resp = np.array([ r['pre_train_resp'] for r in results ])
+    post_train_resp = np.array([ r['post_train_resp'] for r in results ])
+    assert np.allclose( lane_results['pre_train_resp'], pre_train_resp, rtol=1e-4, atol=1e-4 )
+    assert np.allclose( lane_results['post_train_resp'], post_train_resp, rtol=1e-4, atol=1e-4 )
+    print('\tsde_lanes method test passed')
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@
 
 # import packages and modules
 import numpy as np
-from .params import ModelParams, ExpParams
+from .params import ModelParams, ExpParams, Protocol
 
 def main():
 
@@ -16,9 +16,40 @@ def main():
     model_params.create_connection_matrix()
     print('\tcreate_connection_matrix method test passed')
 
+    # test ModelParams.set_dtype( dtype )
+    model_params.set_dtype( np.float32 )
+    assert model_params.P2K.dtype == np.float32 and model_params.K2E.dtype == np.float32
+    print('\tset_dtype method test passed')
+
+    # test a noise free moth
+    noise_free_params = ModelParams( 10, 10 )
+    noise_free_params.noise = 0
+    noise_free_params.create_connection_matrix()
+    assert not noise_free_params.noiseRvec.any() and not noise_free_params.noisePvec.any()
+    print('\tnoise free create_connection_matrix method test passed')
+
     # test ExpParams(train_classes, class_labels, val_per_class )
     experiment_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    assert list(experiment_params.baselineTimes[:3]) == [30, 40, 50]
+    assert experiment_params.trainTimes[0] == 145 and experiment_params.sim_stop == 315
     print('\tExpParams class test passed')
 
+    # test Protocol: a compact protocol gives the same events, sooner
+    compact_params = ExpParams( np.array(range(10)), np.array(range(10)), 2,
+        protocol=Protocol.compact() )
+    assert np.array_equal( compact_params.whichClass, ExpParams( np.array(range(10)),
+        np.array(range(10)), 2 ).whichClass )
+    assert np.all( np.diff(compact_params.stimStarts) >= 2 )
+    assert compact_params.postHebSpontStop > compact_params.postHebSpontStart
+    summary = compact_params.report()
+    assert summary['steps'] == int(round(summary['duration']/0.02))
+    assert summary['duration'] < experiment_params.report()['duration']
+    try:
+        Protocol( isi=1 )
+        raise AssertionError('unsafe protocol accepted')
+    except ValueError:
+        pass
+    print('\tProtocol class test passed')
+
 if __name__ == '__main__':
     main()
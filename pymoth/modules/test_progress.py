@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import io
+import contextlib
+import numpy as np
+from .progress import Progress, make_progress
+from .sde import sde_wrap
+from .params import ModelParams, ExpParams
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+def main():
+
+    print('Testing progress module:')
+
+    dummy_exp_params = ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+
+    # test Progress with a fake clock: one update per interval, and a last one
+    now = [0.]
+    updates = []
+    progress = Progress( interval=1, sink=updates.append, clock=lambda: now[0] )
+    progress.start( 100, exp_params=dummy_exp_params )
+    for n in range(100):
+        now[0] = 0.1*n
+        progress.update( n, dummy_exp_params.sim_start + n )
+    progress.finish()
+    assert len(updates) == 10 and updates[-1]['done'] and updates[-1]['step'] == 100
+    assert np.isclose( updates[0]['rate'], 10 ) and np.isclose( updates[0]['eta'], 9 )
+    assert updates[0]['phase'] == 'settle'
+    print('\tProgress method test passed')
+
+    # test the terminal line: only when stdout is a terminal
+    for stdout, shown in ((io.StringIO(), False), (Terminal(), True)):
+        with contextlib.redirect_stdout(stdout):
+            progress = Progress( interval=0 )
+            progress.start( 10 )
+            for n in range(10):
+                progress.update( n )
+            progress.finish()
+        assert ('SDE evolution' in stdout.getvalue()) == shown
+    print('\tProgress (terminal) method test passed')
+
+    # test make_progress
+    assert make_progress( progress ) is progress
+    assert make_progress( print ).sink is print
+    assert not make_progress( False ).terminal
+    print('\tmake_progress method test passed')
+
+    # test sde_wrap with a sink
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.create_connection_matrix()
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
+    updates = []
+    sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array, rng=1,
+        progress=Progress( interval=0.1, sink=updates.append ) )
+    assert updates[-1]['done'] and updates[-1]['label'] == 'SDE evolution'
+    assert all( u['phase'] in ('settle', 'baseline', 'train', 'val') for u in updates[:-1] )
+    print('\tsde_wrap (progress) method test passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import os
+import tempfile
+import numpy as np
+from .record import Recorder, StackedView
+from .sde import sde_wrap
+from .params import ModelParams, ExpParams
+
+def main():
+
+    print('Testing record module:')
+
+    # test Recorder on a dummy timeline
+    T = np.arange(100)*0.02
+    recorder = Recorder( populations=('R', 'E'), neurons={'R': [0, 2]}, stride=10,
+        window=(0.5, None), capacity=3 )
+    recorder.allocate( T, (2, 1, 2, 3, 4, 2) )
+    for n in range(len(T)):
+        recorder.record( n, n*np.ones(14) )
+    recordings = recorder.results()
+    assert np.allclose( recordings['T'], T[[75, 85, 95]] ) # the latest 3 samples
+    assert recordings['R'].shape == (3, 2) and recordings['E'].shape == (3, 2)
+    assert (recordings['R'][:,0] == [75, 85, 95]).all()
+    for bad in ({'stride': 0}, {'capacity': 0}):
+        try:
+            Recorder( **bad )
+            assert False, '{} should raise'.format(bad)
+        except ValueError:
+            pass
+    print('\tRecorder class test passed')
+
+    # test memory-mapped recording, in chunks that wrap around the ring
+    with tempfile.TemporaryDirectory() as run_dir:
+        recorder = Recorder( populations=('P', 'K'), capacity=7, directory=run_dir,
+            chunk_steps=4 )
+        recorder.allocate( T, (2, 1, 2, 3, 4, 2) )
+        for n in range(len(T)):
+            recorder.record( n, n*np.ones(14) )
+        recordings = recorder.results()
+        assert (recordings['K'][:,0] == np.arange(93, 100)).all()
+        assert sorted(os.listdir(run_dir)) == ['K.npy', 'P.npy', 'T.npy']
+        assert np.load(os.path.join(run_dir, 'K.npy')).shape == (7, 4)
+        del recorder, recordings # close the files
+    print('\tRecorder class (memmap) test passed')
+
+    # test StackedView against a stacked copy
+    parts = [ np.random.rand(5, 2), np.random.rand(5, 3) ]
+    Y = StackedView(parts)
+    assert Y.shape == (5, 5) and np.array_equal( np.asarray(Y), np.hstack(parts) )
+    assert np.array_equal( Y[1:3, 1:4], np.hstack(parts)[1:3, 1:4] )
+    assert np.array_equal( Y[4], np.hstack(parts)[4] )
+    print('\tStackedView class test passed')
+
+    # test recording a subset of KCs during a simulation
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.create_connection_matrix()
+    dummy_exp_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
+    recorder = Recorder( populations=('K', 'E'), neurons={'K': range(0, 200, 2)}, stride=10 )
+    sim_results = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        recorder=recorder )
+    recordings = recorder.results()
+    assert recordings['K'].shape == (len(sim_results['T'][::10]), 100)
+    assert np.array_equal( recordings['E'], sim_results['E'][::10] )
+    print('\tsde_wrap (recorder) method test passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .rng import make_rng, spawn, NoiseBlock
+
+def main():
+
+    print('Testing rng module:')
+
+    # test make_rng
+    assert make_rng(1).normal() == make_rng(1).normal()
+    assert make_rng(1, 'philox').normal() == make_rng(1, 'philox').normal()
+    rng = make_rng(1)
+    assert make_rng(rng) is rng
+    print('\tmake_rng method test passed')
+
+    # test spawn
+    children = spawn( make_rng(1), 2 )
+    assert children[0].normal() != children[1].normal()
+    assert spawn( make_rng(1), 2 )[1].normal() == spawn( make_rng(1), 2 )[1].normal()
+    print('\tspawn method test passed')
+
+    # test NoiseBlock: steps are consumed in order, across block refills
+    noise = NoiseBlock( make_rng(1), (3, (2, 4)), block_steps=4 )
+    draws = np.concatenate([ np.concatenate([ z.ravel() for z in noise.next() ])
+        for _ in range(10) ])
+    assert noise.next()[1].shape == (2, 4)
+    assert np.array_equal( draws[:44], make_rng(1).standard_normal(4*11)[:44] )
+    noise32 = NoiseBlock( make_rng(1), (3, (2, 4)), block_steps=4, dtype=np.float32 )
+    assert np.array_equal( noise32.next()[0], draws[:3].astype(np.float32) )
+    # a restored state continues the same stream
+    for steps in (0, 2, 4):
+        noise = NoiseBlock( make_rng(1), (3,), block_steps=4 )
+        for _ in range(steps):
+            noise.next()
+        copy = NoiseBlock( make_rng(2), (3,), block_steps=4 )
+        copy.restore( noise.state() )
+        for _ in range(6):
+            assert np.array_equal( copy.next()[0], noise.next()[0] )
+    print('\tNoiseBlock class test passed')
+
+if __name__ == '__main__':
+    main()
@@ -2,23 +2,72 @@
 
 # import packages and modules
 import numpy as np
-from .sde import sde_wrap
+from .sde import sde_wrap, sde_sweep, branch_time, collect_stats, step_schedule
 from .params import ModelParams, ExpParams
+from .rng import make_rng
 
 def main():
 
-    print('Testing params module:')
+    print('Testing sde module:')
 
     # create dummy data
-    dummy_model_params = ModelParams( 10, 10 )
+    dummy_model_params = ModelParams( 20, 10 )
     dummy_model_params.create_connection_matrix()
     dummy_exp_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
-    import pdb; pdb.set_trace()
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
 
     # test sde_wrap
-    sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array )
+    sim_results = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array )
     print('\tsde_wrap method test passed')
 
-    # test sde_evo_mnist
-    # sde_evo_mnist(tspan, init_cond, time, class_mag_mat, feature_array,
-    #     octo_hits, mP, exP, seed_val)
+    # test collect_stats
+    collect_stats( None, sim_results, dummy_exp_params, dummy_exp_params.class_labels,
+        False, False )
+    print('\tcollect_stats method test passed')
+
+    # test step_schedule: coarse steps never cross an active timepoint
+    active = np.zeros(20, dtype=bool)
+    active[8:10] = True
+    steps = step_schedule( active, 3 )
+    assert list(steps) == [0, 3, 6, 8, 9, 10, 13, 16, 19]
+    assert list(step_schedule( active, None )) == [0, 8, 9, 10, 19]
+    print('\tstep_schedule method test passed')
+
+    # test adaptive time stepping
+    coarse_results = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        coarse_step=0.1 )
+    assert len(coarse_results['T']) < len(sim_results['T'])
+    assert len(coarse_results['octo_hits']) == len(coarse_results['T'])
+    collect_stats( None, coarse_results, dummy_exp_params, dummy_exp_params.class_labels,
+        False, False )
+    print('\tsde_wrap (coarse_step) method test passed')
+
+    # test the deterministic fast path against time stepping, for a noise free moth
+    noise_free_params = ModelParams( 20, 10 )
+    noise_free_params.noise = 0
+    noise_free_params.create_connection_matrix()
+    stepped = sde_wrap( noise_free_params, dummy_exp_params, dummy_feature_array,
+        deterministic=False )
+    fast = sde_wrap( noise_free_params, dummy_exp_params, dummy_feature_array )
+    assert len(fast['T']) < len(stepped['T'])
+    assert np.allclose( fast['K2Efinal'], stepped['K2Efinal'], rtol=1e-5, atol=1e-8 )
+    print('\tsde_wrap (deterministic) method test passed')
+
+    # test sde_sweep: training variants branch after the shared baseline, with
+    # the same results as separate runs
+    variants = [ ExpParams( np.array(range(10)), np.array(range(10)), 1 ),
+        ExpParams( np.tile(range(9, -1, -1), 2), np.array(range(10)), 1 ) ]
+    t = branch_time( variants )
+    assert max(variants[0].baselineTimes) < t < min(variants[0].trainTimes)
+    feature_array = np.random.rand( 20, 4, 10 )
+    swept = sde_sweep( dummy_model_params, variants, feature_array, rng=make_rng(5) )
+    for exp_params, results in zip(variants, swept):
+        single = sde_wrap( dummy_model_params, exp_params, feature_array,
+            rng=make_rng(5) )
+        assert np.array_equal( results['E'], single['E'] )
+        assert np.array_equal( results['K2Efinal'], single['K2Efinal'] )
+        assert 'branch' not in results
+    print('\tsde_sweep method test passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .sparse import SparseSynapses
+from .params import ModelParams
+
+def main():
+
+    print('Testing sparse module:')
+
+    # create dummy data
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.create_connection_matrix()
+    P2K = dummy_model_params.P2K
+    P2Kmask = P2K > 0
+    dummy_P = np.random.rand( P2K.shape[1] )
+    dummy_K = np.random.rand( P2K.shape[0] )
+
+    # test SparseSynapses
+    synapses = SparseSynapses( P2K )
+    assert synapses.nnz == P2Kmask.sum()
+    assert np.allclose( synapses.toarray(), P2K )
+    print('\tSparseSynapses class test passed')
+
+    # test SparseSynapses.dot (forward product)
+    assert np.allclose( synapses.dot(dummy_P), P2K.dot(dummy_P) )
+    print('\tdot method test passed')
+
+    # test SparseSynapses.outer (masked hebbian increment)
+    increment = synapses.copy()
+    increment.data = synapses.outer( dummy_K, dummy_P, 0.5 )
+    assert np.allclose( increment.toarray(), 0.5*np.outer(dummy_K, dummy_P)*P2Kmask )
+    print('\touter method test passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .stream import stim_windows
+from .sde import sde_wrap, sde_stream
+from .params import ModelParams, ExpParams
+
+def main():
+
+    print('Testing stream module:')
+
+    # create dummy data
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.create_connection_matrix()
+    dummy_exp_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    dummy_feature_array = np.random.rand( 20, 3, 10 )
+
+    # test stim_windows
+    windows = stim_windows( dummy_exp_params )
+    assert len(windows) == len(dummy_exp_params.stimStarts)
+    assert [ w['phase'] for w in windows ].count('train') == dummy_exp_params.numTrain
+    print('\tstim_windows method test passed')
+
+    # test sde_wrap with a callback: windows match the full EN timecourses
+    streamed = []
+    sim_results = sde_wrap( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        rng=1, on_window=streamed.append )
+    assert len(streamed) == len(windows)
+    for w in streamed:
+        inds = (w['start'] < sim_results['T']) & (sim_results['T'] < w['stop'])
+        assert np.array_equal( w['E'], sim_results['E'][inds] )
+    print('\tsde_wrap (on_window) method test passed')
+
+    # test sde_stream, with bounded EN memory
+    stream = sde_stream( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        rng=1, keep_E=False )
+    for w, ref in zip(stream, streamed):
+        assert w['index'] == ref['index'] and np.array_equal( w['E'], ref['E'] )
+    print('\tsde_stream method test passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .timeline import StimTimeline, EventTrack, TimedTrack, time_vector
+from .sde import stim_courses
+from .params import ExpParams
+
+def main():
+
+    print('Testing timeline module:')
+
+    # create dummy data
+    dummy_exp_params =  ExpParams( np.array(range(10)), np.array(range(10)), 1 )
+    time, class_mag_mat, octo_hits = stim_courses( dummy_exp_params )
+    assert np.array_equal( time, time_vector(dummy_exp_params) )
+
+    # test EventTrack: the smoothed boxes match np.convolve(box, window, 'same')
+    window = np.hamming(6)
+    track = EventTrack( [10, 50, 0], [14, 54, -1], [1., 2., 5.], window )
+    assert len(track) == 2 # the empty event is dropped
+    box = np.zeros(80)
+    box[10:15], box[50:55] = 1, 2
+    expected = np.convolve( box, window, 'same' )
+    values = [ track.value(i) for i in range(80) ]
+    assert np.allclose( values, expected )
+    assert np.isclose( track.value(12), expected[12] ) # going back in time
+    print('\tEventTrack class test passed')
+
+    # test StimTimeline against the dense time courses
+    timeline = StimTimeline( dummy_exp_params, time )
+    dense_mags, dense_octo = timeline.dense()
+    assert np.allclose( dense_mags, class_mag_mat )
+    assert np.allclose( dense_octo, octo_hits )
+    class_mag, class_counter = np.zeros(timeline.nC), np.zeros(timeline.nC)
+    for i in range(0, len(time), 7):
+        assert timeline.stim( i, class_mag, class_counter ) == (class_mag_mat[:,i] > 0).any()
+        assert np.allclose( class_mag, class_mag_mat[:,i] )
+        assert np.isclose( timeline.octo(i), octo_hits[i] )
+    print('\tStimTimeline class test passed')
+
+    # test heb and active
+    heb = np.zeros(len(time), dtype=bool)
+    for start, duration in zip(dummy_exp_params.hebStarts, dummy_exp_params.hebDurations):
+        heb |= (time >= start) & (time <= start + duration)
+    assert all( timeline.heb(i) == heb[i] for i in range(len(time)) )
+    active = (class_mag_mat > 0).any(axis=0) | (octo_hits > 0) | heb
+    assert np.array_equal( timeline.active(), active )
+    assert np.array_equal( timeline.active(extend=5),
+        np.convolve( active, np.ones(6), 'full' )[:len(time)] > 0 )
+    print('\theb and active methods test passed')
+
+    # test TimedTrack: the smoothed boxes do not depend on the time step, and
+    # without a window the values are the fractions of the steps inside
+    fine, coarse = np.arange(0, 2, 0.01), np.arange(0, 2, 0.04)
+    tracks = [ TimedTrack( t, [0.5, 1.03], [0.72, 1.25], [1., 2.], 0.12 ) for t in (fine, coarse) ]
+    values = [ [ track.value(i) for i in range(len(track.time)) ] for track in tracks ]
+    assert np.allclose( values[0][::4], values[1] )
+    assert np.allclose( tracks[1].envelopes( np.zeros(len(coarse), dtype=int),
+        np.arange(len(coarse)) ), np.where( coarse < 1, values[1], 0 ) )
+    track = TimedTrack( coarse, [0.5], [0.61], [1.] )
+    weights = [ track.value(i) for i in range(len(coarse)) ]
+    assert np.isclose( sum(weights)*0.04, 0.11 ) and np.isclose( max(weights), 1 )
+    print('\tTimedTrack class test passed')
+
+    # test an exact StimTimeline: stimuli and Hebbian learning for their full
+    # durations
+    exact = StimTimeline( dummy_exp_params, time, exact=True )
+    dt = time[1] - time[0]
+    assert np.isclose( sum( exact.heb(i) for i in range(len(time)) )*dt,
+        np.sum(dummy_exp_params.hebDurations) )
+    dose = np.asarray(dummy_exp_params.classMags)*np.asarray(dummy_exp_params.durations)
+    assert np.allclose( exact.dense()[0].sum(axis=1)*dt, [ dose[dummy_exp_params.whichClass == cl].sum()
+        for cl in dummy_exp_params.class_labels ] )
+    print('\tStimTimeline (exact) class test passed')
+
+if __name__ == '__main__':
+    main()
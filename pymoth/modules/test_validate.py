@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+# import packages and modules
+import numpy as np
+from .validate import precision_drift, step_size_convergence, response_drift
+from .sde import sde_wrap, collect_stats
+from .params import ModelParams, ExpParams
+
+def main():
+
+    print('Testing validate module:')
+
+    # create dummy data
+    dummy_model_params = ModelParams( 20, 10 )
+    dummy_model_params.create_connection_matrix()
+    dummy_exp_params =  ExpParams( np.array(range(10)), np.array(range(10)), 3 )
+    dummy_feature_array = np.random.rand( 20, 8, 10 )
+
+    # test precision_drift
+    report = precision_drift( dummy_model_params, dummy_exp_params, dummy_feature_array )
+    assert report['E_max_rel'] < 1e-2
+    assert dummy_model_params.dtype == np.float64 # the template moth is unchanged
+    print('\tprecision_drift method test passed')
+
+    # test step_size_convergence
+    report = step_size_convergence( dummy_model_params, dummy_exp_params, dummy_feature_array,
+        time_steps=(0.04, 0.02) )
+    assert report['time_steps'] == [0.02, 0.04]
+    assert report['post_mean_resp_max_rel'][0] == 0 # the reference
+    assert report['largest_step'] in report['time_steps']
+
+    # for a noise free moth, Heun at twice the time step is within tolerance
+    # of a fine reference, and closer to it than Euler
+    noise_free_params = ModelParams( 20, 10, rng=1 )
+    noise_free_params.noise = 0
+    noise_free_params.create_connection_matrix()
+    tol, dt = 0.02, 0.01
+    report = step_size_convergence( noise_free_params, dummy_exp_params, dummy_feature_array,
+        time_steps=(0.0025, 2*dt), tol=tol )
+    assert report['largest_step'] == 2*dt
+    euler = collect_stats( None, sde_wrap( noise_free_params, dummy_exp_params,
+        dummy_feature_array, time_step=dt ), dummy_exp_params,
+        dummy_exp_params.class_labels, False, False )
+    for key in ('pre_mean_resp', 'post_mean_resp'):
+        heun_drift = report[key + '_max_rel'][1]
+        assert heun_drift < tol
+        assert heun_drift < response_drift( report['EN_resp'][0], euler, key )
+    print('\tstep_size_convergence method test passed')
+
+if __name__ == '__main__':
+    main()
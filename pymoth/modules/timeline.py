@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: timeline
+   :platform: Unix
+   :synopsis: Event-based stimulus, octopamine and Hebbian time courses.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import numpy as _np
+
+def time_vector( exp_params, time_step=2*0.01 ):
+    """
+    The [start:step:stop] vector of simulation timepoints of an experiment.
+
+    Args:
+        exp_params (class): object with timing info about experiment.
+        time_step (float): [optional] simulation time step (seconds).
+
+    Returns
+    -------
+        time (numpy array)
+            [start:step:stop] vector of timepoints
+
+    >>> time = time_vector(exp_params)
+
+    """
+    sim_start = exp_params.sim_start
+    sim_stop =  exp_params.sim_stop
+    total_steps = (sim_stop - sim_start)/time_step
+    return _np.linspace(sim_start, sim_stop-time_step, int(round(total_steps)))
+
+class EventTrack:
+    """
+
+    Sorted events on a time grid, each a box [first, last] of step indices \
+    with a magnitude, optionally smoothed by a low-pass window (as \
+    np.convolve(box, window, 'same')). The value at a step index only depends \
+    on the few events whose (smoothed) support contains it, which are tracked \
+    with a cursor: increasing queries cost O(1) amortized, and going back in \
+    time re-seeks the cursor.
+
+    """
+    def __init__(self, first, last, mags, window=None):
+        """
+
+        Args:
+            first, last (numpy array): step indices of the first and last \
+            timepoint of each event (inclusive). Empty events (last < first) \
+            are dropped.
+            mags (numpy array): magnitude of each event.
+            window (numpy array): [optional] low-pass window. None keeps the \
+            boxes sharp.
+
+        >>> track = EventTrack( [10, 50], [14, 54], [1., 1.], _np.hamming(6) )
+
+        """
+        first, last = _np.asarray(first, dtype=int), _np.asarray(last, dtype=int)
+        keep = last >= first
+        order = _np.argsort(first[keep], kind='stable')
+        # events are numbered by onset, among the nonempty ones
+        self.index = _np.flatnonzero(keep)[order]
+        self.first, self.last = first[keep][order], last[keep][order]
+        self.mags = _np.asarray(mags, dtype=float)[keep][order]
+
+        if window is None:
+            self.lo, self.hi = self.first, self.last
+            self.cum = None
+        else:
+            # 'same' convolution: the value at i sums box[i + h - k]*window[k]
+            L = len(window)
+            self.h = (L - 1)//2
+            self.L = L
+            self.cum = _np.concatenate(([0], _np.cumsum(window)))
+            self.lo, self.hi = self.first - self.h, self.last + (L - 1 - self.h)
+        self.seek(0)
+
+    def __len__(self):
+        return len(self.first)
+
+    def seek(self, i):
+        """
+        Point the cursor at step index i.
+        """
+        self._next = int(_np.searchsorted(self.lo, i, 'right'))
+        self._active = [ e for e in range(self._next) if self.hi[e] >= i ]
+        self._i = i
+
+    def active(self, i):
+        """
+
+        Events whose support contains step index i.
+
+        Args:
+            i (int): step index
+
+        Returns
+        -------
+            events (list)
+                indices of the active events (in onset order)
+
+        """
+        if i < self._i:
+            self.seek(i)
+        self._i = i
+        while self._next < len(self.lo) and self.lo[self._next] <= i:
+            self._active.append(self._next)
+            self._next += 1
+        if self._active and min(self.hi[e] for e in self._active) < i:
+            self._active = [ e for e in self._active if self.hi[e] >= i ]
+        return self._active
+
+    def envelope(self, e, i):
+        """
+        Value of event e at step index i (within its support).
+        """
+        if self.cum is None:
+            return self.mags[e]
+        a = max(i + self.h - self.last[e], 0)
+        b = min(i + self.h - self.first[e], self.L - 1)
+        return self.mags[e]*(self.cum[b+1] - self.cum[a])
+
+    def envelopes(self, e, i):
+        """
+
+        Vectorized :meth:`envelope`: values of events e at step indices i, \
+        zero outside their supports.
+
+        Args:
+            e (numpy array): event indices
+            i (numpy array): step indices (same shape as e)
+
+        Returns
+        -------
+            values (numpy array)
+
+        """
+        e, i = _np.asarray(e), _np.asarray(i)
+        inside = (self.lo[e] <= i) & (i <= self.hi[e])
+        if self.cum is None:
+            return _np.where(inside, self.mags[e], 0)
+        a = _np.clip(i + self.h - self.last[e], 0, self.L)
+        b = _np.clip(i + self.h - self.first[e], -1, self.L - 1)
+        return _np.where(inside, self.mags[e]*(self.cum[b+1] - self.cum[a]), 0)
+
+    def value(self, i):
+        """
+        Sum of all events at step index i.
+        """
+        return sum(self.envelope(e, i) for e in self.active(i))
+
+    def mark(self, active, extend=0):
+        """
+
+        Mark the supports of all events (extended by 'extend' steps) in a \
+        boolean vector over the time grid.
+
+        Args:
+            active (numpy array): [bool x length(time)] updated in place
+            extend (int): [optional] number of steps to extend each support by
+
+        """
+        N = len(active)
+        count = _np.zeros(N+1, dtype=int)
+        _np.add.at(count, _np.clip(self.lo, 0, N), 1)
+        _np.add.at(count, _np.clip(self.hi + extend + 1, 0, N), -1)
+        active |= _np.cumsum(count[:-1]) > 0
+
+class TimedTrack(EventTrack):
+    """
+
+    Events as boxes [start, stop) in continuous time, sampled exactly at the \
+    timepoints of a time grid. Unlike :class:`EventTrack`, whose boxes and \
+    low-pass window are rounded to the grid, the time courses do not depend \
+    on the time step, so a simulation converges at the order of its \
+    integrator. The boxes are optionally smoothed by a (continuous) Hamming \
+    window; or else the value at a step is the mean of the box over the \
+    step, eg the fraction of the step inside a Hebbian learning window.
+
+    """
+    def __init__(self, time, starts, stops, mags, width=0):
+        """
+
+        Args:
+            time (numpy array): [start:step:stop] vector of timepoints.
+            starts, stops (numpy array): start and stop (seconds) of each event. \
+            Empty events (stop <= start) are dropped.
+            mags (numpy array): magnitude of each event.
+            width (float): [optional] width (seconds) of the Hamming window. \
+            0 (default) gives the mean of the boxes over each step \
+            [t, t + time step).
+
+        >>> track = TimedTrack( time, [10., 50.], [10.22, 50.22], [1., 1.], 0.12 )
+
+        """
+        self.time = _np.asarray(time, dtype=float)
+        self.dt = self.time[1] - self.time[0]
+        self.width = width
+        starts = _np.asarray(starts, dtype=float).reshape(-1)
+        stops = _np.asarray(stops, dtype=float).reshape(-1)
+        keep = stops > starts
+        order = _np.argsort(starts[keep], kind='stable')
+        self.index = _np.flatnonzero(keep)[order]
+        self.starts, self.stops = starts[keep][order], stops[keep][order]
+        self.mags = _np.asarray(mags, dtype=float)[keep][order]
+
+        # step indices of the supports: the steps [t, t + time step) that
+        # overlap the (smoothed) boxes
+        self.lo = _np.searchsorted(self.time, self.starts - width/2 - self.dt, 'right')
+        self.hi = _np.searchsorted(self.time, self.stops + width/2, 'left') - 1
+        self.cum = None
+        self.seek(0)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _cdf(self, x):
+        # fraction of the (unit area) window at or below x
+        w = self.width
+        x = _np.clip(x, -w/2, w/2)
+        return (x + w/2)/w + 0.46/(0.54*2*_np.pi)*_np.sin(2*_np.pi*x/w)
+
+    def envelope(self, e, i):
+        """
+        Value of event e at step index i (within its support).
+        """
+        t, start, stop = self.time[i], self.starts[e], self.stops[e]
+        if self.width:
+            return self.mags[e]*float(self._cdf(t - start) - self._cdf(t - stop))
+        return self.mags[e]*max(min(t + self.dt, stop) - max(t, start), 0)/self.dt
+
+    def envelopes(self, e, i):
+        """
+
+        Vectorized :meth:`envelope`: values of events e at step indices i, \
+        zero outside their supports.
+
+        Args:
+            e (numpy array): event indices
+            i (numpy array): step indices (same shape as e)
+
+        Returns
+        -------
+            values (numpy array)
+
+        """
+        e, i = _np.asarray(e), _np.asarray(i)
+        t = self.time[_np.clip(i, 0, len(self.time)-1)]
+        start, stop = self.starts[e], self.stops[e]
+        if self.width:
+            values = self._cdf(t - start) - self._cdf(t - stop)
+        else:
+            overlap = _np.minimum(t + self.dt, stop) - _np.maximum(t, start)
+            values = _np.maximum(overlap, 0)/self.dt
+        inside = (self.lo[e] <= i) & (i <= self.hi[e])
+        return _np.where(inside, self.mags[e]*values, 0)
+
+class StimTimeline:
+    """
+
+    Compact timeline of an experiment: the sorted onsets and offsets of the \
+    stimuli, octopamine and Hebbian learning, with the low-pass window applied \
+    on the fly. It replaces the dense class_mag_mat, octo_hits and hebRegion \
+    arrays: memory scales with the number of events, not with classes times \
+    timepoints, and the simulator queries it by step index.
+
+    The values match :func:`stim_courses` (up to rounding): stimuli are on for \
+    start < t < start + duration, octopamine for start <= t < start + duration \
+    (both smoothed by a Hamming window of width exp_params.lpParam), and \
+    Hebbian learning for start <= t <= start + duration. An exact timeline \
+    instead samples the time courses at the timepoints (see \
+    :class:`TimedTrack`), as higher order integrators need.
+
+    """
+    def __init__(self, exp_params, time, exact=False):
+        """
+
+        Args:
+            exp_params (class): object with timing info about experiment, eg when stimuli are given.
+            time (numpy array): [start:step:stop] vector of timepoints (see \
+            :func:`time_vector`).
+            exact (bool): [optional] sample the stimulus and octopamine time \
+            courses exactly, and weight the Hebbian learning by the fraction \
+            of each step inside its windows (see :meth:`heb`), instead of \
+            rounding them to the grid as :func:`stim_courses` does.
+
+        >>> timeline = StimTimeline( exp_params, time_vector(exp_params) )
+
+        """
+        self.N = len(time)
+        time_step = round(time[1] - time[0], 10)
+        # lowpass to round off the sharp start-stop edges of stimuli and octopamine
+        # (lpParam: default transition zone = 0.12 sec)
+        L = round(exp_params.lpParam/time_step)
+        window = _np.hamming(L) # window of width L
+        window /= window.sum()
+
+        self.class_labels = _np.asarray(exp_params.class_labels)
+        self.nC = len(self.class_labels)
+
+        # stimuli, from all classes; zero magnitude puffs are not presented
+        starts = _np.asarray(exp_params.stimStarts, dtype=float)
+        stops = starts + _np.asarray(exp_params.durations, dtype=float)
+        mags = _np.asarray(exp_params.classMags, dtype=float)
+        which = _np.asarray(exp_params.whichClass)
+        classes = _np.array([ _np.flatnonzero(self.class_labels == cl)[0]
+            if (self.class_labels == cl).any() else -1 for cl in which ])
+        presented = (mags > 0) & (classes >= 0)
+        self.exact = exact
+        if exact:
+            self.stims = TimedTrack(time, _np.where(presented, starts, 0),
+                _np.where(presented, stops, 0), mags, exp_params.lpParam)
+        else:
+            first = _np.searchsorted(time, starts, 'right') # start < t
+            last = _np.searchsorted(time, stops, 'left') - 1 # t < stop
+            first, last = _np.where(presented, first, 0), _np.where(presented, last, -1)
+            self.stims = EventTrack(first, last, mags, window)
+        self.stim_class = classes[self.stims.index]
+        # image of each presentation: the presentations of each class so far
+        self.stim_image = _np.zeros(len(self.stims), dtype=int)
+        seen = _np.zeros(self.nC, dtype=int)
+        for e, c in enumerate(self.stim_class):
+            seen[c] += 1
+            self.stim_image[e] = seen[c]
+
+        # octopamine, start <= t < stop
+        octo_starts = _np.asarray(exp_params.octoStart, dtype=float).reshape(-1)
+        octo_stops = octo_starts + exp_params.durationOcto
+        octo_mags = _np.full(len(octo_starts), exp_params.octoMag)
+        if exact:
+            self.octos = TimedTrack(time, octo_starts, octo_stops, octo_mags,
+                exp_params.lpParam)
+        else:
+            self.octos = EventTrack(_np.searchsorted(time, octo_starts, 'left'),
+                _np.searchsorted(time, octo_stops, 'left') - 1, octo_mags, window)
+
+        # hebbian learning, start <= t <= stop
+        heb_starts = _np.asarray(exp_params.hebStarts, dtype=float).reshape(-1)
+        heb_stops = heb_starts + _np.asarray(exp_params.hebDurations, dtype=float).reshape(-1)
+        if exact:
+            self.hebs = TimedTrack(time, heb_starts, heb_stops, _np.ones(len(heb_starts)))
+        else:
+            self.hebs = EventTrack(_np.searchsorted(time, heb_starts, 'left'),
+                _np.searchsorted(time, heb_stops, 'right') - 1, _np.ones(len(heb_starts)))
+
+    def stim(self, i, class_mag, class_counter):
+        """
+
+        Stimulus magnitudes of all classes at step index i.
+
+        Args:
+            i (int): step index
+            class_mag (numpy array): [nC x 1] filled with the magnitude of each class
+            class_counter (numpy array): [nC x 1] the entries of the presented \
+            classes are set to their number of presentations so far (the image \
+            index + 1, as expected by :meth:`StepKernel.set_input`)
+
+        Returns
+        -------
+            stim_on (bool)
+                whether any class is presented
+
+        """
+        class_mag.fill(0)
+        active = self.stims.active(i)
+        for e in active:
+            c = self.stim_class[e]
+            class_mag[c] += self.stims.envelope(e, i)
+            class_counter[c] = self.stim_image[e]
+        return len(active) > 0
+
+    def octo(self, i):
+        """
+        Octopamine level at step index i.
+        """
+        return self.octos.value(i)
+
+    def heb(self, i):
+        """
+        Whether Hebbian learning is on at step index i. For an exact timeline, \
+        the fraction of the step [t, t + time step) inside a learning window \
+        (0 if none), to scale the Hebbian increments by.
+        """
+        if self.exact:
+            return self.hebs.value(i)
+        return len(self.hebs.active(i)) > 0
+
+    def active(self, extend=0):
+        """
+
+        Timepoints with a stimulus, octopamine or Hebbian learning.
+
+        Args:
+            extend (int): [optional] also mark this many steps after each event, \
+            eg while the FRs settle.
+
+        Returns
+        -------
+            active (numpy array)
+                [bool x length(time)]
+
+        """
+        active = _np.zeros(self.N, dtype=bool)
+        for track in (self.stims, self.octos, self.hebs):
+            track.mark(active, extend)
+        return active
+
+    def octo_course(self, steps):
+        """
+
+        Octopamine levels at the given step indices (eg the timepoints stepped \
+        through), as the octo_hits of the simulation results.
+
+        Args:
+            steps (numpy array): increasing step indices
+
+        Returns
+        -------
+            octo_hits (numpy array)
+                octopamine strength at each of the steps
+
+        """
+        octo_hits = _np.zeros(len(steps))
+        for e in range(len(self.octos)):
+            a, b = _np.searchsorted(steps, (self.octos.lo[e], self.octos.hi[e]+1))
+            octo_hits[a:b] += [ self.octos.envelope(e, i) for i in steps[a:b] ]
+        return octo_hits
+
+    def dense(self):
+        """
+
+        Dense courses over the whole time grid, as returned by :func:`stim_courses` \
+        (eg for the compiled backend).
+
+        Returns
+        -------
+            class_mag_mat (numpy array)
+                [# of different classes X vector of time points]
+            octo_hits (numpy array)
+                [1 x length(time)] octopamine strengths at each timepoint
+
+        """
+        class_mag_mat = _np.zeros((self.nC, self.N))
+        for e in range(len(self.stims)):
+            lo, hi = max(self.stims.lo[e], 0), min(self.stims.hi[e], self.N-1)
+            class_mag_mat[self.stim_class[e], lo:hi+1] += [ self.stims.envelope(e, i)
+                for i in range(lo, hi+1) ]
+        return class_mag_mat, self.octo_course(_np.arange(self.N))
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
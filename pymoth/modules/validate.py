@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+"""
+
+.. module:: validate
+   :platform: Unix
+   :synopsis: Check reduced-precision and large-step simulations against a reference.
+
+.. moduleauthor:: Adam P. Jones <ajones173@gmail.com>
+
+"""
+import copy as _copy
+import numpy as _np
+from ..modules.sde import sde_wrap, collect_stats
+
+def precision_drift( model_params, exp_params, feature_array, dtype=_np.float32, seed_val=1 ):
+    """
+
+    Run the same moth, stimuli and noise draws once in float64 and once in \
+    dtype, and report how far the EN responses and final accuracies drift \
+    from the float64 reference.
+
+    Args:
+        model_params (class): object with connection matrices, etc.
+        exp_params (class): object with timing info about experiment, eg when stimuli are given.
+        feature_array (numpy array): stimuli (numFeatures x numStimsPerClass x numClasses).
+        dtype (numpy dtype): [optional] reduced precision to check (default numpy.float32).
+        seed_val (int): [optional] seed for the noise, shared by both runs.
+
+    Returns
+    -------
+        report (dict)
+            drift statistics, see :func:`en_drift` and :func:`accuracy_drift`
+
+    >>> report = precision_drift( model_params, exp_params, feature_array )
+
+    """
+    sim_results = []
+    for d in (_np.float64, dtype):
+        mP = _copy.deepcopy(model_params)
+        mP.set_dtype(d)
+        # same noise draws in both runs:
+        sim_results.append( sde_wrap(mP, exp_params, feature_array.astype(d), rng=seed_val) )
+
+    EN_resp = [ collect_stats(None, s, exp_params, exp_params.class_labels, False, False)
+        for s in sim_results ]
+
+    report = en_drift( sim_results[0], sim_results[1], EN_resp[0], EN_resp[1] )
+    report.update( accuracy_drift(EN_resp[0], EN_resp[1]) )
+
+    print('Precision drift ({} vs float64):'.format(_np.dtype(dtype).name))
+    print(' EN timecourses: max abs diff {:.3g} (relative {:.3g})'.format(
+        report['E_max_abs'], report['E_max_rel']))
+    print(' EN post-training mean responses: max relative diff {:.3g}'.format(
+        report['post_mean_resp_max_rel']))
+    for key in ('log_loss', 'thresholding'):
+        ref_acc, test_acc = report['acc_'+key]
+        print(' {} accuracy: {}% (reference {}%)'.format(key, round(test_acc), round(ref_acc)))
+
+    return report
+
+def step_size_convergence( model_params, exp_params, feature_array,
+    time_steps=(0.02, 0.04, 0.05, 0.1), integrator='heun', seed_val=1, tol=0.05 ):
+    """
+
+    Run the same moth and experiment at several time steps, and compare the \
+    EN response statistics (pre- and post-training mean responses per class, \
+    see :func:`collect_stats`) with those of the finest step. Use this to pick \
+    the largest time step (and integrator) that still reproduces the reference.
+
+    Note that the number of noise draws depends on the step, so runs at \
+    different steps see different noise realizations: the statistics only \
+    converge up to the noise in the mean responses.
+
+    Args:
+        model_params (class): object with connection matrices, etc.
+        exp_params (class): object with timing info about experiment, eg when stimuli are given.
+        feature_array (numpy array): stimuli (numFeatures x numStimsPerClass x numClasses).
+        time_steps (tuple): [optional] time steps (seconds) to compare. The \
+        smallest is the reference.
+        integrator (str): [optional] 'euler', 'heun' (default) or 'exponential'.
+        seed_val (int): [optional] seed for the noise, shared by all runs.
+        tol (float): [optional] largest acceptable relative drift.
+
+    Returns
+    -------
+        report (dict)
+            time_steps (list)
+                the time steps, in increasing order
+            pre_mean_resp_max_rel (list)
+                drift of the pre-training mean responses at each time step, see \
+                :func:`response_drift`
+            post_mean_resp_max_rel (list)
+                drift of the post-training mean responses at each time step
+            largest_step (float)
+                the largest time step whose drifts (and those of all smaller \
+                steps) are below tol
+            EN_resp (list)
+                :func:`collect_stats` output at each time step (eg to compare \
+                another integrator with the reference)
+
+    >>> report = step_size_convergence( model_params, exp_params, feature_array )
+
+    """
+    time_steps = sorted(time_steps)
+    EN_resp = []
+    for dt in time_steps:
+        sim_results = sde_wrap(model_params, exp_params, feature_array, rng=seed_val,
+            time_step=dt, integrator=integrator)
+        EN_resp.append( collect_stats(None, sim_results, exp_params,
+            exp_params.class_labels, False, False) )
+
+    report = { 'time_steps' : time_steps, 'largest_step' : time_steps[0], 'EN_resp' : EN_resp }
+    for key in ('pre_mean_resp', 'post_mean_resp'):
+        report[key+'_max_rel'] = [ response_drift(EN_resp[0], r, key) for r in EN_resp ]
+    for dt, pre, post in zip(time_steps, report['pre_mean_resp_max_rel'],
+        report['post_mean_resp_max_rel']):
+        if max(pre, post) > tol:
+            break
+        report['largest_step'] = dt
+
+    print('Step size convergence ({} integrator, reference dt = {}):'.format(
+        integrator, time_steps[0]))
+    for dt, pre, post in zip(time_steps, report['pre_mean_resp_max_rel'],
+        report['post_mean_resp_max_rel']):
+        print(' dt = {}: EN mean responses max relative diff {:.3g} (pre), {:.3g} (post)'.format(
+            dt, pre, post))
+    print(' largest time step within tolerance {}: {}'.format(tol, report['largest_step']))
+
+    return report
+
+def response_drift( EN_resp_reference, EN_resp_test, key='post_mean_resp' ):
+    """
+
+    Largest difference of an EN response statistic (eg the post-training mean \
+    responses per class) between two runs, relative to the largest reference \
+    value of the same EN.
+
+    Args:
+        EN_resp_reference (list): :func:`collect_stats` output of the reference run.
+        EN_resp_test (list): :func:`collect_stats` output of the run to check.
+        key (str): [optional] statistic to compare, eg 'pre_mean_resp' or \
+        'post_mean_resp' (default).
+
+    Returns
+    -------
+        drift (float)
+            max over ENs of max|test - reference| / max|reference|
+
+    >>> drift = response_drift( EN_resp_reference, EN_resp_test, 'pre_mean_resp' )
+
+    """
+    rel = []
+    for ref, tst in zip(EN_resp_reference, EN_resp_test):
+        scale = max(_np.abs(ref[key]).max(), _np.finfo(_np.float32).tiny)
+        rel.append( _np.abs(tst[key] - ref[key]).max()/scale )
+    return max(rel)
+
+def en_drift( reference, test, EN_resp_reference, EN_resp_test ):
+    """
+
+    Compare the EN responses of two simulations of the same experiment.
+
+    Args:
+        reference (dict): :func:`sde_wrap` output of the reference run.
+        test (dict): :func:`sde_wrap` output of the run to check.
+        EN_resp_reference (list): :func:`collect_stats` output of the reference run.
+        EN_resp_test (list): :func:`collect_stats` output of the run to check.
+
+    Returns
+    -------
+        drift (dict)
+            E_max_abs (float)
+                largest absolute difference of the EN timecourses
+            E_max_rel (float)
+                E_max_abs, relative to the largest reference EN response
+            post_mean_resp_max_rel (float)
+                largest relative difference of the post-training mean \
+                responses (per EN and class)
+
+    >>> drift = en_drift( reference, test, EN_resp_reference, EN_resp_test )
+
+    """
+    E_ref = _np.asarray(reference['E'], dtype=_np.float64)
+    E_max_abs = _np.abs(_np.asarray(test['E'], dtype=_np.float64) - E_ref).max()
+
+    rel = []
+    for ref, tst in zip(EN_resp_reference, EN_resp_test):
+        scale = _np.maximum(_np.abs(ref['post_mean_resp']), _np.finfo(_np.float32).tiny)
+        rel.append( (_np.abs(tst['post_mean_resp'] - ref['post_mean_resp'])/scale).max() )
+
+    return {
+            'E_max_abs' : E_max_abs,
+            'E_max_rel' : E_max_abs/_np.abs(E_ref).max(),
+            'post_mean_resp_max_rel' : max(rel),
+        }
+
+def accuracy_drift( EN_resp_reference, EN_resp_test ):
+    """
+
+    Compare the post-training accuracies of two simulations of the same \
+    experiment, using the same classifiers as :func:`MothNet.score_moth_on_MNIST`.
+
+    Args:
+        EN_resp_reference (list): :func:`collect_stats` output of the reference run.
+        EN_resp_test (list): :func:`collect_stats` output of the run to check.
+
+    Returns
+    -------
+        drift (dict)
+            acc_log_loss (tuple)
+                (reference, test) accuracy (%) using log-likelihoods over all ENs
+            acc_thresholding (tuple)
+                (reference, test) accuracy (%) using single EN thresholding
+
+    >>> drift = accuracy_drift( EN_resp_reference, EN_resp_test )
+
+    """
+    from ..modules.classify import classify_digits_log_likelihood, classify_digits_thresholding
+
+    log_loss = [ classify_digits_log_likelihood(r)['total_acc']
+        for r in (EN_resp_reference, EN_resp_test) ]
+    thresholding = [ classify_digits_thresholding(r, 1e9, -1, 10)['total_acc']
+        for r in (EN_resp_reference, EN_resp_test) ]
+
+    return {
+            'acc_log_loss' : tuple(log_loss),
+            'acc_thresholding' : tuple(thresholding),
+        }
+
+# MIT license:
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
@@ -17,11 +17,26 @@ setuptools.setup(
     url="https://github.com/meccaLeccaHi/pymoth",
     packages=['pymoth'],
     py_modules=[
+        'pymoth.modules.calibrate',
         'pymoth.modules.classify',
+        'pymoth.modules.compiler',
+        'pymoth.modules.ensemble',
+        'pymoth.modules.enstats',
         'pymoth.modules.generate',
+        'pymoth.modules.jit',
+        'pymoth.modules.kernel',
+        'pymoth.modules.lanes',
+        'pymoth.modules.checkpoint',
         'pymoth.modules.params',
+        'pymoth.modules.progress',
+        'pymoth.modules.record',
+        'pymoth.modules.rng',
         'pymoth.modules.sde',
         'pymoth.modules.show_figs',
+        'pymoth.modules.sparse',
+        'pymoth.modules.stream',
+        'pymoth.modules.timeline',
+        'pymoth.modules.validate',
         'pymoth.MNIST_all.MNIST_make_all',
         # 'sample_experiment',
     ],
@@ -33,6 +48,9 @@ setuptools.setup(
           'keras',
           'tensorflow',
     ],
+    extras_require={
+          'jit': ['numba'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3.6",
         "License :: OSI Approved :: MIT License",